@@ -0,0 +1,106 @@
+"""Up intervals and LST hours refined by bisection near the elevation limits
+
+    The elevation is only known on the time grid of the context (the coarse
+    grid). Between two slots where the up state of a position changes, the
+    crossing of the limit is refined by bisection, every iteration
+    transforming all the open crossings at once, down to the tolerance. The
+    astrometry parameters of these times are interpolated between sparse
+    support points. The cost is the coarse grid plus a few transforms of the
+    crossings, instead of a uniform grid at the tolerance.
+
+    A position going up and down again between two coarse slots (e.g. just
+    peaking above the upper limit) is not seen; the coarse step has to be
+    shorter than the shortest up or down time of interest."""
+import numpy as np
+
+from .make_availability import defaultLimits, interpolatedAstrom
+from .profiling import lazy_module, timer
+
+coordinates = lazy_module('astropy.coordinates')
+atime = lazy_module('astropy.time')
+
+siderealRate = 1.002737909350795  # sidereal hours per solar hour
+
+# up intervals of the positions: position index, day index, start and end [jd]
+intervalDtype = np.dtype([('pos', int), ('day', int), ('start', float), ('end', float)])
+
+
+def elevationAt(context, coord, jd):
+    # elevation [deg] of coord[i] at jd[i]
+    t = atime.Time(jd, format='jd', scale='utc')
+    return coord.transform_to(coordinates.AltAz(location=context.location, obstime=t)).alt.deg
+
+
+def isUp(el, minEl, maxEl):
+    return np.logical_and(el >= minEl, el <= maxEl)
+
+
+def upIntervals(table, context, minEl=defaultLimits[0], maxEl=defaultLimits[1], tolerance=60.):
+    # up intervals of every position of table (az/el computed on the grid of context, or on its full-day
+    # grid) in the night windows [first slot, last slot + step), the limit crossings refined to tolerance [s]
+    jd = context.astroTime.jd
+    nx, ny = jd.shape
+    step = jd[1, 0] - jd[0, 0] if nx > 1 else 0.
+    # the end of the night window is one more coarse sample
+    npos = table.npos
+    with timer('adaptive bisection'), interpolatedAstrom():
+        elEnd = elevationAt(context, table.coord[np.repeat(np.arange(npos), ny)],
+                            np.tile(jd[-1, :] + step, npos)).reshape(npos, 1, ny)
+    up = isUp(np.concatenate([table.windowed(table.el, context.window), elEnd], axis=1), minEl, maxEl)
+    jd = np.concatenate([jd, jd[-1:, :] + step])
+
+    # crossings between the slots k and k + 1 of a day
+    p, k, d = np.nonzero(up[:, 1:, :] != up[:, :-1, :])
+    rising = ~up[p, k, d]
+    lo = jd[k, d]
+    hi = jd[k + 1, d]
+    niter = int(np.ceil(np.log2(step * 86400. / tolerance))) if step * 86400. > tolerance else 0
+    coord = table.coord[p]
+    with timer('adaptive bisection'), interpolatedAstrom():
+        for i in range(niter):
+            if not len(p):
+                break
+            mid = 0.5 * (lo + hi)
+            # same state as the lower end: the crossing is after mid
+            after = isUp(elevationAt(context, coord, mid), minEl, maxEl) != rising
+            lo = np.where(after, mid, lo)
+            hi = np.where(after, hi, mid)
+    crossing = 0.5 * (lo + hi)
+
+    # the starts and ends of the intervals alternate on every (position, day)
+    p0, d0 = np.nonzero(up[:, 0, :])
+    p1, d1 = np.nonzero(up[:, -1, :])
+    startPos = np.concatenate([p0, p[rising]])
+    startDay = np.concatenate([d0, d[rising]])
+    start = np.concatenate([jd[0, d0], crossing[rising]])
+    endPos = np.concatenate([p[~rising], p1])
+    endDay = np.concatenate([d[~rising], d1])
+    end = np.concatenate([crossing[~rising], jd[-1, d1]])
+    si = np.lexsort((start, startDay, startPos))
+    ei = np.lexsort((end, endDay, endPos))
+
+    intervals = np.zeros(len(si), dtype=intervalDtype)
+    intervals['pos'] = startPos[si]
+    intervals['day'] = startDay[si]
+    intervals['start'] = start[si]
+    intervals['end'] = end[ei]
+    return intervals
+
+
+def lstHours(intervals, context, npos):
+    # up hours of every position in each LST hour, (npos, 24), from its up intervals
+    jd = context.astroTime.jd
+    nx = jd.shape[0]
+    step = jd[1, 0] - jd[0, 0] if nx > 1 else 1.
+    d = intervals['day']
+    # LST at the start of every interval from the LST of its slot
+    k = np.clip(((intervals['start'] - jd[0, d]) / step).astype(int), 0, nx - 1)
+    a = (context.lst[k, d] + (intervals['start'] - jd[k, d]) * 24. * siderealRate) % 24.
+    b = a + (intervals['end'] - intervals['start']) * 24. * siderealRate
+    hours = np.zeros((npos, 24))
+    for h in range(24):
+        overlap = np.zeros(len(intervals))
+        for h0 in (h, h + 24, h + 48):
+            overlap += np.clip(np.minimum(b, h0 + 1) - np.maximum(a, h0), 0., None)
+        np.add.at(hours[:, h], intervals['pos'], overlap / siderealRate)
+    return hours
@@ -0,0 +1,234 @@
+"""Read-only availability routes of the flask server, as json or Arrow IPC
+
+    /api/sources    up hours, LST hours and daily up fractions of every source
+    /api/projects   the same for the uber up of every project
+    /api/intervals  up intervals of every source per date (on the slots of the time grid)
+
+    The query selects the files, ranks, dates, elevation limits, Sun/Moon avoidance
+    and night window like the app, e.g.
+    /api/sources?files=UM,US&ranks=A,B&start=2025-03-01&end=2025-03-07&min_el=30&sun=45&ut_start=2&hours=10
+    format=arrow (or Accept: application/vnd.apache.arrow.stream) returns an Arrow IPC stream.
+
+    The ETag of a response is the data version (see config.data_version) and the query,
+    a client sending it back in If-None-Match gets a 304 until the data changes. Does
+    not import dash."""
+import hashlib
+import io
+
+import numpy as np
+from flask import Response, jsonify, request
+
+from .config import all_files, all_ranks, elevation_limits, night_window
+from .make_availability import avoidanceRadii, selectProjects, windowContext
+from .profiling import count, lazy_module
+
+pa = lazy_module('pyarrow')
+atime = lazy_module('astropy.time')
+
+arrowMimetype = 'application/vnd.apache.arrow.stream'
+
+
+def split_arg(name, default):
+    value = request.args.get(name, None)
+    return [v.strip() for v in value.split(',') if v.strip()] if value else list(default)
+
+
+def float_arg(name):
+    value = request.args.get(name, None)
+    try:
+        return None if value in (None, '') else float(value)
+    except ValueError:
+        raise ValueError(f'{name}: not a number: {value}')
+
+
+def day_arg(name, day_names, default):
+    # day index of a date (YYYY-MM-DD) or of an index of the dates
+    value = request.args.get(name, None)
+    if value in (None, ''):
+        return default
+    if value in day_names:
+        return day_names.index(value)
+    try:
+        day = int(value)
+    except ValueError:
+        raise ValueError(f'{name}: not a date of the semester: {value}')
+    if not 0 <= day < len(day_names):
+        raise ValueError(f'{name}: day out of range: {value}')
+    return day
+
+
+def selection(state):
+    # files, ranks, dates, elevation limits, avoidance radii and night window of the query
+    config = state['config']
+    day_names = state['day_names']
+    start = day_arg('start', day_names, 0)
+    end = day_arg('end', day_names, len(day_names) - 1)
+    if end < start:
+        raise ValueError('end before start')
+    limits = state['limits']
+    minEl, maxEl = float_arg('min_el'), float_arg('max_el')
+    avoid = state['avoid']
+    sun, moon = float_arg('sun'), float_arg('moon')
+    limits = elevation_limits(config, (limits[0] if minEl is None else minEl,
+                                       limits[1] if maxEl is None else maxEl))
+    avoid = avoidanceRadii({'sun': avoid['sun'] if sun is None else sun,
+                            'moon': avoid['moon'] if moon is None else moon})
+    utStart, hours = float_arg('ut_start'), float_arg('hours')
+    if utStart is not None and not 0 <= utStart < 24:
+        raise ValueError(f'ut_start: not an UT hour (0 to 24): {utStart:g}')
+    if hours is not None and not 0 < hours <= 24:
+        raise ValueError(f'hours: not in (0, 24]: {hours:g}')
+    window = night_window(config, utStart, hours)
+    if window[1] < 1:
+        raise ValueError(f'hours: shorter than one time slot: {hours:g}')
+    return {
+        'files': [f.upper() for f in split_arg('files', all_files)],
+        'ranks': split_arg('ranks', all_ranks),
+        'start': start,
+        'end': end,
+        'limits': limits,
+        'avoid': avoid,
+        'window': window,
+    }
+
+
+def selected(state, sel):
+    # (file, project) of the selection, in the order of the files
+    projects_by_file = state['projects_by_file']
+    return [(f, p) for f in sel['files'] if f in projects_by_file
+            for p in selectProjects(projects_by_file[f], sel['ranks'])]
+
+
+def window_grid(state, sel):
+    # context of the night window, LST hour of every slot and hours per slot of the dates of the selection
+    context = windowContext(state['context'], sel['window'])
+    days = slice(sel['start'], sel['end'] + 1)
+    jd = context.astroTime.jd
+    slotHours = round((jd[1, 0] - jd[0, 0]) * 86400.) / 3600. if jd.shape[0] > 1 else 0.
+    lstHour = (context.lst % 24.).astype(int)[:, days]
+    return context, lstHour, slotHours
+
+
+def up_summary(up, lstHour, slotHours):
+    # up hours, LST hours and daily up fractions of an up (nslots, ndays) mask
+    up = up > 0
+    return {
+        'up_hours': float(up.sum() * slotHours),
+        'lst_hours': (np.bincount(lstHour[up], minlength=24) * slotHours).tolist(),
+        'fractions': up.mean(axis=0).tolist() if up.size else [],
+    }
+
+
+def source_rows(state, sel):
+    context, lstHour, slotHours = window_grid(state, sel)
+    days = slice(sel['start'], sel['end'] + 1)
+    rows = []
+    for f, p in selected(state, sel):
+        index, up, lstup = p.table.uptimes(sel['limits'], sel['avoid'], sel['window'])
+        for s in p.sourceList:
+            row = {'file': f, 'project': p.pId, 'name': s.name, 'ra': float(s.ra), 'dec': float(s.dec),
+                   'system': s.coordsys, 'instrument': s.instrument, 'rank': s.rank,
+                   'integ_time': float(s.integTime)}
+            row.update(up_summary(up[index[s.index]][:, days], lstHour, slotHours))
+            rows.append(row)
+    return rows
+
+
+def project_rows(state, sel):
+    context, lstHour, slotHours = window_grid(state, sel)
+    days = slice(sel['start'], sel['end'] + 1)
+    rows = []
+    for f, p in selected(state, sel):
+        sources = p.sourceList
+        row = {'file': f, 'project': p.pId, 'pi': sources[0].piName, 'rank': sources[0].rank,
+               'nsources': len(sources), 'instruments': sorted(set(str(s.instrument) for s in sources)),
+               'requested_hours': float(np.sum([s.integTime for s in sources]))}
+        row.update(up_summary(p.createUberUp(context, sel['limits'], sel['avoid'])[:, days], lstHour,
+                              slotHours))
+        rows.append(row)
+    return rows
+
+
+def interval_rows(state, sel):
+    # runs of up slots of every source per date, [first slot, last slot + step)
+    context, lstHour, slotHours = window_grid(state, sel)
+    day_names = state['day_names']
+    jd = context.astroTime.jd
+    rows = []
+    for f, p in selected(state, sel):
+        if not len(p.rows):
+            continue
+        index, up, lstup = p.table.uptimes(sel['limits'], sel['avoid'], sel['window'])
+        # (sources, days, slots) padded with a down slot on both sides
+        u = up[index[p.rows]][:, :, sel['start']:sel['end'] + 1].transpose(0, 2, 1)
+        edges = np.diff(np.pad(u, ((0, 0), (0, 0), (1, 1))), axis=2)
+        i, d, k0 = np.nonzero(edges == 1)
+        k1 = np.nonzero(edges == -1)[2]
+        d = d + sel['start']
+        start = atime.Time(jd[k0, d], format='jd', scale='utc').isot
+        end = atime.Time(jd[k1 - 1, d] + slotHours / 24., format='jd', scale='utc').isot
+        sources = p.sourceList
+        for n in range(len(i)):
+            s = sources[i[n]]
+            rows.append({'file': f, 'project': p.pId, 'name': s.name, 'date': day_names[d[n]],
+                         'start': str(start[n]), 'end': str(end[n]), 'hours': float((k1[n] - k0[n]) * slotHours)})
+    return rows
+
+
+def wants_arrow():
+    fmt = request.args.get('format', None)
+    if fmt:
+        return fmt == 'arrow'
+    return request.accept_mimetypes.best_match(['application/json', arrowMimetype]) == arrowMimetype
+
+
+def etag(version):
+    # the data version and the query, independent of the order of the arguments
+    query = sorted((k, v) for k in request.args for v in request.args.getlist(k))
+    return hashlib.sha1(repr((version, request.path, query, wants_arrow())).encode()).hexdigest()
+
+
+def arrow_response(version, rows):
+    try:
+        table = pa.Table.from_pylist(rows)
+    except ImportError:
+        return Response('Arrow IPC needs pyarrow\n', status=406, mimetype='text/plain')
+    table = table.replace_schema_metadata({'version': version})
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return Response(sink.getvalue(), mimetype=arrowMimetype)
+
+
+def respond(state_func, rows_func):
+    # rows_func(state, selection) -> [{column: value}] as json or Arrow, 304 if the ETag matches
+    state = state_func()
+    version = state['data_version']
+    tag = etag(version)
+    if tag in request.if_none_match:
+        count('api cache hit')
+        response = Response(status=304)
+    else:
+        count('api cache miss')
+        try:
+            sel = selection(state)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        rows = rows_func(state, sel)
+        if wants_arrow():
+            response = arrow_response(version, rows)
+        else:
+            response = jsonify({'version': version, 'rows': rows})
+    if response.status_code in (200, 304):
+        response.set_etag(tag)
+        # the clients revalidate every time, a 304 is cheap
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def register(server, state_func):
+    # state_func() -> the state of the app with the projects loaded (see plot_uptimes.project_state)
+    routes = {'/api/sources': source_rows, '/api/projects': project_rows, '/api/intervals': interval_rows}
+    for path, rows_func in routes.items():
+        server.add_url_rule(path, 'api' + path.replace('/', '_'),
+                            lambda rows_func=rows_func: respond(state_func, rows_func))
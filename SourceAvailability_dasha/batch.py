@@ -0,0 +1,255 @@
+"""Headless batch export of the figures and summaries of a semester
+
+    Reads the same yaml config as the dash app (SOURCE_CONFIG_PATH or
+    --config), computes the availability once, then renders in parallel
+    processes the Pressure and Season figures of every file and rank
+    selection and the Up times and Uber up figures of every project, with
+    csv summaries, into the output directory. With --schedule, allocates the
+    requested hours of all the sources to the slots of the window (see
+    scheduler.py). Does not import dash.
+
+    python -m SourceAvailability_dasha.batch --config config.yaml -o output
+"""
+import argparse
+import csv
+import itertools
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .config import all_files, all_ranks, avoidance_radii, default_limits, elevation_limits, load_config, prjs_dict, \
+    project_files, time_grid
+from .make_availability import avoidanceRadii, createPressurePlot, createSeasonPlot, loadProjectsByFile, \
+    mergeProjects, selectProjects
+from .scheduler import scheduleSources, scheduleSummary
+
+_batch = {}  # config, time grid (context of the night window) and projects of this process
+
+
+def load_state(config_file, debug=False):
+    # compute (or read from the projects files) the availability of every file
+    config = load_config(config_file)
+    context = time_grid(config)
+    projects_by_file = loadProjectsByFile(context, project_files(config, all_files), debug=debug)
+    _batch.update({
+        'config': config,
+        'context': context,
+        'astroTime': context.astroTime,
+        'day_names': [str(a)[:10] for a in context.astroTime[0, :]],
+        'projects_by_file': projects_by_file,
+    })
+    return _batch
+
+
+def selections(items, mode):
+    # 'all': every non empty subset, 'single': every item and all the items
+    if mode == 'all':
+        return [list(c) for n in range(1, len(items) + 1) for c in itertools.combinations(items, n)]
+    return [[i] for i in items] + ([list(items)] if len(items) > 1 else [])
+
+
+def safe_name(name):
+    return re.sub(r'[^\w\-]+', '_', str(name))
+
+
+def write_figure(fig, path, formats):
+    for fmt in formats:
+        if fmt == 'html':
+            fig.write_html(path + '.html', include_plotlyjs='cdn')
+        elif fmt == 'json':
+            fig.write_json(path + '.json')
+        else:
+            # static images need kaleido
+            fig.write_image(path + '.' + fmt)
+
+
+def write_csv(path, header, rows):
+    with open(path, 'w', newline='') as fo:
+        w = csv.writer(fo)
+        w.writerow(header)
+        w.writerows(rows)
+
+
+def selected_projects(files, ranks):
+    projects, sources = mergeProjects({f: _batch['projects_by_file'][f] for f in files
+                                       if f in _batch['projects_by_file']})
+    return selectProjects(projects, ranks)
+
+
+def render_pressure(files, ranks, window, limits, avoid, outdir, formats):
+    projects = selected_projects(files, ranks)
+    if not projects:
+        return []
+    fig = createPressurePlot(_batch['context'], projects, ranks, files, prjs_dict, window[0], window[1],
+                             limits=limits, avoid=avoid)
+    path = os.path.join(outdir, 'pressure', f"pressure_{''.join(files)}_{''.join(ranks)}")
+    write_figure(fig, path, formats)
+    # requested hours per instrument-rank and available hours per LST hour
+    traces = [t for t in fig.data if t.y is not None and len(t.y)]
+    write_csv(path + '.csv', ['lst'] + [t.name for t in traces],
+              [[h] + [t.y[h] for t in traces] for h in range(24)])
+    return [path]
+
+
+def render_season(files, ranks, window, limits, avoid, outdir, formats):
+    projects = selected_projects(files, ranks)
+    if not projects:
+        return []
+    fig = createSeasonPlot(_batch['context'], _batch['day_names'], projects, window[0], window[1], limits=limits,
+                           avoid=avoid)
+    path = os.path.join(outdir, 'season', f"season_{''.join(files)}_{''.join(ranks)}")
+    write_figure(fig, path, formats)
+    # fraction of the night each project is up, per date
+    dates = _batch['day_names'][window[0]:window[1]]
+    write_csv(path + '.csv', ['project'] + dates,
+              [[p.pId] + list(row) for p, row in zip(projects, np.asarray(fig.data[0].z))])
+    return [path]
+
+
+def render_projects(f, indices, window, days, limits, avoid, outdir, formats):
+    # up times and uber up figures of projects, and their summary rows
+    context = _batch['context']
+    day_names = _batch['day_names']
+    nsubhours = _batch['config']['date']['nsubhours']
+    rows = []
+    for i in indices:
+        p = _batch['projects_by_file'][f][i]
+        path = os.path.join(outdir, 'projects', f'{safe_name(p.pId)}')
+        for day in days:
+            fig = p.plotUptimes(context, day_names, day, [0, len(p.sourceList)], limits=limits)
+            write_figure(fig, f'{path}_uptimes_{day_names[day]}', formats)
+        fig = p.plotUberUp(context, day_names, window[0], window[1], limits=limits, avoid=avoid)
+        write_figure(fig, f'{path}_uberup', formats)
+
+        up = p.uberUp[:, window[0]:window[1] + 1] > 0
+        sources = p.sourceList
+        rows.append([f, p.pId, sources[0].piName, sources[0].rank, len(sources),
+                     ' '.join(sorted(set(str(s.instrument) for s in sources))),
+                     float(np.sum([s.integTime for s in sources])),
+                     up.sum() / float(nsubhours), float(up.mean(axis=0).mean()) if up.size else 0.])
+    return rows
+
+
+def render_schedule(window, limits, avoid, outdir, localSearch, timeLimit):
+    # the projects that fit, the cells of every source and the source of every allocated slot
+    context = _batch['context']
+    astroTime = context.astroTime
+    day_names = _batch['day_names']
+    schedule = scheduleSources(context, _batch['projects_by_file'], all_ranks, window[0], window[1], prjs_dict,
+                               limits=limits, avoid=avoid, localSearch=localSearch, timeLimit=timeLimit)
+    summary = scheduleSummary(schedule)
+    write_csv(os.path.join(outdir, 'schedule', 'schedule_projects.csv'),
+              ['file', 'project', 'rank', 'requested_hours', 'allocated_hours', 'fits'], summary)
+    write_csv(os.path.join(outdir, 'schedule', 'schedule_sources.csv'),
+              ['file', 'project', 'source', 'instrument', 'rank', 'requested_hours', 'slots', 'allocated_hours'],
+              [[f, s.pId, s.name, s.instrument, s.rank, float(s.integTime), int(c),
+                float(s.integTime) if c else 0.]
+               for f, s, c in zip(schedule.files, schedule.sources, schedule.cells)])
+    days, slots = np.nonzero(schedule.owner.T >= 0)
+    lst = context.lst
+    rows = []
+    for d, i in zip(days, slots):
+        s = schedule.sources[schedule.owner[i, d]]
+        rows.append([day_names[window[0] + d], str(astroTime[i, window[0] + d])[11:16],
+                     '%.2f' % lst[i, window[0] + d], schedule.files[schedule.owner[i, d]], s.pId, s.name])
+    write_csv(os.path.join(outdir, 'schedule', 'schedule_slots.csv'),
+              ['date', 'ut', 'lst', 'file', 'project', 'source'], rows)
+    return summary
+
+
+def add_limit_arguments(parser):
+    parser.add_argument('--min-el', type=float, default=None,
+                        help='lower elevation limit [deg] of the instruments without their own (default: config)')
+    parser.add_argument('--max-el', type=float, default=None,
+                        help='upper elevation limit [deg] of the instruments without their own (default: config)')
+    parser.add_argument('--sun-radius', type=float, default=None, help='Sun avoidance radius [deg] (default: config)')
+    parser.add_argument('--moon-radius', type=float, default=None, help='Moon avoidance radius [deg] (default: config)')
+
+
+def limit_arguments(config, args):
+    # elevation limits and avoidance radii of the config overridden by the arguments of add_limit_arguments
+    default = default_limits(config)
+    limits = elevation_limits(config, (default[0] if args.min_el is None else args.min_el,
+                                       default[1] if args.max_el is None else args.max_el))
+    radii = avoidance_radii(config)
+    avoid = avoidanceRadii({'sun': radii['sun'] if args.sun_radius is None else args.sun_radius,
+                            'moon': radii['moon'] if args.moon_radius is None else args.moon_radius})
+    return limits, avoid
+
+
+def run_task(task):
+    kind, args = task
+    return kind, {'pressure': render_pressure, 'season': render_season, 'projects': render_projects}[kind](*args)
+
+
+def worker_init(config_file):
+    load_state(config_file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--config', default=None, help='yaml config (default: SOURCE_CONFIG_PATH)')
+    parser.add_argument('-o', '--output', default='source_availability_output')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--format', default='html', help='comma separated: html, json, png (needs kaleido)')
+    parser.add_argument('--file-sets', choices=['all', 'single'], default='all',
+                        help='all the file subsets or every file and all the files')
+    parser.add_argument('--rank-sets', choices=['all', 'single'], default='single',
+                        help='all the rank subsets or every rank and all the ranks')
+    parser.add_argument('--start-day', type=int, default=0, help='first day of the window')
+    parser.add_argument('--end-day', type=int, default=None, help='last day of the window (default: last day)')
+    parser.add_argument('--uptimes-days', default='0', help="comma separated day indices of the up times, or 'all'")
+    add_limit_arguments(parser)
+    parser.add_argument('--chunk', type=int, default=20, help='projects per task')
+    parser.add_argument('--schedule', action='store_true', help='allocate the requested hours to the window slots')
+    parser.add_argument('--schedule-time', type=float, default=5.,
+                        help='time limit [s] of the local search of the schedule, 0: greedy only')
+    args = parser.parse_args(argv)
+
+    config_file = args.config or os.environ.get('SOURCE_CONFIG_PATH', None)
+    formats = [f.strip() for f in args.format.split(',') if f.strip()]
+    # computes the availability once, the workers read the projects files
+    state = load_state(config_file, debug=True)
+    ndays = len(state['day_names'])
+    window = [args.start_day, ndays - 1 if args.end_day is None else args.end_day]
+    days = range(ndays) if args.uptimes_days == 'all' else [int(d) for d in args.uptimes_days.split(',')]
+    limits, avoid = limit_arguments(state['config'], args)
+    for d in ('pressure', 'season', 'projects') + (('schedule',) if args.schedule else ()):
+        os.makedirs(os.path.join(args.output, d), exist_ok=True)
+
+    files = [f for f in all_files if f in state['projects_by_file']]
+    tasks = []
+    for fs in selections(files, args.file_sets):
+        for rs in selections(all_ranks, args.rank_sets):
+            tasks.append(('pressure', (fs, rs, window, limits, avoid, args.output, formats)))
+            tasks.append(('season', (fs, rs, window, limits, avoid, args.output, formats)))
+    for f in files:
+        n = len(state['projects_by_file'][f])
+        for c in range(0, n, args.chunk):
+            tasks.append(('projects', (f, list(range(c, min(n, c + args.chunk))), window, days, limits, avoid,
+                                       args.output, formats)))
+
+    summary = []
+    if args.workers > 1:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=worker_init,
+                                 initargs=(config_file,)) as pool:
+            results = list(pool.map(run_task, tasks))
+    else:
+        results = [run_task(t) for t in tasks]
+    for kind, out in results:
+        if kind == 'projects':
+            summary += out
+    write_csv(os.path.join(args.output, 'projects.csv'),
+              ['file', 'project', 'pi', 'rank', 'nsources', 'instruments', 'requested_hours', 'up_hours',
+               'mean_up_fraction'], summary)
+    if args.schedule:
+        fits = render_schedule(window, limits, avoid, args.output, args.schedule_time > 0, args.schedule_time)
+        print(f'{sum(p[5] for p in fits)} of {len(fits)} projects fit the schedule', file=sys.stderr)
+    print(f'{len(tasks)} tasks written to {args.output}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""Versioned precomputed data bundles of the availability
+
+    A bundle is a directory <bundles>/<version>/ holding one .npy file per
+    array and a manifest.json describing them: the full-day time grid (jd and
+    LST), the columns, az/el and Sun/Moon grids of the source table and the
+    projects of every file, and the up times and LST hours of the default
+    elevation limits, avoidance and night window of the config. It is written
+    in a temporary directory renamed once complete: a bundle directory with a
+    manifest never changes. The versions sort by build time.
+
+    The app (bundle: {dir: ...} in the config, or SOURCE_BUNDLE_DIR) loads the
+    latest bundle of the directory with its grids memory-mapped instead of
+    computing the availability, and switches to a newer bundle once it
+    appears (see plot_uptimes.reload_bundle). Does not import dash.
+
+    python -m SourceAvailability_dasha.bundle --config config.yaml -o bundles --keep 3
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from .batch import add_limit_arguments, limit_arguments, load_state
+from .config import all_files, data_version, night_window, project_files
+from .make_availability import Project, SourceTable, avoidanceRadii, elevationLimits, fullContext, gridKey
+from .profiling import lazy_module, timer
+
+coordinates = lazy_module('astropy.coordinates')
+
+bundleFormat = 1
+# arrays of a source table, the grids are memory-mapped when loaded
+tableArrays = ('name', 'ra', 'dec', 'system', 'pid', 'pi', 'instrument', 'integTime', 'rank', 'posKeys', 'pos',
+               'done', 'lstHour', 'az', 'el')
+mmapArrays = ('az', 'el', 'up')
+
+
+def bundle_versions(directory):
+    # versions of the complete bundles of directory, oldest first
+    if not directory or not os.path.isdir(directory):
+        return []
+    return sorted(v for v in os.listdir(directory)
+                  if not v.startswith('.') and os.path.isfile(os.path.join(directory, v, 'manifest.json')))
+
+
+def latest_bundle(directory):
+    versions = bundle_versions(directory)
+    return os.path.join(directory, versions[-1]) if versions else None
+
+
+def write_bundle(directory, context, projects_by_file, config, limits, avoid, window):
+    # the bundle of the projects computed on the full-day grid of context, returns its path
+    full = fullContext(context)
+    version = time.strftime('%Y%m%dT%H%M%S', time.gmtime()) + '-' + \
+        data_version(config, project_files(config, list(projects_by_file)))
+    tmp = os.path.join(directory, '.' + version + '.tmp')
+    os.makedirs(tmp)
+    arrays = {}
+
+    def save(name, a):
+        a = np.asarray(a)
+        np.save(os.path.join(tmp, name + '.npy'), a, allow_pickle=False)
+        arrays[name] = {'dtype': a.dtype.str, 'shape': list(a.shape)}
+
+    with timer('bundle write'):
+        save('time.jd', full.astroTime.jd)
+        save('time.lst', full.lst)
+        files = OrderedDict()
+        for f, projects in projects_by_file.items():
+            if not projects:
+                files[f] = None
+                continue
+            table = projects[0].table
+            for c in tableArrays:
+                save(f'{f}.{c}', getattr(table, c))
+            coord = table.coord.icrs
+            save(f'{f}.coord_ra', coord.ra.deg)
+            save(f'{f}.coord_dec', coord.dec.deg)
+            for body, (az, el) in table.bodies.items():
+                save(f'{f}.{body}_az', az)
+                save(f'{f}.{body}_el', el)
+            # the aggregates of the default selection of the app
+            index, up, lstup = table.uptimes(limits, avoid, window)
+            save(f'{f}.up_index', index)
+            save(f'{f}.up', up)
+            save(f'{f}.lstup', lstup)
+            save(f'{f}.project_rows', np.concatenate([p.rows for p in projects]))
+            files[f] = {'projects': [str(p.pId) for p in projects], 'nrows': [len(p.rows) for p in projects],
+                        'bodies': sorted(table.bodies), 'grid': list(table.grid[:2]) + [list(table.grid[2])]}
+        loc = full.location
+        manifest = {
+            'format': bundleFormat,
+            'version': version,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'site': {'lon': loc.lon.deg, 'lat': loc.lat.deg, 'height': loc.height.to_value('m')},
+            'date': {k: config['date'][k] for k in ('semester', 'start_date', 'end_date', 'nsubhours')
+                     if k in config['date']},
+            'grid': list(gridKey(full.astroTime)[:2]) + [list(full.astroTime.shape)],
+            # the keys of the aggregates, see SourceTable.uptimes
+            'limits': dict(limits) if isinstance(limits[0], tuple) else list(limits),
+            'avoid': dict(avoid),
+            'window': list(window) if window is not None else None,
+            'files': files,
+            'arrays': arrays,
+        }
+        with open(os.path.join(tmp, 'manifest.json'), 'w') as fo:
+            json.dump(manifest, fo, indent=1)
+        path = os.path.join(directory, version)
+        os.rename(tmp, path)
+    return path
+
+
+def read_manifest(path):
+    with open(os.path.join(path, 'manifest.json')) as fo:
+        manifest = json.load(fo)
+    if manifest.get('format') != bundleFormat:
+        raise ValueError(f"bundle {path}: format {manifest.get('format')}, not {bundleFormat}")
+    return manifest
+
+
+def load_bundle(path, context=None):
+    # manifest and projects (keyed by file) of a bundle, the grids memory-mapped read-only; with context,
+    # the bundle has to be computed on its full-day grid
+    manifest = read_manifest(path)
+    if context is not None:
+        grid = gridKey(fullContext(context).astroTime)
+        if list(grid[:2]) + [list(grid[2])] != manifest['grid']:
+            raise ValueError(f'bundle {path} computed on another time grid: {manifest["grid"]}')
+
+    def load(name):
+        mmap = 'r' if name.split('.')[-1] in mmapArrays else None
+        return np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap, allow_pickle=False)
+
+    key = (elevationLimits(manifest['limits']), avoidanceRadii(manifest['avoid']),
+           None if manifest['window'] is None else tuple(manifest['window']))
+    projects_by_file = OrderedDict()
+    with timer('bundle read'):
+        for f, desc in manifest['files'].items():
+            if desc is None:
+                projects_by_file[f] = []
+                continue
+            state = {c: load(f'{f}.{c}') for c in tableArrays}
+            state.update({
+                'nrows': len(state['name']),
+                'npos': len(state['posKeys']),
+                'coord': coordinates.SkyCoord(load(f'{f}.coord_ra'), load(f'{f}.coord_dec'), unit='deg'),
+                'bodies': {b: (load(f'{f}.{b}_az'), load(f'{f}.{b}_el')) for b in desc['bodies']},
+                'grid': (desc['grid'][0], desc['grid'][1], tuple(desc['grid'][2])),
+            })
+            table = SourceTable.__new__(SourceTable)
+            table.__setstate__(state)
+            derived = tuple(load(f'{f}.{c}') for c in ('up_index', 'up', 'lstup'))
+            for a in derived:
+                a.flags.writeable = False
+            table.derived[key] = derived
+            rows = np.split(load(f'{f}.project_rows'), np.cumsum(desc['nrows'])[:-1])
+            projects_by_file[f] = [Project(pid, table, r) for pid, r in zip(desc['projects'], rows)]
+    return manifest, projects_by_file
+
+
+def prune_bundles(directory, keep):
+    # remove all but the keep latest bundles; a server still mapping a removed one keeps reading it
+    for v in bundle_versions(directory)[:-keep] if keep > 0 else []:
+        shutil.rmtree(os.path.join(directory, v))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--config', default=None, help='yaml config (default: SOURCE_CONFIG_PATH)')
+    parser.add_argument('-o', '--output', default='source_availability_bundles', help='bundles directory')
+    parser.add_argument('--keep', type=int, default=0, help='number of bundles kept (default: all)')
+    add_limit_arguments(parser)
+    args = parser.parse_args(argv)
+
+    config_file = args.config or os.environ.get('SOURCE_CONFIG_PATH', None)
+    state = load_state(config_file, debug=True)
+    config = state['config']
+    limits, avoid = limit_arguments(config, args)
+    os.makedirs(args.output, exist_ok=True)
+    path = write_bundle(args.output, state['context'],
+                        OrderedDict((f, state['projects_by_file'].get(f, [])) for f in all_files), config, limits,
+                        avoid, night_window(config))
+    prune_bundles(args.output, args.keep)
+    print(f'bundle written to {path}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""Configuration shared by the dash app and the command line tools,
+    this module must not import dash"""
+import hashlib
+import os
+import tempfile
+import yaml
+
+from .make_availability import avoidBodies, avoidanceRadii, elevationLimits, getLMT, makeContext, makeFullTime, \
+    nightWindow, useOfflineIERS, windowContext
+from .tiles import TileCache
+
+efficiency = 0.5
+prjs_dict = {'UM': 0.15, 'US': 0.15, 'MX': 0.7, 'TOT': efficiency}
+all_files = ['UM', 'US', 'MX']
+all_ranks = ['A', 'B', 'C', 'D']
+ut0 = " 03:00:0"
+
+
+def load_config(config_file=None):
+    # reading the start and end date and the target files from yaml file
+    config_file = config_file or os.environ.get('SOURCE_CONFIG_PATH', None)
+    if config_file is None:
+        raise RuntimeError('please setup config_file (SOURCE_CONFIG_PATH)')
+    with open(config_file, 'r') as fo:
+        return yaml.safe_load(fo)
+
+
+def time_grid(config):
+    # AvailabilityContext (LMT, astroTime, AltAz frame and LST) of the night window of the config, a view of
+    # the full-day grid the sources are computed on (see windowContext)
+    # start date, end date, nhours: how many hours a day, nsubhours: how many per hour, ut0: start time
+    # bundled IERS/leap-second tables only, for isolated networks
+    useOfflineIERS((config.get('iers', None) or {}).get('offline', False) or
+                   os.environ.get('SOURCE_IERS_OFFLINE', '') not in ('', '0'))
+    LMT = getLMT()
+    astroTime = makeFullTime(config['date']['start_date'], config['date']['end_date'], config['date']['nsubhours'])
+    # per-day az/el tiles shared by the time grids with the same sampling
+    tiles = (config.get('tiles', None) or {}).get('dir', None) or os.environ.get('SOURCE_TILES_DIR', None)
+    context = makeContext(LMT, astroTime, TileCache(tiles) if tiles else None)
+    return windowContext(context, night_window(config))
+
+
+def night_window(config, ut_start=None, nhours=None):
+    # (first slot, number of slots) of the night window: ut0 (default " 03:00:0") and nhours of the config,
+    # ut_start [hours] and nhours override them
+    date = config['date']
+    return nightWindow(date.get('ut0', ut0) if ut_start is None else ut_start,
+                       date['nhours'] if nhours is None else nhours, date['nsubhours'])
+
+
+def default_limits(config):
+    # (min, max) elevation [deg] of the up times: limits: {min_el: 25, max_el: 80}
+    limits = config.get('limits', None) or {}
+    default = elevationLimits()
+    return elevationLimits((limits.get('min_el', default[0]), limits.get('max_el', default[1])))
+
+
+def elevation_limits(config, default=None):
+    # elevation limits of the up times (see elevationLimits), per instrument if the config has a table:
+    # limits: {min_el: 25, max_el: 80, instruments: {TolTEC: {min_el: 30, max_el: 75}, ...}}
+    # default: (min, max) of the instruments not in the table, instead of min_el and max_el
+    default = default_limits(config) if default is None else elevationLimits(default)
+    instruments = (config.get('limits', None) or {}).get('instruments', None) or {}
+    if not instruments:
+        return default
+    table = {k: (v.get('min_el', default[0]), v.get('max_el', default[1])) for k, v in instruments.items()}
+    table[''] = default
+    return elevationLimits(table)
+
+
+def avoidance_radii(config):
+    # Sun/Moon avoidance radii [deg] of the up times, 0: no avoidance: avoidance: {sun: 45, moon: 10}
+    radii = config.get('avoidance', None) or {}
+    avoidanceRadii(radii)
+    return {body: float(radii.get(body, 0.) or 0.) for body in avoidBodies}
+
+
+def project_files(config, prjs):
+    # [(file, projectsFile, targetsFile)] of the selected files, in the requested order
+    filename_dict = config['project']['filename_dict']
+    files = []
+    for prj in prjs:
+        prj = prj.upper()
+        if prj in filename_dict:
+            targetsFile = filename_dict[prj]
+            projectsFile = targetsFile.split('.')[0] + '.pkl'
+            files.append((prj, projectsFile, targetsFile))
+    return files
+
+
+def bundle_dir(config):
+    # directory of the precomputed data bundles of the app: bundle: {dir: ...}, or SOURCE_BUNDLE_DIR; None: the
+    # availability is computed from the targets files
+    return (config.get('bundle', None) or {}).get('dir', None) or os.environ.get('SOURCE_BUNDLE_DIR', None)
+
+
+def jobs_dir(config):
+    # queue directory of the background jobs of the app, one per config under jobs: {dir: ...}, SOURCE_JOBS_DIR or
+    # the temporary directory: the processes sharing a queue serve the same config
+    base = (config.get('jobs', None) or {}).get('dir', None) or os.environ.get('SOURCE_JOBS_DIR', None) or \
+        os.path.join(tempfile.gettempdir(), 'source_availability_jobs')
+    return os.path.join(base, data_version(config, []))
+
+
+def reload_interval(config):
+    # polling interval [s] of the targets files (or of the bundles directory) of the app: reload: {interval: 5},
+    # or SOURCE_RELOAD_INTERVAL; 0: no reload
+    interval = (config.get('reload', None) or {}).get('interval', None)
+    if interval is None:
+        interval = os.environ.get('SOURCE_RELOAD_INTERVAL', 5.)
+    return float(interval)
+
+
+def data_version(config, files):
+    # hash of the config and of the size and modification time of the targets files of files
+    # ([(file, projectsFile, targetsFile)]), changes whenever the served availability can change
+    h = hashlib.sha1(repr(sorted(config.items(), key=str)).encode())
+    for f, projectsFile, targetsFile in files:
+        st = os.stat(targetsFile) if os.path.isfile(targetsFile) else None
+        h.update(repr((f, targetsFile, st and st.st_size, st and st.st_mtime_ns)).encode())
+    return h.hexdigest()[:16]
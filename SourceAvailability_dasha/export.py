@@ -0,0 +1,211 @@
+"""Chunked export of the availability cube to Parquet and HDF5
+
+    Writes the source metadata, the el and up grids of the night window and
+    the LST hours of every source of the config to columnar files that can be
+    read without this package. The sources are written in chunks of --chunk
+    rows, sorted by file, rank, instrument and project; the az/el of a chunk
+    are computed (or read from the tiles, see tiles: {dir: ...} in the
+    config), written and dropped before the next one: only the metadata of the
+    catalogue and the grids of one chunk are held in memory.
+
+    parquet: sources.parquet, one row per source with its LST hours, and
+             grids.parquet, one row per source and date with its el [deg] and
+             up slots; one row group per chunk, the statistics of the file,
+             project, rank and instrument columns make filters on them skip
+             the other row groups
+    hdf5:    availability.h5, /sources/<column> (n), /el and /up (n, nslots,
+             ndays) chunked per date, /lst_hours (n, 24), /time/jd, /time/lst
+             and /time/dates; the sources of a rank, and of an instrument within a
+             rank, are contiguous rows
+
+    The time grid, elevation limits, avoidance radii and data version are in the
+    'availability' metadata (json) of the files.
+
+    python -m SourceAvailability_dasha.export --config config.yaml -o output --format parquet,hdf5
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+from .batch import add_limit_arguments, limit_arguments
+from .config import all_files, data_version, load_config, project_files, time_grid
+from .make_availability import SourceTable, readTargets
+from .profiling import lazy_module
+
+pa = lazy_module('pyarrow')
+pq = lazy_module('pyarrow.parquet')
+h5py = lazy_module('h5py')
+
+# metadata columns of every source, and the ones repeated on the rows of grids.parquet
+sourceColumns = ('file', 'project', 'name', 'ra', 'dec', 'system', 'instrument', 'rank', 'integ_time')
+gridColumns = ('file', 'project', 'name', 'instrument', 'rank')
+
+
+def export_rows(config):
+    # [(file, table, rows)] of every file of the config, the targets only (no grids), the rows sorted by rank,
+    # instrument and project
+    parts = []
+    for f, projectsFile, targetsFile in project_files(config, all_files):
+        table = readTargets(targetsFile, debug=False)
+        if not table.nrows:
+            continue
+        rows = np.lexsort((table.pid, table.instrument, table.rank))
+        parts.append((f, table, rows))
+    return parts
+
+
+def chunk_arrays(f, table, rows, context, limits, avoid, window):
+    # metadata columns, el (n, nslots, ndays) float32, up int8 and LST hours (n, 24) of rows, their az/el
+    # computed on a table of the rows only, freed once written
+    chunk = SourceTable(*(getattr(table, c)[rows] for c in SourceTable.columns))
+    chunk.createUptimes(context)
+    index, up, lstup = chunk.uptimes(limits, avoid, window)
+    return {
+        'file': np.full(len(rows), f),
+        'project': chunk.pid,
+        'name': chunk.name,
+        'ra': chunk.ra,
+        'dec': chunk.dec,
+        'system': chunk.system,
+        'instrument': chunk.instrument,
+        'rank': chunk.rank,
+        'integ_time': chunk.integTime,
+        'el': chunk.windowed(chunk.el[chunk.pos], window).astype(np.float32),
+        'up': up[index],
+        'lst_hours': lstup[index],
+    }
+
+
+def grid_metadata(state, limits, avoid):
+    # time grid of the night window, limits, avoidance and data version of the export
+    astroTime = state['astroTime']
+    jd = astroTime.jd
+    return {
+        'version': data_version(state['config'], project_files(state['config'], all_files)),
+        'dates': state['day_names'],
+        'first_jd': jd[0, :].tolist(),
+        'slot_seconds': round((jd[1, 0] - jd[0, 0]) * 86400.) if jd.shape[0] > 1 else 0,
+        'window': list(state['context'].window or ()),
+        'limits': limits,
+        'avoid': dict(avoid),
+    }
+
+
+class ParquetExport:
+    def __init__(self, outdir, metadata, nslots, compression='zstd'):
+        meta = {'availability': json.dumps(metadata)}
+        self.dates = np.array(metadata['dates'])
+        self.nslots = nslots
+        self.sources = pq.ParquetWriter(os.path.join(outdir, 'sources.parquet'), pa.schema(
+            [(c, pa.float64() if c in ('ra', 'dec', 'integ_time') else pa.string()) for c in sourceColumns] +
+            [('lst_hours', pa.list_(pa.float64(), 24)), ('up_hours', pa.float64())], metadata=meta),
+            compression=compression)
+        self.grids = pq.ParquetWriter(os.path.join(outdir, 'grids.parquet'), pa.schema(
+            [(c, pa.string()) for c in gridColumns] +
+            [('date', pa.string()), ('el', pa.list_(pa.float32(), nslots)), ('up', pa.list_(pa.int8(), nslots))],
+            metadata=meta), compression=compression)
+
+    def write(self, a):
+        n = len(a['name'])
+        lstHours = a['lst_hours']
+        columns = [pa.array(a[c].astype(float if c in ('ra', 'dec', 'integ_time') else str)) for c in sourceColumns]
+        columns += [pa.FixedSizeListArray.from_arrays(pa.array(lstHours.ravel()), 24),
+                    pa.array(lstHours.sum(axis=1))]
+        self.sources.write_table(pa.Table.from_arrays(columns, schema=self.sources.schema), row_group_size=n)
+        # one row per (source, date), the slots of the date as fixed size lists
+        ndays = len(self.dates)
+        columns = [pa.array(np.repeat(a[c].astype(str), ndays)) for c in gridColumns]
+        columns += [pa.array(np.tile(self.dates, n)),
+                    pa.FixedSizeListArray.from_arrays(pa.array(a['el'].transpose(0, 2, 1).ravel()), self.nslots),
+                    pa.FixedSizeListArray.from_arrays(pa.array(a['up'].transpose(0, 2, 1).ravel()), self.nslots)]
+        self.grids.write_table(pa.Table.from_arrays(columns, schema=self.grids.schema), row_group_size=n * ndays)
+
+    def close(self):
+        self.sources.close()
+        self.grids.close()
+
+
+class HDF5Export:
+    def __init__(self, outdir, metadata, context, nrows, chunk, compression='gzip'):
+        astroTime = context.astroTime
+        self.h5 = h5py.File(os.path.join(outdir, 'availability.h5'), 'w')
+        self.h5.attrs['availability'] = json.dumps(metadata)
+        nslots, ndays = astroTime.shape
+        time = self.h5.create_group('time')
+        time['jd'] = astroTime.jd
+        time['lst'] = context.lst
+        time['dates'] = np.array(metadata['dates'], dtype='S10')
+        sources = self.h5.create_group('sources')
+        for c in sourceColumns:
+            dtype = float if c in ('ra', 'dec', 'integ_time') else h5py.string_dtype()
+            sources.create_dataset(c, (nrows,), dtype=dtype, compression=compression)
+        # chunked per date: a date range reads the dates only
+        chunks = (max(1, min(chunk, nrows)), nslots, 1)
+        self.h5.create_dataset('el', (nrows, nslots, ndays), dtype=np.float32, chunks=chunks, shuffle=True,
+                               compression=compression)
+        self.h5.create_dataset('up', (nrows, nslots, ndays), dtype=np.int8, chunks=chunks, shuffle=True,
+                               compression=compression)
+        self.h5.create_dataset('lst_hours', (nrows, 24), dtype=float, compression=compression)
+        self.next = 0
+
+    def write(self, a):
+        rows = slice(self.next, self.next + len(a['name']))
+        for c in sourceColumns:
+            self.h5['sources'][c][rows] = a[c] if c in ('ra', 'dec', 'integ_time') else a[c].astype(object)
+        for c in ('el', 'up', 'lst_hours'):
+            self.h5[c][rows] = a[c]
+        self.next = rows.stop
+
+    def close(self):
+        self.h5.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--config', default=None, help='yaml config (default: SOURCE_CONFIG_PATH)')
+    parser.add_argument('-o', '--output', default='source_availability_export')
+    parser.add_argument('--format', default='parquet',
+                        help='comma separated: parquet (needs pyarrow), hdf5 (needs h5py)')
+    parser.add_argument('--chunk', type=int, default=1024, help='sources per chunk (parquet row group)')
+    add_limit_arguments(parser)
+    args = parser.parse_args(argv)
+
+    config_file = args.config or os.environ.get('SOURCE_CONFIG_PATH', None)
+    formats = [f.strip() for f in args.format.split(',') if f.strip()]
+    config = load_config(config_file)
+    context = time_grid(config)
+    astroTime = context.astroTime
+    state = {'config': config, 'context': context, 'astroTime': astroTime,
+             'day_names': [str(a)[:10] for a in astroTime[0, :]]}
+    limits, avoid = limit_arguments(config, args)
+    window = context.window
+    metadata = grid_metadata(state, limits, avoid)
+    parts = export_rows(config)
+    nrows = sum(len(rows) for f, table, rows in parts)
+    os.makedirs(args.output, exist_ok=True)
+
+    writers = []
+    for fmt in formats:
+        if fmt == 'parquet':
+            writers.append(ParquetExport(args.output, metadata, astroTime.shape[0]))
+        elif fmt == 'hdf5':
+            writers.append(HDF5Export(args.output, metadata, context, nrows, args.chunk))
+        else:
+            parser.error(f'unknown format {fmt}')
+    try:
+        for f, table, rows in parts:
+            for c in range(0, len(rows), args.chunk):
+                a = chunk_arrays(f, table, rows[c:c + args.chunk], context, limits, avoid, window)
+                for w in writers:
+                    w.write(a)
+    finally:
+        for w in writers:
+            w.close()
+    print(f'{nrows} sources written to {args.output}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
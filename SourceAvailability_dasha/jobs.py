@@ -0,0 +1,212 @@
+"""Background jobs of the Dash app on a local disk-backed queue
+
+    A job is a registered function and its arguments, keyed by a hash of
+    both: submitting the same job again (from another session, or another
+    server process sharing the queue directory) joins the queued, running or
+    finished job instead of computing it twice. The queue, the progress and
+    the pickled results are kept in a sqlite database in SOURCE_JOBS_DIR
+    (default: the temporary directory); the worker threads of every process
+    take the queued jobs. The pickles are trusted: the queue directory is
+    created for this user only, and a directory other users can write to
+    (or replace) is refused.
+
+    A job is cancelled once no session waits for it anymore (their inputs
+    changed), the job function sees it at its next progress report."""
+import hashlib
+import os
+import pickle
+import sqlite3
+import stat
+import tempfile
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+
+from .profiling import count, timer
+
+_functions = {}  # job name: func(progress, *args)
+_lock = threading.Lock()
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def register(name):
+    # decorator registering a job function, called as func(progress, *args)
+    def decorator(func):
+        _functions[name] = func
+        return func
+    return decorator
+
+
+def privateDirectory(directory):
+    # create directory for this user only (mode 0700); it and its parents must belong to this user (or root) and
+    # must not be writable by others, except sticky parents like /tmp where others cannot replace its entries
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    uid = os.getuid()
+    top = d = os.path.abspath(directory)
+    while True:
+        st = os.stat(d)
+        writable = st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+        if st.st_uid not in (0, uid) or (writable and (d == top or not st.st_mode & stat.S_ISVTX)):
+            raise RuntimeError('jobs directory %s: %s belongs to another user or is writable by others'
+                               % (directory, d))
+        parent = os.path.dirname(d)
+        if parent == d:
+            break
+        d = parent
+    # an older directory readable by others
+    if os.stat(top).st_uid == uid:
+        os.chmod(top, 0o700)
+    return directory
+
+
+def jobKey(name, args):
+    return hashlib.sha1(repr((name, args)).encode()).hexdigest()
+
+
+class JobProgress:
+    # progress report of a running job, raises JobCancelled once the job is cancelled
+    def __init__(self, queue, key, interval=0.2):
+        self.queue = queue
+        self.key = key
+        self.interval = interval
+        self.last = 0.
+
+    def __call__(self, done, total, message=''):
+        now = time.perf_counter()
+        if now - self.last < self.interval and done < total:
+            return
+        self.last = now
+        with self.queue.transaction() as db:
+            db.execute('update jobs set done=?, total=?, message=?, updated=? where key=? and status=?',
+                       (done, total, message, time.time(), self.key, 'running'))
+            row = db.execute('select status from jobs where key=?', (self.key,)).fetchone()
+        if row is None or row[0] != 'running':
+            raise JobCancelled(self.key)
+
+
+class JobQueue:
+    # sqlite table of the jobs and the worker threads of this process
+    # status: queued, running, done, failed or cancelled
+    def __init__(self, directory=None, workers=2, expire=3600., stale=60., poll=0.5):
+        self.directory = directory or os.environ.get('SOURCE_JOBS_DIR', None) or \
+            os.path.join(tempfile.gettempdir(), 'source_availability_jobs')
+        privateDirectory(self.directory)
+        self.filename = os.path.join(self.directory, 'jobs.sqlite')
+        self.workers = workers
+        self.expire = expire  # finished jobs are kept this long [s]
+        self.stale = stale  # running jobs without progress this long are taken again [s]
+        self.poll = poll
+        self._local = threading.local()
+        self._wake = threading.Event()
+        self._threads = []
+        with self.transaction() as db:
+            db.execute('create table if not exists jobs (key text primary key, name text, args blob, '
+                       'status text, waiters integer, done integer, total integer, message text, '
+                       'result blob, updated real)')
+
+    def db(self):
+        # one connection per thread, transactions are explicit
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.filename, timeout=30., isolation_level=None)
+            conn.execute('pragma journal_mode=wal')
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        db = self.db()
+        db.execute('begin immediate')
+        try:
+            yield db
+        except BaseException:
+            db.execute('rollback')
+            raise
+        db.execute('commit')
+
+    def submit(self, name, *args, held=None):
+        # queue a job and return its key, joins the identical job if it is queued, running or done;
+        # held: key of the job the caller already waits for, not counted twice when submitted again
+        key = jobKey(name, args)
+        now = time.time()
+        with self.transaction() as db:
+            row = db.execute('select status from jobs where key=?', (key,)).fetchone()
+            if row is None:
+                db.execute('insert into jobs values (?, ?, ?, ?, 1, 0, 0, ?, NULL, ?)',
+                           (key, name, pickle.dumps(args), 'queued', '', now))
+            elif row[0] in ('failed', 'cancelled'):
+                db.execute("update jobs set status='queued', waiters=1, done=0, total=0, message='', result=NULL, "
+                           "updated=? where key=?", (now, key))
+            elif key != held:
+                db.execute('update jobs set waiters=waiters+1 where key=?', (key,))
+        count('jobs cache hit' if row is not None and row[0] in ('queued', 'running', 'done') else 'jobs cache miss')
+        self.start()
+        self._wake.set()
+        return key
+
+    def cancel(self, key):
+        # the caller does not wait for the job anymore, it is cancelled if nobody else does
+        with self.transaction() as db:
+            db.execute('update jobs set waiters=max(waiters - 1, 0) where key=?', (key,))
+            db.execute("update jobs set status='cancelled', updated=? where key=? and waiters=0 "
+                       "and status in ('queued', 'running')", (time.time(), key))
+
+    def status(self, key):
+        row = self.db().execute('select status, done, total, message from jobs where key=?', (key,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('status', 'done', 'total', 'message'), row))
+
+    def result(self, key):
+        row = self.db().execute('select result from jobs where key=? and status=?', (key, 'done')).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return pickle.loads(row[0])
+
+    def start(self):
+        # start the worker threads of this process
+        with _lock:
+            while len(self._threads) < self.workers:
+                t = threading.Thread(target=self.work, daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def claim(self):
+        # take the oldest queued job, or a running job whose process died
+        now = time.time()
+        with self.transaction() as db:
+            db.execute("delete from jobs where status in ('done', 'failed', 'cancelled') and updated<?",
+                       (now - self.expire,))
+            row = db.execute("select key, name, args from jobs where status='queued' "
+                             "or (status='running' and updated<?) order by updated limit 1",
+                             (now - self.stale,)).fetchone()
+            if row is not None:
+                db.execute("update jobs set status='running', updated=? where key=?", (now, row[0]))
+        return row
+
+    def work(self):
+        while True:
+            job = self.claim()
+            if job is None:
+                self._wake.wait(self.poll)
+                self._wake.clear()
+                continue
+            self.run(*job)
+
+    def run(self, key, name, args):
+        status, result, message = 'done', None, ''
+        try:
+            with timer('job ' + name):
+                result = pickle.dumps(_functions[name](JobProgress(self, key), *pickle.loads(args)))
+        except JobCancelled:
+            count('jobs cancelled')
+            return
+        except Exception:
+            traceback.print_exc()
+            status, message = 'failed', traceback.format_exc(limit=-1)
+        with self.transaction() as db:
+            db.execute("update jobs set status=?, result=?, message=?, done=total, updated=? "
+                       "where key=? and status='running'", (status, result, message, time.time(), key))
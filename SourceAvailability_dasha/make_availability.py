@@ -3,91 +3,454 @@ import os
 import pickle
 import re
 import sys
+import threading
 import time
-import pickletools
-from collections import OrderedDict
+import weakref
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import numpy as np
-from astropy import units as u
-from astropy.coordinates import AltAz, SkyCoord
-from astropy.coordinates import EarthLocation
-from astropy.time import Time, TimeDelta
-import plotly.express as px
-import plotly.graph_objects as go
-from .color_constants import colors
+from .profiling import Progress, count, lazy_module, timed, timer
 
+# heavy modules are imported on first use
+pickletools = lazy_module('pickletools')
+u = lazy_module('astropy.units')
+coordinates = lazy_module('astropy.coordinates')
+atime = lazy_module('astropy.time')
+px = lazy_module('plotly.express')
+go = lazy_module('plotly.graph_objects')
+color_constants = lazy_module(__package__ + '.color_constants')
 
-# Source class represnting on astronomical source
+
+def strColumn(values):
+    # numpy string column, decoding the bytes written by old numpy/python versions
+    return np.array([v.decode() if isinstance(v, bytes) else str(v) for v in values], dtype=str)
+
+
+# elevation limits [deg] of the up times; el is the stored grid, up and the LST hours are derived from it
+defaultLimits = (25., 80.)
+maxLimits = 8  # number of limits whose derived grids are kept per table
+_derivedLock = threading.Lock()
+avoidBodies = ('sun', 'moon')
+
+
+def elevationLimits(limits=None):
+    # hashable elevation limits [deg]: a (min, max) pair of floats for all the sources (defaultLimits if None),
+    # or from a {instrument: (min, max)} dict a sorted ((instrument, (min, max)), ...) table whose '' entry
+    # (default: defaultLimits) applies to the instruments not in it
+    if limits is None:
+        return defaultLimits
+    if isinstance(limits, dict) or (len(limits) and isinstance(limits[0], tuple)):
+        table = {str(k): elevationLimits(v) for k, v in dict(limits).items()}
+        table.setdefault('', defaultLimits)
+        return tuple(sorted(table.items()))
+    return float(limits[0]), float(limits[1])
+
+
+def avoidanceRadii(avoid=None):
+    # hashable Sun/Moon avoidance: sorted ((body, radius [deg]), ...) of the bodies with a radius > 0,
+    # from a {body: radius} dict; () if None
+    if not avoid:
+        return ()
+    radii = {str(k).lower(): float(r) for k, r in dict(avoid).items() if r}
+    unknown = set(radii) - set(avoidBodies)
+    if unknown:
+        raise ValueError('no avoidance of %s, only of %s' % (', '.join(sorted(unknown)), ', '.join(avoidBodies)))
+    return tuple(sorted((k, r) for k, r in radii.items() if r > 0))
+
+
+def windowSlots(shape, window):
+    # (rows, cols) of the slots of a night window (first slot, number of slots) of every day in a full-day
+    # grid of shape (slots per day, days), (slots, days - 1) each; the last day of the grid only holds the
+    # end of the windows past midnight
+    nslots, ndays = shape
+    start, n = window
+    if not (0 <= start < nslots and 0 < n <= nslots and ndays > 1):
+        raise ValueError('night window %s is not in a full-day grid of shape %s' % (str(window), str(shape)))
+    t = np.arange(ndays - 1)[np.newaxis, :] * nslots + start + np.arange(n)[:, np.newaxis]
+    return t % nslots, t // nslots
+
+
+def limitArrays(limits, instrument):
+    # min and max elevation of every value of the instrument column
+    limits = elevationLimits(limits)
+    if not isinstance(limits[0], tuple):
+        return np.full(len(instrument), limits[0]), np.full(len(instrument), limits[1])
+    table = dict(limits)
+    names, inverse = np.unique(instrument, return_inverse=True)
+    pairs = np.array([table.get(n, table['']) for n in names], dtype=float).reshape(-1, 2)
+    return pairs[inverse.ravel(), 0], pairs[inverse.ravel(), 1]
+
+
+# columnar store of the sources, Source and Project are lightweight views on it
+class SourceTable:
+    columns = ('name', 'ra', 'dec', 'system', 'pid', 'pi', 'instrument', 'integTime', 'rank')
+    chunkSize = 256  # number of positions per batched AltAz transform
+
+    def __init__(self, name, ra, dec, system, pid, pi, instrument, integTime, rank):
+        self.name = strColumn(name)
+        self.ra = np.asarray(ra, dtype=float)
+        self.dec = np.asarray(dec, dtype=float)
+        self.system = strColumn(system)
+        self.pid = strColumn(pid)
+        self.pi = strColumn(pi)
+        self.instrument = strColumn(instrument)
+        self.integTime = np.asarray(integTime, dtype=float)
+        self.rank = strColumn(rank)
+        self.nrows = len(self.name)
+
+        # repeated targets share one position, keyed on (frame, rounded ra, dec)
+        keys = np.rec.fromarrays([self.system == 'Galactic', np.round(self.ra, 6), np.round(self.dec, 6)],
+                                 names='galactic,ra,dec')
+        self.posKeys, self.pos = np.unique(keys, return_inverse=True)
+        self.pos = self.pos.ravel()
+        self.npos = len(self.posKeys)
+
+        # one batched SkyCoord for all the positions, galactic ones converted to icrs
+        with timer('coordinates'):
+            ra = np.array(self.posKeys['ra'], dtype=float)
+            dec = np.array(self.posKeys['dec'], dtype=float)
+            g = self.posKeys['galactic']
+            if g.any():
+                gc = coordinates.SkyCoord(ra[g], dec[g], unit='deg', frame='galactic').icrs
+                ra[g] = gc.ra.deg
+                dec[g] = gc.dec.deg
+            self.coord = coordinates.SkyCoord(ra, dec, unit='deg')
+
+        self.az = None
+        self.el = None
+        self.lstHour = None  # LST hour of every time slot of the grid, flattened
+        self.bodies = None  # {body: (az, el) [rad] of every time slot}, see bodyPositions
+        self.grid = None  # gridKey of the time grid of az and el
+        self.cache = None  # GridCache of the grid, shared with the other tables computed on it
+        self.done = np.zeros(self.npos, dtype=bool)
+        self.revision = 0  # incremented whenever el changes
+        self.derived = OrderedDict()  # (limits, avoid, window): (index, up, lstup)
+
+    def __getstate__(self):
+        # the derived grids and the caches of the grid are not stored
+        state = self.__dict__.copy()
+        state['derived'] = OrderedDict()
+        state['cache'] = None
+        return state
+
+    def __setstate__(self, state):
+        # up and lstup were stored by older versions, for the 25/80 deg limits only
+        state.pop('up', None)
+        state.pop('lstup', None)
+        state.setdefault('lstHour', None)
+        state.setdefault('bodies', None)
+        state.setdefault('revision', 0)
+        state.setdefault('derived', OrderedDict())
+        state.setdefault('cache', None)
+        self.__dict__.update(state)
+
+    def __len__(self):
+        return self.nrows
+
+    @property
+    def up(self):
+        # one row per position for the default limits
+        return self.uptimes()[1]
+
+    @property
+    def lstup(self):
+        return self.uptimes()[2]
+
+    def uptimes(self, limits=None, avoid=None, window=None):
+        # index of every row in the up times, up (n, nx, ny) and LST hours up (n, 24) of the distinct
+        # (position, elevation limits) of the rows, derived from el once per limits (see elevationLimits),
+        # Sun/Moon avoidance radii (see avoidanceRadii) and night window (see windowSlots, default: the
+        # whole grid); with one (min, max) pair for all the instruments there is one row per position,
+        # index is pos
+        if self.el is None:
+            return None, None, None
+        limits = elevationLimits(limits)
+        avoid = avoidanceRadii(avoid)
+        window = None if window is None else (int(window[0]), int(window[1]))
+        key = (limits, avoid, window)
+        with _derivedLock:
+            derived = self.derived.get(key)
+            if derived is not None:
+                self.derived.move_to_end(key)
+        count('limits cache hit' if derived is not None else 'limits cache miss')
+        if derived is not None:
+            return derived
+
+        # the limits of every row from its instrument, and the distinct (position, limits) of the rows
+        minEl, maxEl = limitArrays(limits, self.instrument)
+        pairs, pairIndex = np.unique(np.stack([minEl, maxEl], axis=1), axis=0, return_inverse=True)
+        keys, index = np.unique(np.stack([self.pos, pairIndex.ravel()], axis=1), axis=0, return_inverse=True)
+        index = index.ravel()
+        pos = keys[:, 0]
+        minEl = pairs[keys[:, 1], 0][:, np.newaxis]
+        maxEl = pairs[keys[:, 1], 1][:, np.newaxis]
+
+        n = len(keys)
+        lstHour = self.windowed(self.lstHour.reshape(self.el.shape[1:]), window)
+        nx, ny = lstHour.shape
+        up = np.zeros((n, nx, ny), dtype='int8')
+        lstup = np.zeros((n, 24))
+        lstbins = (lstHour.ravel()[:, np.newaxis] == np.arange(24)).astype(float)
+        for c in range(0, n, SourceTable.chunkSize):
+            chunk = slice(c, c + SourceTable.chunkSize)
+            el = self.windowed(self.el[pos[chunk]], window).reshape(-1, nx * ny)
+            # Mark as 'up' if the elevation is between the limits
+            isUp = np.logical_and(el >= minEl[chunk], el <= maxEl[chunk])
+            if avoid:
+                isUp &= self.clearOf(pos[chunk], avoid, window)
+            up[chunk] = isUp.reshape(-1, nx, ny)
+            # LST uptimes
+            with timer('lst binning'):
+                lstup[chunk] = 0.25 * np.dot(isUp, lstbins)
+        index.flags.writeable = False
+        up.flags.writeable = False
+        lstup.flags.writeable = False
+        with _derivedLock:
+            self.derived[key] = (index, up, lstup)
+            while len(self.derived) > maxLimits:
+                self.derived.popitem(last=False)
+        return index, up, lstup
+
+    def windowed(self, a, window):
+        # a[..., slots, days] of the full-day grid on the slots of the night window, a if window is None
+        if window is None:
+            return a
+        rows, cols = windowSlots(self.el.shape[1:], window)
+        return a[..., rows, cols]
+
+    def clearOf(self, pos, avoid, window=None):
+        # (len(pos), nslots) mask of the slots the positions are farther than the radii from the bodies,
+        # the separations from the az/el of the positions and of the bodies in one broadcast per body
+        az = np.radians(self.windowed(self.az[pos], window).reshape(len(pos), -1))
+        el = np.radians(self.windowed(self.el[pos], window).reshape(len(pos), -1))
+        sinEl = np.sin(el)
+        cosEl = np.cos(el)
+        clear = np.ones(el.shape, dtype=bool)
+        with timer('avoidance'):
+            for body, radius in avoid:
+                bodyAz, bodyEl = (self.windowed(b.reshape(self.el.shape[1:]), window).ravel()
+                                  for b in self.bodies[body])
+                cosSep = sinEl * np.sin(bodyEl) + cosEl * np.cos(bodyEl) * np.cos(az - bodyAz)
+                clear &= cosSep < np.cos(np.radians(radius))
+        return clear
+
+    def elChanged(self):
+        # drop the grids derived from the previous el
+        with _derivedLock:
+            self.revision += 1
+            self.derived.clear()
+
+    def posKey(self, p):
+        k = self.posKeys[p]
+        return 'galactic' if k['galactic'] else 'icrs', float(k['ra']), float(k['dec'])
+
+    def setValue(self, column, i, value):
+        # assign one cell, widening string columns when needed
+        col = getattr(self, column)
+        if col.dtype.kind == 'U' and len(str(value)) > col.dtype.itemsize // 4:
+            col = col.astype('U%d' % len(str(value)))
+            setattr(self, column, col)
+        col[i] = value
+
+    def sources(self, rows=None):
+        rows = range(self.nrows) if rows is None else rows
+        return [Source(self, i) for i in rows]
+
+    def createUptimes(self, context, rows=None, debug=False):
+        # calculate the up times of the positions of rows (default: all) on the time grid of context (the
+        # full-day grid of a night window), each position is transformed once and shared by its duplicates
+        context = fullContext(context)
+        nx = context.astroTime.shape[0]
+        ny = context.astroTime.shape[1]
+        if self.el is None or getattr(self, 'grid', None) != gridKey(context.astroTime):
+            self.grid = gridKey(context.astroTime)
+            self.cache = gridCache(self.grid)
+            self.az = np.zeros((self.npos, nx, ny))
+            self.el = np.zeros((self.npos, nx, ny))
+            self.lstHour = (context.lst.ravel() % 24.).astype('int8')
+            self.bodies = bodyPositions(context, self.cache)
+            self.done[:] = False
+            self.elChanged()
+        if self.cache is None:
+            # read from a projects file
+            self.cache = gridCache(self.grid)
+        need = np.arange(self.npos) if rows is None else np.unique(self.pos[rows])
+        need = need[~self.done[need]]
+
+        # positions already transformed by another table still in use
+        todo = []
+        for p in need:
+            key = self.posKey(p)
+            cached = self.cache.positions.get(key)
+            table = cached[0]() if cached is not None else None
+            if table is None or table.grid != self.grid or not table.done[cached[1]]:
+                if cached is not None and table is None:
+                    self.cache.positions.pop(key, None)
+                todo.append(p)
+            else:
+                self.az[p], self.el[p] = table.az[cached[1]], table.el[cached[1]]
+                self.done[p] = True
+        if len(need) > len(todo):
+            self.elChanged()
+        # positions shared with another table are cache hits, transformed ones misses
+        count('uptimes cache hit', len(need) - len(todo))
+        count('uptimes cache miss', len(todo))
+        if debug:
+            print(('unique positions', self.npos, 'of', self.nrows, 'sources,', len(todo), 'to transform'))
+        if not todo:
+            return
+        todo = np.array(todo)
+
+        # days of the positions already computed on another grid with the same night window
+        missing = np.ones((len(todo), ny), dtype=bool)
+        if context.tiles is not None:
+            with timer('tiles read'):
+                az, el, found = context.tiles.read(context, [self.posKey(p) for p in todo])
+            self.az[todo] = az
+            self.el[todo] = el
+            missing = ~found
+            count('tiles hit', int(found.sum()))
+            count('tiles miss', int(missing.sum()))
+
+        # transform the positions missing the same days together, one row per position
+        patterns, group = np.unique(missing, axis=0, return_inverse=True)
+        progress = Progress('process positions', int(missing.any(axis=1).sum()), enabled=debug)
+        for g, days in enumerate(patterns):
+            days = np.flatnonzero(days)
+            if not len(days):
+                continue
+            members = todo[group.ravel() == g]
+            frame = context.altAz if len(days) == ny else dayFrame(context, days)
+            for c in range(0, len(members), SourceTable.chunkSize):
+                idx = members[c:c + SourceTable.chunkSize]
+                with timer('altaz transform'):
+                    bb = self.coord[idx][:, np.newaxis].transform_to(frame)
+                az = bb.az.deg.reshape(len(idx), nx, len(days))
+                el = bb.alt.deg.reshape(len(idx), nx, len(days))
+                if context.tiles is not None:
+                    # as stored in the tiles: the same uptimes whether the days are read or transformed
+                    az, el = az.astype(context.tiles.dtype), el.astype(context.tiles.dtype)
+                self.az[idx[:, np.newaxis], :, days] = az.transpose(0, 2, 1)
+                self.el[idx[:, np.newaxis], :, days] = el.transpose(0, 2, 1)
+                if context.tiles is not None:
+                    with timer('tiles write'):
+                        context.tiles.write(context, [self.posKey(p) for p in idx], days, az, el)
+                progress.update(len(idx))
+
+        self.done[todo] = True
+        # a weak reference: the grids of a table are freed with it (a reloaded file), not kept by the cache
+        ref = weakref.ref(self)
+        for p in todo:
+            self.cache.positions[self.posKey(p)] = (ref, p)
+        self.elChanged()
+
+
+def sourceColumn(column):
+    # property reading/writing one column of the source table
+    def fget(self):
+        return getattr(self.table, column)[self.index]
+
+    def fset(self, value):
+        self.table.setValue(column, self.index, value)
+
+    return property(fget, fset)
+
+
+def sourceGrid(grid):
+    # read-only view of a per position array of the source table
+    def fget(self):
+        a = getattr(self.table, grid)
+        if a is None:
+            return 0
+        v = a[self.table.pos[self.index]]
+        v.flags.writeable = False
+        return v
+
+    return property(fget)
+
+
+# Source class represnting on astronomical source, a view on one row of a SourceTable
 class Source:
-    astroTime = []  # global variable for the astroTime
-    altAz = 0  # global variable for altitude and azimuth
-    day_start = 0  # start day of observation period
-    day_end = 0  # end day of observation period
-    day_names = []  # names of the days in the observation period
-
-    def __init__(self, name, ra, dec, coordsys, pid, pin, instrument, itime, rank):
-        self.lstup = None
-        self.name = name
-        self.ra = ra
-        self.dec = dec
-        self.coordsys = coordsys
-        self.pId = pid
-        self.piName = pin
-        self.instrument = instrument
-        self.integTime = itime
-        self.rank = rank
-        # create skycoord object based on the coordinate system
-        if coordsys == 'Galactic':
-            self.coord = SkyCoord(self.ra, self.dec, unit='deg', frame='galactic')
-        else:
-            self.coord = SkyCoord(self.ra, self.dec, unit='deg')
-        self.az = 0.
-        self.el = 0.
-        self.up = 0
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    def __reduce__(self):
+        return Source, (self.table, self.index)
 
     def __repr__(self):
         return f"{self.pId},{self.piName},{self.name},{str(self.ra)},{str(self.dec)}"
 
-    def createUptimes(self):
+    name = sourceColumn('name')
+    ra = sourceColumn('ra')
+    dec = sourceColumn('dec')
+    coordsys = sourceColumn('system')
+    pId = sourceColumn('pid')
+    piName = sourceColumn('pi')
+    instrument = sourceColumn('instrument')
+    integTime = sourceColumn('integTime')
+    rank = sourceColumn('rank')
+    az = sourceGrid('az')
+    el = sourceGrid('el')
+    up = sourceGrid('up')
+    lstup = sourceGrid('lstup')
+
+    @property
+    def coord(self):
+        return self.table.coord[self.table.pos[self.index]]
+
+    def coordKey(self):
+        return self.table.posKey(self.table.pos[self.index])
+
+    def uptimes(self, limits=None, avoid=None, window=None):
+        # up (nx, ny) and LST hours up (24) of the source between the elevation limits, away from the Sun/Moon
+        index, up, lstup = self.table.uptimes(limits, avoid, window)
+        if up is None:
+            return 0, 0
+        i = index[self.index]
+        return up[i], lstup[i]
+
+    def createUptimes(self, context):
         # calculate the up times for the source
-        nx = Source.astroTime.shape[0]
-        ny = Source.astroTime.shape[1]
-        self.az = np.zeros((nx, ny))
-        self.el = np.zeros((nx, ny))
-        self.up = np.zeros((nx, ny), dtype='int')
-
-        # flatten the arrays
-        self.az = self.az.flatten()
-        self.el = self.el.flatten()
-        self.up = self.up.flatten()
-
-        # transform the coordinates to altAz
-        bb = self.coord.transform_to(Source.altAz)
-        self.az = bb.az.deg
-        self.el = bb.alt.deg
-
-        # Mark as 'up' if the elevation is between 25 and 80 degrees
-        w = np.where(np.logical_and(self.el >= 25., self.el <= 80))[0]
-        self.up[w] = 1
-
-        # Calculate LST uptimes
-        self.lstup = np.zeros(24)
-        if self.up.any():
-            at = Source.astroTime.flatten()
-            lst = (at[w].sidereal_time('mean').hour % 24.).astype(int)
-            unique, counts = np.unique(lst, return_counts=True)
-            self.lstup[unique] = 0.25 * counts
-        # reshape the arrays back to original dimensions
-        self.az = self.az.reshape(nx, ny)
-        self.el = self.el.reshape(nx, ny)
-        self.up = self.up.reshape(nx, ny)
-
-
-# a project class
+        self.table.createUptimes(context, [self.index])
+
+
+# a project class, a view on the rows of a SourceTable with the same proposal id
 class Project:
-    def __init__(self, pId):
+    __slots__ = ('pId', 'table', 'rows', 'uberUp', '_sources', '_uberUps')
+
+    def __init__(self, pId, table=None, rows=()):
         self.pId = pId
-        self.sourceList = []
+        self.table = table
+        self.rows = np.asarray(rows, dtype=int)
         self.uberUp = 0
+        self._sources = None
+        self._uberUps = OrderedDict()  # (limits, avoid, window, table revision, shape): uberUp
+
+    def __getstate__(self):
+        return self.pId, self.table, self.rows, self.uberUp
+
+    def __setstate__(self, state):
+        if isinstance(state, dict) or (isinstance(state, tuple) and len(state) != 4):
+            raise pickle.UnpicklingError('outdated projects file format')
+        self.pId, self.table, self.rows, self.uberUp = state
+        self._sources = None
+        self._uberUps = OrderedDict()
+
+    @property
+    def sourceList(self):
+        if self._sources is None:
+            self._sources = [] if self.table is None else self.table.sources(self.rows)
+        return self._sources
+
+    @sourceList.setter
+    def sourceList(self, sources):
+        self.table = sources[0].table if sources else self.table
+        self.rows = np.array([s.index for s in sources], dtype=int)
+        self._sources = None
 
     def __str__(self):
         return self.pId
@@ -102,45 +465,60 @@ class Project:
             print(('  ', s.name, s.ra, s.dec, s.coord.to_string('hmsdms'), s.pId))
         print('')
 
-    # this method uses the Source class to generate the el and up
-    # arrays for each source in the project
-    def createUptimes(self):
-        # Create uptimes for all sources in the project
-        for i, s in enumerate(self.sourceList):
-            print(("PID:" + str(self.pId) +
-                   " - Creating uptimes for source " + str(i + 1) +
-                   " of " + str(len(self.sourceList)) + "\r"))
-            s.createUptimes()
-
-    def createUberUp(self, astroTime):
-        # create an 'uber' uptime array combining all sources in the project
-        nx = astroTime.shape[0]
-        ny = astroTime.shape[1]
-        self.uberUp = np.zeros((nx, ny), dtype='int')
-        for s in self.sourceList:
-            self.uberUp += s.up[:, 0:ny]
+    # generate the el and up arrays of the sources in the project
+    def createUptimes(self, context):
+        print(("PID:" + str(self.pId) + " - Creating uptimes for " + str(len(self.rows)) + " sources"))
+        self.table.createUptimes(context, self.rows)
+
+    def createUberUp(self, context, limits=None, avoid=None):
+        # create an 'uber' uptime array combining all sources in the project on the grid of context (a night
+        # window or the full-day grid), once per elevation limits and Sun/Moon avoidance
+        nx = context.astroTime.shape[0]
+        ny = context.astroTime.shape[1]
+        limits = elevationLimits(limits)
+        avoid = avoidanceRadii(avoid)
+        window = context.window
+        key = (limits, avoid, window, getattr(self.table, 'revision', 0), (nx, ny))
+        uberUp = self._uberUps.get(key)
+        if uberUp is None:
+            uberUp = np.zeros((nx, ny), dtype='int')
+            if len(self.rows):
+                index, up, lstup = self.table.uptimes(limits, avoid, window)
+                uberUp += up[index[self.rows], :, 0:ny].sum(axis=0)
+            self._uberUps[key] = uberUp
+            while len(self._uberUps) > maxLimits:
+                self._uberUps.popitem(last=False)
+        self.uberUp = uberUp
+        return uberUp
 
     # make a classical uptimes plot for all the sources in the project
-    def plotUptimes(self, astroTime, day_names, day, source_range):
+    @timed('figure upTimes')
+    def plotUptimes(self, context, day_names, day, source_range, limits=None):
+        astroTime = context.astroTime
         fig = go.Figure()
         date = day_names[day]
         hour_length = len(astroTime[:, day])
         hour_range = (astroTime[hour_length - 1, day].jd - astroTime[0, day].jd) * 24
 
-        ut = astroTime[:, day].sidereal_time('mean').hour
+        ut = context.lst[:, day].copy()
         w = np.where(ut > ut[-1])[0]
         ut[w] = ut[w] - 24.
         ut_range = [ut.min(), ut.max()]
         title = (date + ' - ' + self.pId)
 
         for i, s in enumerate(self.sourceList[source_range[0]:source_range[1]]):
-            fig.add_trace(go.Scatter(x=ut, y=s.el[:, day], name=s.name))
+            fig.add_trace(go.Scatter(x=ut, y=self.table.windowed(s.el, context.window)[:, day], name=s.name))
 
-        # draw a fill shading in above 80 and below 25 deg
-        fig.add_trace(go.Scatter(x=ut_range, y=[80, 80], fill=None, line_color='lightyellow', showlegend=False))
+        # none of the sources shown is up in the shading (per instrument limits)
+        rows = self.rows[source_range[0]:source_range[1]]
+        minEl, maxEl = limitArrays(limits, self.table.instrument[rows] if len(rows) else [''])
+        minEl, maxEl = float(minEl.min()), float(maxEl.max())
+
+        # draw a fill shading in above and below the elevation limits
+        fig.add_trace(go.Scatter(x=ut_range, y=[maxEl, maxEl], fill=None, line_color='lightyellow', showlegend=False))
         fig.add_trace(go.Scatter(x=ut_range, y=[90, 90], fill='tonexty', line_color='lightyellow', showlegend=False))
 
-        fig.add_trace(go.Scatter(x=ut_range, y=[25, 25], fill=None, line_color='lightyellow', showlegend=False))
+        fig.add_trace(go.Scatter(x=ut_range, y=[minEl, minEl], fill=None, line_color='lightyellow', showlegend=False))
         fig.add_trace(go.Scatter(x=ut_range, y=[0, 0], fill='tonexty', line_color='lightyellow', showlegend=False))
 
         fig.update_layout(title=title,
@@ -153,10 +531,12 @@ class Project:
 
         return fig
 
-    def plotUberUp(self, astroTime, day_names, day_start, day_end):
-        # plot the 'uber' uptime for the project
-        if isinstance(self.uberUp, int):
-            self.createUberUp(astroTime)
+    @timed('figure uberUp')
+    def plotUberUp(self, context, day_names, day_start, day_end, limits=None, avoid=None):
+        # plot the 'uber' uptime for the project, the one returned for these limits: another thread can set
+        # self.uberUp for other limits meanwhile
+        astroTime = context.astroTime
+        uberUp = self.createUberUp(context, limits, avoid)
         title = self.pId
         hour_range = len(astroTime[:, 0]) / 4
         t00 = astroTime[0, 0]
@@ -165,11 +545,11 @@ class Project:
         y_val = np.linspace(0, len(astroTime[:, 0]), 10)
         y_text = np.linspace(0 + t00, hour_range + t00, 10).astype(int)
 
-        uberUp = self.uberUp[:, day_start:day_end]
+        uberUp = uberUp[:, day_start:day_end]
 
         fig = px.imshow(uberUp, aspect='auto')
         l = day_end - day_start + 1
-        ll = [day_start + i * int(l / 6.) for i in range(7)]
+        ll = [min(day_start + i * int(l / 6.), day_end) for i in range(7)]
         fig.update_layout(title=title,
                           xaxis=dict(tickmode='array',
                                      tickvals=ll,
@@ -199,44 +579,336 @@ def makeAstroTime(ymd0, ymd1, nhours=13, nsubhours=4, ut0=" 00:00:0", debug=True
                'hours per day every', 1. / float(rowd), 'hour'))
 
     tm0 = datetime.datetime.fromtimestamp(t0).isoformat()
-    ot0 = Time(tm0, format='isot', scale='utc', location=getLMT())
-    dt = TimeDelta(3600 / rowd, format='sec')
-    obstime = ot0 + dt * np.linspace(0, 24 * rowd * ncols - 1, 24 * rowd * ncols)
-    obstime = obstime.reshape(ncols, 24 * rowd)
-    obstime = obstime[:, 0:nrows * rowd].transpose()
+    obstime = gridTime(tm0, nrows, rowd, ncols)
     if debug:
         print(('obs time from', str(obstime[0][0]), 'to', str(obstime[-1][-1])))
     return obstime
 
 
+def makeFullTime(ymd0, ymd1, nsubhours=4, debug=True):
+    # full-day astroTime (24 * nsubhours, days + 1) from ymd0 00:00 UT, the night windows are views of it
+    # (see windowContext); the extra day holds the end of the windows past midnight
+    ymd1 = (datetime.datetime.strptime(ymd1, "%Y/%m/%d") + datetime.timedelta(days=1)).strftime("%Y/%m/%d")
+    return makeAstroTime(ymd0, ymd1, 24, nsubhours, ut0=" 00:00:0", debug=debug)
+
+
+def gridTime(start, nhours, nsubhours, ndays):
+    # astroTime (nhours * nsubhours, ndays) every 1/nsubhours hour for nhours from start (isot) on every day
+    ot0 = atime.Time(start, format='isot', scale='utc', location=getLMT())
+    dt = atime.TimeDelta(3600 / nsubhours, format='sec')
+    obstime = ot0 + dt * np.linspace(0, 24 * nsubhours * ndays - 1, 24 * nsubhours * ndays)
+    obstime = obstime.reshape(ndays, 24 * nsubhours)
+    return obstime[:, 0:nhours * nsubhours].transpose()
+
+
+def gridParameters(astroTime):
+    # (start, nhours, nsubhours, ndays) of a time grid of makeAstroTime, gridTime makes it again (in another process)
+    nx, ny = astroTime.shape
+    step = (astroTime[1, 0] - astroTime[0, 0]).sec if nx > 1 else 3600.
+    nsubhours = int(round(3600. / step))
+    if nx % nsubhours:
+        raise ValueError('time grid of %d slots every %g s is not whole hours' % (nx, step))
+    return astroTime[0, 0].isot, nx // nsubhours, nsubhours, ny
+
+
+def nightWindow(ut0, nhours, nsubhours=4):
+    # (first slot, number of slots) of the night window starting at ut0 (" 03:00:0" or hours) for nhours
+    if isinstance(ut0, str):
+        h, m = ut0.strip().split(':')[:2]
+        ut0 = int(h) + int(m) / 60.
+    return int(round(float(ut0) * nsubhours)) % (24 * nsubhours), int(round(float(nhours) * nsubhours))
+
+
 # sets the LMT as an EarthLocation object
 def getLMT():
     lat = 18.986111 * u.deg
     lon = -97.31458333 * u.deg
     height = 4640. * u.m
-    return EarthLocation(lat=lat, lon=lon, height=height)
+    return coordinates.EarthLocation(lat=lat, lon=lon, height=height)
 
 
-# populate the projects and sources
-def populateProjects(LMT, astroTime, projectsFile='', targetsFile='targets.csv', debug=True):
-    # set the Source global variables
-    Source.astroTime = astroTime
+# use the IERS and leap-second tables bundled with astropy, never download them;
+# startup then does not depend on the network (predictions past the bundled table warn)
+def useOfflineIERS(offline=True):
+    if not offline:
+        return
+    from astropy.utils import data, iers
+    data.conf.allow_internet = False
+    iers.conf.auto_download = False
+    iers.conf.auto_max_age = None
+    iers.conf.iers_degraded_accuracy = 'warn'
+    iers.earth_orientation_table.set(iers.IERS_A.open(iers.IERS_A_FILE))
+    atime.update_leap_seconds([iers.IERS_LEAP_SECOND_FILE])
+
+
+# the time grid, site, AltAz frame and LST hours of a computation, passed to every function using the grid; a
+# context is never modified and holds no cache (see GridCache), so several grids (semesters, custom windows) can
+# be computed and served at once from any thread.
+# tiles: TileCache of the per-day az/el shared by the grids on disk, or None;
+# full, window: the full-day context and night window of a window context (see windowContext), else None
+AvailabilityContext = namedtuple('AvailabilityContext', ['location', 'astroTime', 'altAz', 'lst', 'tiles', 'full',
+                                                         'window'], defaults=(None, None, None))
+
+maxContexts = 8  # number of time grids whose astrometry is kept
+maxWindows = 32  # number of night window contexts kept for reuse by windowContext
+_windows = OrderedDict()  # id(astroTime): window context, the last ones made
+_contextsLock = threading.Lock()
+_gridCaches = weakref.WeakValueDictionary()  # gridKey: GridCache, while a table computed on the grid exists
+_astromCache = None
+
+
+class GridCache:
+    # the caches of one time grid, held by the tables computed on it (SourceTable.cache) and freed with the last
+    # one; positions: the (weak reference to the table, row) of the positions already transformed on the grid,
+    # shared by all the tables; bodies: the Sun/Moon az/el of the slots once computed (see bodyPositions)
+    def __init__(self):
+        self.positions = {}
+        self.bodies = {}
+        self.lock = threading.Lock()
+
+
+def gridCache(grid):
+    # the GridCache of the time grid of gridKey grid
+    with _contextsLock:
+        cache = _gridCaches.get(grid)
+        if cache is None:
+            cache = _gridCaches[grid] = GridCache()
+    return cache
+
+
+def astromCache():
+    # ErfaAstrom computing the astrometry parameters (earth orientation, ut1, polar motion)
+    # of the AltAz frame of a context once, every chunked transform to the frame reuses them
+    global _astromCache
+    if _astromCache is None:
+        class CachedErfaAstrom(coordinates.erfa_astrom.ErfaAstrom):
+            def __init__(self):
+                self.grids = OrderedDict()  # id(obstime): (frame, astrom)
+                self.lock = threading.Lock()
+                self.local = threading.local()  # interpolator of the thread, see interpolatedAstrom
+
+            @staticmethod
+            def sameGrid(frame, f):
+                # transforms get a copy of the frame sharing its obstime and location
+                return (frame.obstime is f.obstime and frame.location is f.location and
+                        all(np.all(getattr(frame, a) == getattr(f, a))
+                            for a in ('pressure', 'temperature', 'relative_humidity', 'obswl')))
+
+            def apco(self, frame):
+                with self.lock:
+                    grid = self.grids.get(id(frame.obstime))
+                if grid is None or not self.sameGrid(frame, grid[0]):
+                    interpolator = getattr(self.local, 'interpolator', None)
+                    if interpolator is not None:
+                        return interpolator.apco(frame)
+                    return super().apco(frame)
+                return grid[1]
+
+            def precompute(self, frame):
+                astrom = super().apco(frame)
+                with self.lock:
+                    self.grids[id(frame.obstime)] = (frame, astrom)
+                    while len(self.grids) > maxContexts:
+                        self.grids.popitem(last=False)
+
+        _astromCache = CachedErfaAstrom()
+        coordinates.erfa_astrom.erfa_astrom.set(_astromCache)
+    return _astromCache
+
+
+@contextmanager
+def interpolatedAstrom(resolution=300.):
+    # the transforms of this thread to frames of other times than the context grids interpolate the
+    # astrometry parameters between support points every resolution [s] (microsecond precision)
+    # instead of computing them for every time
+    cache = astromCache()
+    previous = getattr(cache.local, 'interpolator', None)
+    cache.local.interpolator = coordinates.erfa_astrom.ErfaAstromInterpolator(resolution * u.s)
+    try:
+        yield
+    finally:
+        cache.local.interpolator = previous
+
+
+def makeContext(LMT, astroTime, tiles=None):
+    # UT1-UTC, LST and the AltAz astrometry are computed once per grid
     at = astroTime.flatten()
-    Source.altAz = AltAz(location=LMT, obstime=at)
-    Source.day_start = 0
-    Source.day_end = len(Source.astroTime[0, :]) - 1
+    at.delta_ut1_utc
+    altAz = coordinates.AltAz(location=LMT, obstime=at)
+    lst = at.sidereal_time('mean').hour.reshape(astroTime.shape)
+    astromCache().precompute(altAz)
+    return AvailabilityContext(LMT, astroTime, altAz, lst, tiles)
+
+
+def fullContext(context):
+    # the context of the full-day grid of a window context
+    return context if context.full is None else context.full
+
+
+def windowContext(context, window):
+    # context of a night window (first slot, number of slots, see nightWindow) of the days of a full-day
+    # context, or the full-day context if window is None; its astroTime and LST hours are views of the full
+    # grid, the positions are transformed on the full grid only (see SourceTable.windowed)
+    context = fullContext(context)
+    if window is None:
+        return context
+    window = (int(window[0]), int(window[1]))
+    with _contextsLock:
+        for w in _windows.values():
+            if w.full is context and w.window == window:
+                _windows.move_to_end(id(w.astroTime))
+                return w
+    rows, cols = windowSlots(context.astroTime.shape, window)
+    w = AvailabilityContext(context.location, context.astroTime[rows, cols], None, context.lst[rows, cols],
+                            context.tiles, context, window)
+    with _contextsLock:
+        _windows[id(w.astroTime)] = w
+        while len(_windows) > maxWindows:
+            _windows.popitem(last=False)
+    return w
+
+
+def gridKey(astroTime):
+    # first and last time and shape of a time grid
+    return astroTime[0, 0].isot, astroTime[-1, -1].isot, astroTime.shape
+
+
+def dayFrame(context, days):
+    # AltAz frame of some days of the grid of context
+    at = context.astroTime[:, days].flatten()
+    at.delta_ut1_utc
+    frame = coordinates.AltAz(location=context.location, obstime=at)
+    astromCache().precompute(frame)
+    return frame
+
+
+def bodyPositions(context, cache=None):
+    # {body: (az, el) [rad]} of the Sun and the Moon (topocentric) in every slot of the grid of context (a full-day
+    # context), flattened, computed once per grid with its GridCache
+    bodies = {}
+    if cache is not None:
+        with cache.lock:
+            bodies = dict(cache.bodies)
+    for body in avoidBodies:
+        if body not in bodies:
+            with timer('body positions'):
+                b = coordinates.get_body(body, context.altAz.obstime, context.location).transform_to(context.altAz)
+            bodies[body] = (b.az.rad, b.alt.rad)
+    if cache is not None:
+        with cache.lock:
+            cache.bodies.update(bodies)
+    return bodies
+
+
+# populate the projects and sources
+def projectsFileCurrent(projectsFile, targetsFile):
+    # the projects file exists and was written after the last change of the targets file
+    if len(projectsFile) == 0 or not os.path.isfile(projectsFile):
+        return False
+    return not os.path.isfile(targetsFile) or os.path.getmtime(projectsFile) >= os.path.getmtime(targetsFile)
+
+
+def populateProjects(context, projectsFile='', targetsFile='targets.csv', debug=True):
+    context = fullContext(context)
+    projects = None
+    if projectsFileCurrent(projectsFile, targetsFile):
+        projects = readProjects(projectsFile, astroTime=context.astroTime, debug=debug)
+    count('projects cache miss' if projects is None else 'projects cache hit')
+
+    # generate uptimes or read sources pickle
+    if projects is None:
+        table = readTargets(targetsFile, debug=debug)
+        projects = makeProjects(table)
+        # generate uptimes matrices once per unique position
+        table.createUptimes(context, debug=debug)
+
+        # pickle the list of projects
+        if len(projectsFile) > 0:
+            with timer('cache write'), open(projectsFile, 'wb') as output:
+                try:
+                    pickle.dump(projects, output, pickle.HIGHEST_PROTOCOL, encoding='latin_1')
+                except:
+                    pickle.dump(projects, output, pickle.HIGHEST_PROTOCOL)
+
+    sources = [s for p in projects for s in p.sourceList]
+    return projects, sources
+
+
+def computeProjects(LMT, grid, tiles, projectsFile, targetsFile, debug=True):
+    # process pool worker: generate (and pickle) the projects of one targets file on the time grid of the
+    # gridParameters grid, its context is made again in the worker
+    projects, sources = populateProjects(makeContext(LMT, gridTime(*grid), tiles), projectsFile=projectsFile,
+                                         targetsFile=targetsFile, debug=debug)
+    return projects
+
+
+def populateProjectsConcurrent(context, files, maxWorkers=None, debug=True):
+    # files: list of (projectsFile, targetsFile)
+    # cached projects files are read in a thread pool and the cache misses computed in a
+    # process pool; the results are returned in the order of files
+    context = fullContext(context)
+    results = [None] * len(files)
+    hits = [i for i, (projectsFile, targetsFile) in enumerate(files) if projectsFileCurrent(projectsFile, targetsFile)]
+    if hits:
+        with ThreadPoolExecutor(max_workers=maxWorkers) as pool:
+            for i, projects in zip(hits, pool.map(lambda i: readProjects(files[i][0], astroTime=context.astroTime,
+                                                                            debug=debug), hits)):
+                results[i] = projects
+
+    misses = [i for i in range(len(files)) if results[i] is None]
+    count('projects cache hit', len(files) - len(misses))
+    if len(misses) == 1:
+        results[misses[0]] = populateProjects(context, *files[misses[0]], debug=debug)[0]
+    elif misses:
+        # counted here, the counters of the worker processes are lost
+        count('projects cache miss', len(misses))
+        # the workers get the parameters of the time grid only, not the context
+        grid = gridParameters(context.astroTime)
+        with ProcessPoolExecutor(max_workers=maxWorkers) as pool:
+            futures = {i: pool.submit(computeProjects, context.location, grid, context.tiles, *files[i],
+                                      debug=debug) for i in misses}
+            for i in misses:
+                results[i] = futures[i].result()
+
+    return [(projects, [s for p in projects for s in p.sourceList]) for projects in results]
+
+
+def loadProjectsByFile(context, files, debug=True):
+    # files: list of (file, projectsFile, targetsFile), returns the projects keyed by file in order
+    results = populateProjectsConcurrent(context, [(projectsFile, targetsFile)
+                                                   for f, projectsFile, targetsFile in files], debug=debug)
+    return OrderedDict((f, projects) for (f, projectsFile, targetsFile), (projects, sources) in zip(files, results))
+
+
+def mergeProjects(projects_by_file):
+    # flatten the per file projects into the projects and sources lists
+    projects = []
+    sources = []
+    for projects_ in projects_by_file.values():
+        projects += projects_
+        sources += [s for p in projects_ for s in p.sourceList]
+    return projects, sources
+
+
+def selectProjects(projects, ranks):
+    # the projects of the selected ranks
+    return [p for p in projects if p.sourceList[0].rank in ranks]
 
-    # read targets file
+
+def readTargets(targetsFile, debug=True):
+    # read targets file into a SourceTable
     if debug:
         print('read targets file', targetsFile)
     try:
         # skip the first row
 
-        if np.lib.NumpyVersion(np.version.version) >= '1.14.0':
-            filedata = np.recfromcsv(targetsFile, names=True, autostrip=True, dtype=None, skip_header=0,
-                                     encoding='latin_1')
-        else:
-            filedata = np.recfromcsv(targetsFile, names=True, autostrip=True, dtype=None, skip_header=0, unpack=True)
+        with timer('csv read'):
+            if np.lib.NumpyVersion(np.version.version) >= '1.14.0':
+                filedata = np.recfromcsv(targetsFile, names=True, autostrip=True, dtype=None, skip_header=0,
+                                         encoding='latin_1')
+            else:
+                filedata = np.recfromcsv(targetsFile, names=True, autostrip=True, dtype=None, skip_header=0,
+                                         unpack=True)
         proposalId = filedata['proposal_id']
 
         if 'ranking' in filedata.dtype.fields:
@@ -258,6 +930,7 @@ def populateProjects(LMT, astroTime, projectsFile='', targetsFile='targets.csv',
         priority = filedata['priority']
     except Exception as e:
         print(e)
+    proposalId = list(strColumn(proposalId))
     # prepend 0 to single digit proporsal num
     for i, p in enumerate(proposalId):
         mo = re.search('(?<=-)\d+', p)
@@ -267,88 +940,82 @@ def populateProjects(LMT, astroTime, projectsFile='', targetsFile='targets.csv',
             else:
                 p = p[:mo.start(0)] + mo.group(0)
             proposalId[i] = p
-    # create projects
-    projects = [Project(pid) for pid in list(OrderedDict.fromkeys(proposalId))]
-    # create sources
-    sources = [Source(name, ra, dec, coordsys, pid, pin, inst, itime, rank) for
-               name, ra, dec, coordsys, pid, pin, inst, itime, rank in
-               zip(sourceName, sourceRa, sourceDec, sourceSys, proposalId, piName, instrument, integTime, ranking)]
-
-    # assign sources to projects
-    for p in projects:
-        p.sourceList = [s for s in sources if s.pId == p.pId]
-        # print('sourcelist:', p.listSources())
-    # generate uptimes or read sources pickle
-    if (len(projectsFile) == 0) or not os.path.isfile(projectsFile):
+    return SourceTable(sourceName, sourceRa, sourceDec, sourceSys, proposalId, piName, instrument, integTime, ranking)
 
-        # loop through sources and generate uptimes matrices
-        for i, s in enumerate(sources):
-            print(('process source', i + 1, 'of', len(sources)))
-            s.createUptimes()
 
-        # pickle the list of projects
-        with open(projectsFile, 'wb') as output:
-            try:
-                pickle.dump(projects, output, pickle.HIGHEST_PROTOCOL, encoding='latin_1')
-            except:
-                pickle.dump(projects, output, pickle.HIGHEST_PROTOCOL)
-
-    else:
-        # read projects file
-        if debug:
-            print(('read projects file', projectsFile))
-        with open(projectsFile, 'rb') as input:
-            op, fst, snd = next(pickletools.genops(input))
-            if op.name == 'PROTO':
-                proto = fst
-            else:
-                proto = 2
-            if debug:
-                print(('pickle proto', proto))
-            if sys.version_info.major <= 2 and proto >= 5:
-                print('incompatible pickle proto', proto)
-                print('remove pickle file and regenerate')
-                sys.exit(-1)
-            try:
-                projects = pickle.load(input, encoding='latin1')
-            except:
-                projects = pickle.load(input)
-            # sys.version_info.major = 3
-            if sys.version_info.major > 2 and proto < 5:
-                for p in projects:
-                    p.pId = p.pId.decode()
-                    for i, s in enumerate(p.sourceList):
-                        p.sourceList[i].name = s.name.decode()
-                        p.sourceList[i].pId = s.pId.decode()
-                        p.sourceList[i].piName = s.piName.decode()
-                        p.sourceList[i].instrument = s.instrument.decode()
-                        p.sourceList[i].rank = s.rank.decode()
+def makeProjects(table):
+    # one project view per distinct proposal id, in file order
+    return [Project(pid, table, np.flatnonzero(table.pid == pid)) for pid in OrderedDict.fromkeys(table.pid)]
 
-    return projects, sources
+
+def readProjects(projectsFile, astroTime=None, debug=True):
+    # read projects file, returns None if it has to be regenerated (or was computed on another grid than astroTime)
+    if debug:
+        print(('read projects file', projectsFile))
+    with timer('cache read'), open(projectsFile, 'rb') as input:
+        op, fst, snd = next(pickletools.genops(input))
+        if op.name == 'PROTO':
+            proto = fst
+        else:
+            proto = 2
+        if debug:
+            print(('pickle proto', proto))
+        if sys.version_info.major <= 2 and proto >= 5:
+            print('incompatible pickle proto', proto)
+            print('remove pickle file and regenerate')
+            sys.exit(-1)
+        try:
+            projects = pickle.load(input, encoding='latin1')
+        except Exception as e:
+            # projects files written before the SourceTable format
+            print(('cannot read projects file', projectsFile, e, 'regenerate'))
+            return None
+    for p in projects:
+        if isinstance(p.pId, bytes):
+            p.pId = p.pId.decode()
+    if astroTime is not None and any(getattr(p.table, 'grid', None) != gridKey(astroTime) for p in projects):
+        # the days already computed are read from the tiles when regenerated
+        print(('projects file', projectsFile, 'computed on another time grid, regenerate'))
+        return None
+    if any(p.table is not None and p.table.el is not None and (p.table.lstHour is None or p.table.bodies is None)
+           for p in projects):
+        # written with the up times of fixed limits, without the LST hours or Sun/Moon positions of the grid
+        print(('projects file', projectsFile, 'without the LST hours or Sun/Moon positions of the grid, regenerate'))
+        return None
+    return projects
 
 
-def createSeasonPlot(astroTime, day_names, projects, day_start, day_end):
-    # create the vector of date values
-    dTime = astroTime[0, day_start:day_end]
-    date = []
-    for i in np.arange(len(dTime)):
-        date.append(dTime[i].value[:10])
-    nDates = len(date)
+def seasonData(context, projects, day_start, day_end, progress=None, limits=None, avoid=None):
+    # fraction of the night each project is up between the elevation limits (and away from the Sun/Moon),
+    # per date of the window of context
+    # progress(done, total): called after every project
+    nDates = len(context.astroTime[0, day_start:day_end])
     nProjects = len(projects)
-    seasonData = np.zeros((nProjects, nDates))
-    yl = []
+    data = np.zeros((nProjects, nDates))
     for i, p in enumerate(projects):
-        p.createUberUp(astroTime)
-        up = p.uberUp[:, day_start:day_end]
+        up = p.createUberUp(context, limits, avoid)[:, day_start:day_end]
         timeUp = np.zeros(nDates)
         for j in np.arange(nDates):
             timeUp[j] = np.count_nonzero(up[:, j]) / float(len(up[:, j]))
-        seasonData[i, :] = timeUp
-        yl.append(p.pId)
+        data[i, :] = timeUp
+        if progress is not None:
+            progress(i + 1, nProjects)
+    return data
+
+
+@timed('figure season')
+def createSeasonPlot(context, day_names, projects, day_start, day_end, progress=None, data=None, limits=None,
+                     avoid=None):
+    # data: seasonData of the projects, computed if not given
+    astroTime = context.astroTime
+    if data is None:
+        data = seasonData(context, projects, day_start, day_end, progress=progress, limits=limits, avoid=avoid)
+    nProjects = len(projects)
+    yl = [p.pId for p in projects]
     title = str(astroTime[0, day_start])[:10] + " -- " + str(astroTime[-1, day_end])[:10]
-    fig = px.imshow(seasonData, aspect='auto')
+    fig = px.imshow(data, aspect='auto')
     l = len(day_names[day_start:day_end + 1])
-    ll = [day_start + i * int(l / 6.) for i in range(7)]
+    ll = [min(day_start + i * int(l / 6.), day_end) for i in range(7)]
     fig.update_layout(title=title,
                       xaxis=dict(tickmode='array',
                                  tickvals=ll,
@@ -364,38 +1031,65 @@ def createSeasonPlot(astroTime, day_names, projects, day_start, day_end):
     return fig
 
 
-def createPressurePlot(projects, ranks, prjs, prjs_dict, day_start, day_end):
-    # prjs: csv files
-    # prjs_dict
-    # projects: distinct projects' name
-    index = {'RSR': 0, 'SEQUOIA': 1, 'MSIP1': 2, 'B4R': 3, 'TolTEC': 4}
-    factor = {'RSR': 1.0, 'SEQUOIA': 1.0, 'MSIP1': 1.0, 'B4R': 1.0, 'TolTEC': 1.0}
-    allranks = ['A', 'B', 'C', 'D']
-    tot = 0
-    itime = np.zeros((len(index), len(allranks), 24))  # 4x4x24
-    for prj in prjs:
-        for k in list(prjs_dict.keys()):
-            # k in ['UM','US','MX','TOT']
-            if k in prj[0:2].upper():
-                tot += prjs_dict[k]
-    mult = tot * prjs_dict['TOT']
+# instruments and ranks of the pressure plot, and the factor applied to their integration times
+pressureIndex = {'RSR': 0, 'SEQUOIA': 1, 'MSIP1': 2, 'B4R': 3, 'TolTEC': 4}
+pressureFactor = {'RSR': 1.0, 'SEQUOIA': 1.0, 'MSIP1': 1.0, 'B4R': 1.0, 'TolTEC': 1.0}
+pressureRanks = ['A', 'B', 'C', 'D']
+
 
+def pressureData(projects, ranks, progress=None, limits=None, avoid=None, window=None):
+    # requested hours per instrument, rank and LST hour: 5x4x24, spread over the LST hours of the night
+    # window the sources are between the elevation limits (and away from the Sun/Moon);
+    # progress(done, total): called after every project
+    index = pressureIndex
+    factor = pressureFactor
+    allranks = pressureRanks
+    itime = np.zeros((len(index), len(allranks), 24))
     for i, p in enumerate(projects):
+        rows, up, lstups = p.table.uptimes(limits, avoid, window)
         for j, s in enumerate(p.sourceList):
             for rank in ranks:
                 if s.rank == rank:
-                    sum = np.sum(s.lstup)
+                    lstup = lstups[rows[s.index]]
+                    sum = np.sum(lstup)
                     if sum != 0:
-                        ss = s.lstup * s.integTime * factor[s.instrument] / sum
+                        ss = lstup * s.integTime * factor[s.instrument] / sum
                         # print (s.integTime * factor[s.instrument], sum, np.sum(ss))
 
                         inst = index[s.instrument]
                         itime[inst][allranks.index(rank)] += ss
+        if progress is not None:
+            progress(i + 1, len(projects))
+    return itime
+
+
+@timed('figure pressure')
+def createPressurePlot(context, projects, ranks, prjs, prjs_dict, day_start, day_end, progress=None, data=None,
+                       limits=None, avoid=None):
+    # prjs: csv files
+    # prjs_dict
+    # projects: distinct projects' name
+    # data: pressureData of the projects, computed if not given
+    index = pressureIndex
+    factor = pressureFactor
+    allranks = pressureRanks
+    tot = 0
+    for prj in prjs:
+        for k in list(prjs_dict.keys()):
+            # k in ['UM','US','MX','TOT']
+            if k in prj[0:2].upper():
+                tot += prjs_dict[k]
+    mult = tot * prjs_dict['TOT']
+    if data is None:
+        data = pressureData(projects, ranks, progress=progress, limits=limits, avoid=avoid, window=context.window)
+    itime = data
+    astroTime = context.astroTime
 
-    title = str(Source.astroTime[0, day_start])[:10] + " -- " + str(Source.astroTime[-1, day_end])[:10]
+    title = str(astroTime[0, day_start])[:10] + " -- " + str(astroTime[-1, day_end])[:10]
 
     fig = go.Figure(data=[go.Scatter(x=[], y=[])])
 
+    colors = color_constants.colors
     cols = [
         [
             colors['red1'],
@@ -446,8 +1140,7 @@ def createPressurePlot(projects, ranks, prjs, prjs_dict, day_start, day_end):
                     fig.add_bar(y=itime[i][j], name=label, marker={'color': 24 * [cols[i][j]]})  # showlegend=False)
                 bot = bot + itime[i][j]
     lstup = np.zeros(24)
-    at = Source.astroTime[:, day_start: day_end + 1].flatten()
-    lst = (at.sidereal_time('mean').hour % 24.).astype(int)
+    lst = (context.lst[:, day_start: day_end + 1].ravel() % 24.).astype(int)
     unique, counts = np.unique(lst, return_counts=True)
     lstup[unique] = 0.25 * counts
 
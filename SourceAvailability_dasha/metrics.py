@@ -0,0 +1,129 @@
+"""Callback latency, payload size and cache hit metrics of the Dash app
+
+    Recording a sample is a lock, two additions and a deque append; the
+    quantiles are only computed when the text report is scraped."""
+import json
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from functools import wraps
+
+import numpy as np
+
+from . import profiling
+
+quantiles = (0.5, 0.95, 0.99)
+_lock = threading.Lock()
+summaries = OrderedDict()  # (metric, labels): Summary
+
+
+class Summary:
+    # count, sum and the last samples of a metric
+    def __init__(self, maxlen=4096):
+        self.count = 0
+        self.sum = 0.
+        self.samples = deque(maxlen=maxlen)
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.samples.append(value)
+
+    def quantiles(self, qs=quantiles):
+        if not self.samples:
+            return [float('nan')] * len(qs)
+        return list(np.quantile(np.array(self.samples), qs))
+
+
+def observe(metric, value, **labels):
+    key = (metric, tuple(sorted(labels.items())))
+    with _lock:
+        s = summaries.get(key)
+        if s is None:
+            s = summaries[key] = Summary()
+        s.observe(value)
+
+
+@contextmanager
+def timer(metric, **labels):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(metric, time.perf_counter() - t0, **labels)
+
+
+def timed_callback(name):
+    # decorator recording the latency of a dash callback
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer('callback_latency_seconds', callback=name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_response(request, response, tab_input='tabs.active_tab', output='tab-content'):
+    # flask after_request hook: size of the dash responses updating the tab content, per tab
+    if not request.path.endswith('_dash-update-component') or response.direct_passthrough:
+        return response
+    body = request.get_json(silent=True) or {}
+    if output not in str(body.get('output', '')):
+        return response
+    # the polls of a job list the tab content as an output, only the responses updating it are counted
+    if response.status_code != 200 or f'"{output}"'.encode() not in response.get_data():
+        return response
+    tab = 'unknown'
+    for item in (body.get('inputs') or []) + (body.get('state') or []):
+        if isinstance(item, dict) and f"{item.get('id')}.{item.get('property')}" == tab_input:
+            tab = str(item.get('value'))
+    observe('payload_bytes', response.calculate_content_length() or 0, tab=tab)
+    return response
+
+
+def format_labels(labels, **extra):
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}={json.dumps(str(v))}' for k, v in items) + '}'
+
+
+def metrics_text():
+    # prometheus style text report
+    lines = []
+    with _lock:
+        items = [(key, s.count, s.sum, s.quantiles()) for key, s in summaries.items()]
+    seen = set()
+    for (metric, labels), n, total, qs in items:
+        if metric not in seen:
+            lines.append(f'# TYPE {metric} summary')
+            seen.add(metric)
+        for q, v in zip(quantiles, qs):
+            lines.append(f'{metric}{format_labels(labels, quantile=q)} {v:.6g}')
+        lines.append(f'{metric}_count{format_labels(labels)} {n}')
+        lines.append(f'{metric}_sum{format_labels(labels)} {total:.6g}')
+
+    # cache hit ratios from the '<cache> hit' / '<cache> miss' counters of the pipeline
+    with profiling._lock:
+        counters = dict(profiling.counters)
+        timers = dict(profiling.timers)
+    caches = sorted(set(k[:-4] for k in counters if k.endswith(' hit')) |
+                    set(k[:-5] for k in counters if k.endswith(' miss')))
+    if caches:
+        lines.append('# TYPE cache_hit_ratio gauge')
+    for c in caches:
+        hit = counters.get(c + ' hit', 0)
+        miss = counters.get(c + ' miss', 0)
+        labels = format_labels((), cache=c[:-6] if c.endswith(' cache') else c)
+        ratio = hit / float(hit + miss) if hit + miss else float('nan')
+        lines.append(f'cache_hit_ratio{labels} {ratio:.6g}')
+        lines.append(f'cache_hits_total{labels} {hit}')
+        lines.append(f'cache_misses_total{labels} {miss}')
+    if timers:
+        lines.append('# TYPE pipeline_seconds_total counter')
+    for name, (n, total, tmax) in timers.items():
+        lines.append(f'pipeline_seconds_total{format_labels((), timer=name)} {total:.6g}')
+        lines.append(f'pipeline_calls_total{format_labels((), timer=name)} {n}')
+    return '\n'.join(lines) + '\n'
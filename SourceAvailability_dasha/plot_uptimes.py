@@ -1,71 +1,288 @@
 import dash_bootstrap_components as dbc
-from dash import html, dcc, Output, Input, ctx, no_update
+from dash import html, dcc, Output, Input, State, ctx, no_update
 from dash_component_template import ComponentTemplate
-import plotly.graph_objs as go
-import os
-import yaml
-from .make_availability import getLMT, makeAstroTime, populateProjects, createPressurePlot, createSeasonPlot
+import threading
+from collections import OrderedDict
+from flask import Response, jsonify, request
+from . import api, jobs, metrics, watcher
+from .bundle import latest_bundle, load_bundle
+from .config import all_files, all_ranks, avoidance_radii, bundle_dir, data_version, default_limits, \
+    elevation_limits, jobs_dir, load_config, night_window, prjs_dict, project_files, reload_interval, time_grid
+from .make_availability import avoidanceRadii, createPressurePlot, createSeasonPlot, fullContext, loadProjectsByFile, \
+    mergeProjects, pressureData, seasonData, selectProjects, windowContext
+from .profiling import count, lazy_module, report, stage
+from .up_index import UpIndex
+
+go = lazy_module('plotly.graph_objs')
+atime = lazy_module('astropy.time')
 
 # run dasha -e source_availability_web
-# reading the start and end date from yaml file
-
-config_file = os.environ.get('SOURCE_CONFIG_PATH', None)
-if config_file is None:
-    print('please setup config_file')
-else:
-    with open(config_file, 'r') as fo:
-        config = yaml.safe_load(fo)
-
-start_date = config['date']['start_date']
-end_date = config['date']['end_date']
-nhours = config['date']['nhours']
-nsubhours = config['date']['nsubhours']
-prjs = config['project']['prjs']
-filename_dict = config['project']['filename_dict']
-semester = config['date']['semester']
-# set up LMT
-LMT = getLMT()
+# the config, time grid and projects are set up on first use (see time_grid_state and
+# project_state) so that importing this module stays cheap; the projects are loaded in
+# a background thread once the layout is built (or read from the latest precomputed bundle),
+# and a changed targets file or a newer bundle is loaded in the background (see reload_file
+# and reload_bundle)
 
 title = html.H1('LMT Source Availability 2025-S1', className='mb-3 mt-2', style={'text-align': 'center'})
-# start date, end date, nhours: how many hours a day, nsubhours: how many per hour, ut0: start time
 
-astroTime = makeAstroTime(start_date, end_date, nhours, nsubhours, ut0=" 03:00:0")
-
-day_names = [str(a)[:10] for a in astroTime[0, :]]
-days = len(day_names)
-
-efficiency = 0.5
-prjs_dict = {'UM': 0.15, 'US': 0.15, 'MX': 0.7, 'TOT': efficiency}
 # source_range to show and the total sources number for each project
 global source_range, source_len
 nsources = 6
 source_range = [0, nsources]
 source_len = nsources
-# populate the projects list
-
-def make_project(prjs):
-    projects = []
-    sources = []
-    for prj in prjs:
-        prj = prj.upper()
-        if prj in filename_dict:
-            targetsFile = filename_dict[prj]
-            projectsFile = targetsFile.split('.')[0] + '.pkl'
-            print(('targetsFile', targetsFile, 'projectsFile', projectsFile))
-            projects_, sources_ = populateProjects(LMT, astroTime, projectsFile=projectsFile, targetsFile=targetsFile,
-                                                   debug=True)
-            projects += projects_
-            sources += sources_
-    return projects, sources
-
 
+_state = {}
+_state_lock = threading.RLock()
+# keys of the time grid state copied into every projects snapshot
+grid_keys = ('config', 'semester', 'context', 'astroTime', 'day_names', 'days', 'limits', 'avoid', 'window')
 prjs = ['MX', 'US', 'UM']
-projects, sources = make_project(prjs)
-print('projects', projects[:2])
-print('sources', sources[:2])
-
-# # get unique project name
-# master_projects = projects
+_memo = OrderedDict()  # (stage, inputs): intermediate result of the callbacks
+memo_size = 64
+_snapshots = OrderedDict()  # data version: projects snapshot, the last ones (see set_snapshot)
+snapshot_count = 3
+
+
+def time_grid_state():
+    # reading the start and end date from yaml file, and the time grid of the night window of the config
+    with _state_lock:
+        if 'astroTime' not in _state:
+            with stage('read config'):
+                config = load_config()
+            with stage('time grid'):
+                context = time_grid(config)
+                day_names = [str(a)[:10] for a in context.astroTime[0, :]]
+            _state.update({
+                'config': config,
+                'semester': config['date']['semester'],
+                'context': context,
+                'astroTime': context.astroTime,
+                'day_names': day_names,
+                'days': len(day_names),
+                'limits': default_limits(config),
+                'avoid': avoidance_radii(config),
+                'window': context.window,
+            })
+    return _state
+
+
+def project_state():
+    # snapshot of the time grid state and of the projects of all the files with their up index, loaded once;
+    # a reload replaces the whole snapshot, a caller holding one keeps a consistent view of the projects
+    with _state_lock:
+        if 'snapshot' not in _state:
+            config = time_grid_state()['config']
+            bundles = bundle_dir(config)
+            path = latest_bundle(bundles) if bundles else None
+            # populate the projects list
+            with stage('projects'):
+                projects_by_file = version = None
+                if path is not None:
+                    try:
+                        projects_by_file, version = load_bundle_projects(path)
+                    except ValueError as e:
+                        print(('cannot use bundle', path, e))
+                if projects_by_file is None:
+                    projects_by_file = load_projects_by_file(prjs)
+            set_snapshot(projects_snapshot(projects_by_file, version))
+            print('projects', _state['snapshot']['projects'][:2])
+            print('sources', _state['snapshot']['sources'][:2])
+            report()
+            interval = reload_interval(config)
+            if interval and bundles:
+                _state['watcher'] = watcher.BundleWatcher(bundles, reload_bundle, path, interval).start()
+            elif interval:
+                _state['watcher'] = watcher.CatalogueWatcher(project_files(config, prjs), reload_file,
+                                                             interval).start()
+        return _state['snapshot']
+
+
+def load_bundle_projects(path):
+    # projects (memory-mapped grids) and version of a bundle computed on the time grid of the config
+    manifest, projects_by_file = load_bundle(path, _state['context'])
+    return OrderedDict((f, projects_by_file[f]) for f in prjs if f in projects_by_file), manifest['version']
+
+
+def projects_snapshot(projects_by_file, version=None):
+    # version: of the bundle the projects are read from, else from the config and the targets files
+    projects, sources = mergeProjects(projects_by_file)
+    # inverted (day, slot) -> sources index for the "what is up now" queries
+    with stage('up index'):
+        # on the full-day grid, the queries are not limited to the night window; with the elevation limits
+        # (per instrument) and Sun/Moon avoidance of the config, as the availability plots
+        up_index = UpIndex.fromProjects(fullContext(_state['context']), projects_by_file,
+                                        elevation_limits(_state['config']), avoidance_radii(_state['config']))
+    snapshot = {k: _state[k] for k in grid_keys}
+    snapshot.update({
+        'projects_by_file': projects_by_file,
+        'projects': projects,
+        'sources': sources,
+        'up_index': up_index,
+        # part of the memo and job keys, and ETag of the api routes
+        'data_version': version or data_version(_state['config'], project_files(_state['config'], prjs)),
+    })
+    return snapshot
+
+
+def set_snapshot(snapshot):
+    # make snapshot the current one; the last snapshot_count are kept for the jobs submitted against them
+    with _state_lock:
+        _state['snapshot'] = snapshot
+        _snapshots[snapshot['data_version']] = snapshot
+        _snapshots.move_to_end(snapshot['data_version'])
+        while len(_snapshots) > snapshot_count:
+            _snapshots.popitem(last=False)
+
+
+def versioned_state(version=None):
+    # the snapshot of a data version if it is still kept, else the current one
+    current = project_state()
+    with _state_lock:
+        return _snapshots.get(version, current) if version is not None else current
+
+
+def reload_file(f, projectsFile, targetsFile):
+    # recompute the projects of a changed targets file (in the watcher thread, the other files are kept) and
+    # swap a new snapshot in; the callbacks and jobs started before keep the previous one
+    with stage('reload'):
+        projects = loadProjectsByFile(_state['context'], [(f, projectsFile, targetsFile)], debug=True)[f]
+        projects_by_file = OrderedDict(project_state()['projects_by_file'])
+        projects_by_file[f] = projects
+        # only the watcher thread replaces the snapshot
+        snapshot = projects_snapshot(projects_by_file)
+    set_snapshot(snapshot)
+    print(('reloaded', f, targetsFile, 'version', snapshot['data_version']))
+
+
+def reload_bundle(path):
+    # switch to a newer bundle (in the watcher thread): it is loaded while the current one serves the
+    # sessions, then the snapshot is swapped
+    with stage('reload'):
+        projects_by_file, version = load_bundle_projects(path)
+        snapshot = projects_snapshot(projects_by_file, version)
+    set_snapshot(snapshot)
+    print(('switched to bundle', path))
+
+
+def load_projects_by_file(prjs):
+    # load the projects of every selected file, keyed by the file name in the requested order;
+    # the files are read (cache hits) or computed (cache misses) concurrently
+    state = time_grid_state()
+    files = project_files(state['config'], prjs)
+    for f, projectsFile, targetsFile in files:
+        print(('targetsFile', targetsFile, 'projectsFile', projectsFile))
+    return loadProjectsByFile(state['context'], files, debug=True)
+
+
+def memoized(key, func):
+    # server-side memo of the callback stages, the least recently used results are dropped
+    with _state_lock:
+        if key in _memo:
+            _memo.move_to_end(key)
+            count('stages cache hit')
+            return _memo[key]
+    count('stages cache miss')
+    value = func()
+    with _state_lock:
+        _memo[key] = value
+        while len(_memo) > memo_size:
+            _memo.popitem(last=False)
+    return value
+
+
+# the stages of the tab figures: file selection -> project set, rank filter -> selected projects,
+# date window, elevation limits, Sun/Moon avoidance and night window -> aggregates, then the figure;
+# each one keyed by its inputs only
+# the stages take the projects of a snapshot (default: the current one, see project_state), the memo
+# keys include its data version
+def project_set(files, snapshot=None):
+    snapshot = snapshot or project_state()
+    projects_by_file = snapshot['projects_by_file']
+    return memoized(('projects', snapshot['data_version'], tuple(files)),
+                    lambda: mergeProjects(OrderedDict((f, projects_by_file[f]) for f in files
+                                                      if f in projects_by_file)))
+
+
+def selected_projects(files, ranks, snapshot=None):
+    snapshot = snapshot or project_state()
+    return memoized(('selected', snapshot['data_version'], tuple(files), tuple(ranks)),
+                    lambda: selectProjects(project_set(files, snapshot)[0], ranks))
+
+
+def pressure_aggregates(files, ranks, limits, avoid, window, progress=None, snapshot=None):
+    # the requested hours do not depend on the date window
+    snapshot = snapshot or project_state()
+    return memoized(('pressure', snapshot['data_version'], tuple(files), tuple(ranks), tuple(limits), tuple(avoid),
+                     tuple(window)),
+                    lambda: pressureData(selected_projects(files, ranks, snapshot), ranks, progress=progress,
+                                         limits=limits, avoid=avoid, window=window))
+
+
+def window_context(window):
+    # context of a night window, a view of the full-day grid
+    return windowContext(project_state()['context'], window)
+
+
+def season_aggregates(files, ranks, start, end, limits, avoid, window, progress=None, snapshot=None):
+    context = window_context(window)
+    snapshot = snapshot or project_state()
+    return memoized(('season', snapshot['data_version'], tuple(files), tuple(ranks), start, end, tuple(limits),
+                     tuple(avoid), tuple(window)),
+                    lambda: seasonData(context, selected_projects(files, ranks, snapshot), start, end,
+                                       progress=progress, limits=limits, avoid=avoid))
+
+
+def job_queue():
+    # background jobs of the tab figures, see jobs.py
+    with _state_lock:
+        if 'jobs' not in _state:
+            config = time_grid_state()['config']
+            _state['jobs'] = jobs.JobQueue(jobs_dir(config), workers=(config.get('jobs', None) or {}).get('workers', 2))
+    return _state['jobs']
+
+
+# the collapsed controls of each tab: is_date, is_rank, is_project, is_source
+tab_controls = {
+    'pressure': (True, True, False, False),
+    'season': (False, True, False, False),
+    'upTimes': (False, True, True, True),
+    'uberUp': (True, True, True, False),
+}
+
+
+@jobs.register('tab')
+def tab_job(progress, at, files, ranks, day, start, end, project_index, source_range, limits, avoid, window,
+            version=None):
+    # number of sources of the project and figure of a tab
+    # version: data version of the projects when submitted, a reload gives the same selection another job; a job
+    # queued before a reload is computed on the snapshot it was submitted against, or on the current projects once
+    # that one is not kept anymore
+    snapshot = versioned_state(version)
+    context = window_context(window)
+    day_names = _state['day_names']
+    progress(0, 1, 'selecting projects')
+    projects = selected_projects(files, ranks, snapshot)
+    if not projects:
+        return None, go.Figure().to_dict()
+    if project_index is None or project_index >= len(projects):
+        project_index = 0
+    source_len = len(projects[project_index].sourceList)
+
+    def figure_progress(done, total):
+        progress(done, total, f'{at}: {done} of {total} projects')
+
+    if at == 'pressure':
+        figure_plot = createPressurePlot(context, projects, ranks, files, prjs_dict, start, end,
+                                         data=pressure_aggregates(files, ranks, limits, avoid, window,
+                                                                  figure_progress, snapshot))
+    elif at == 'season':
+        figure_plot = createSeasonPlot(context, day_names, projects, start, end,
+                                       data=season_aggregates(files, ranks, start, end, limits, avoid, window,
+                                                              figure_progress, snapshot))
+    elif at == 'upTimes':
+        figure_plot = projects[project_index].plotUptimes(context, day_names, day, source_range, limits)
+    else:
+        figure_plot = projects[project_index].plotUberUp(context, day_names, start, end, limits, avoid)
+    return source_len, figure_plot.to_dict()
 
 
 class ControlContent(ComponentTemplate):
@@ -93,8 +310,15 @@ class ControlContent(ComponentTemplate):
             dbc.Checklist(options=options, id=id, value=value, inline=True)
         ]
 
+    @staticmethod
+    def create_number(label, id, value, max=90, step=1):
+        return dbc.InputGroup([
+            dbc.InputGroupText(label, style={'font-size': 14, 'width': 100}),
+            dbc.Input(id=id, type='number', min=0, max=max, step=step, value=value, debounce=True)
+        ])
+
     @classmethod
-    def build(cls, day_names, days, projects):
+    def build(cls, day_names, days, projects, limits, avoid, ut_start, nhours):
         source_select = [
             dbc.Label('Select source:', size='md'),
             html.Div('Sources:', id='sources'),
@@ -109,7 +333,10 @@ class ControlContent(ComponentTemplate):
         date_select = [
             dbc.Label('Select start and end date:', size='md'),
             cls.create_select('Start Day', 'start_day', date_options, day_names[0], 0),
-            cls.create_select('End Day', 'end_day', date_options, day_names[-1], days - 1)
+            cls.create_select('End Day', 'end_day', date_options, day_names[-1], days - 1),
+            dbc.Label('Night window [UT hours]:', size='md'),
+            cls.create_number('Start UT', 'ut_start', ut_start, max=23.75, step=0.25),
+            cls.create_number('Hours', 'ut_hours', nhours, max=24, step=0.25)
         ]
 
         project_select = [
@@ -118,7 +345,7 @@ class ControlContent(ComponentTemplate):
             dbc.Label('Select project name:', size='md'),
             dcc.Dropdown(
                 options=[{'label': str(p), 'value': i} for i, p in enumerate(projects)],
-                id='project_select', placeholder=str(projects[0]), value=0
+                id='project_select', placeholder=str(projects[0]) if projects else 'Project', value=0
             )
         ]
 
@@ -128,18 +355,29 @@ class ControlContent(ComponentTemplate):
                         cls.create_checklist('Select project rank:', 'rank-list-input',
                                              [{'label': x, 'value': x} for x in ['A', 'B', 'C', 'D']], ['A'])
 
+        limits_select = [
+            dbc.Label('Elevation limits [deg]:', size='md'),
+            cls.create_number('Min', 'min_el', limits[0]),
+            cls.create_number('Max', 'max_el', limits[1]),
+            dbc.Label('Avoidance radius [deg]:', size='md'),
+            cls.create_number('Sun', 'sun_radius', avoid['sun'], max=180),
+            cls.create_number('Moon', 'moon_radius', avoid['moon'], max=180)
+        ]
+
         return {
             'source_select': source_select,
             'date_select': date_select,
             'project_select': project_select,
-            'project_ranks': project_ranks
+            'project_ranks': project_ranks,
+            'limits_select': limits_select
         }
 
 
 def create_control_layout(content):
     return dbc.Row([dbc.CardGroup([
         dbc.Card(dbc.Collapse(dbc.CardBody(content['date_select']), id='is_date', is_open=True), color='white', outline=True),
-        dbc.Card(dbc.Collapse(dbc.CardBody(content['project_ranks']), id='is_rank', is_open=True), color='white', outline=True),
+        dbc.Card(dbc.Collapse(dbc.CardBody(content['project_ranks'] + content['limits_select']), id='is_rank',
+                              is_open=True), color='white', outline=True),
         dbc.Card(dbc.Collapse(dbc.CardBody(content['project_select']), id='is_project', is_open=False), color='white', outline=True),
         dbc.Card(dbc.Collapse(dbc.CardBody(content['source_select']), id='is_source', is_open=False), color='white', outline=True)
     ], className='mb-3')])
@@ -171,12 +409,62 @@ class SourceAvailability(ComponentTemplate):
             ]
         ], id='tabs', active_tab='pressure', className='mt-2 mb-2'))
 
-        control_content = ControlContent.build(day_names, days, projects)
+        state = time_grid_state()
+        day_names = state['day_names']
+        days = state['days']
+        # the project options are filled in by select_ranks
+        nsubhours = state['config']['date']['nsubhours']
+        control_content = ControlContent.build(day_names, days, [], state['limits'], state['avoid'],
+                                               state['window'][0] / nsubhours, state['window'][1] / nsubhours)
         control = create_control_layout(control_content)
 
         body_container.child(html.Div(control, id='control-content'))
+        # inputs of the callback stages and progress of the background job computing the tab figure
+        for store in ('project-set', 'selected-projects', 'aggregates', 'job'):
+            body_container.child(dcc.Store(id=store))
+        body_container.child(dcc.Interval(id='job-poll', interval=500, disabled=True))
+        body_container.child(dbc.Collapse(dbc.Progress(id='job-progress', value=0, striped=True, animated=True),
+                                          id='is_job', is_open=False))
         body_container.child(html.Div(id='tab-content'))
 
+        # load the projects in the background while the server starts listening
+        threading.Thread(target=project_state, daemon=True).start()
+
+        # text metrics: callback latencies, tab payload sizes and cache hit ratios
+        app.server.after_request(lambda response: metrics.record_response(request, response))
+
+        @app.server.route('/metrics')
+        def metrics_route():
+            return Response(metrics.metrics_text(), mimetype='text/plain')
+
+        # json route: which sources are up in the next hours
+        # e.g. /api/up_now?time=2025-03-02T05:00:00&hours=1&ranks=A&instruments=TolTEC&files=UM,US
+        @app.server.route('/api/up_now')
+        def up_now():
+            up_index = project_state()['up_index']
+
+            def split_arg(name):
+                value = request.args.get(name, None)
+                return value.split(',') if value else None
+
+            when = request.args.get('time', None)
+            try:
+                when = atime.Time(when, scale='utc') if when else atime.Time.now()
+                hours = api.float_arg('hours')
+                hours = 1. if hours is None else hours
+                if not 0 < hours <= 24:
+                    raise ValueError(f'hours: not in (0, 24]: {hours:g}')
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            mode = request.args.get('mode', 'any')
+            w = up_index.queryNow(when, hours, ranks=split_arg('ranks'), instruments=split_arg('instruments'),
+                                  files=split_arg('files'), mode=mode)
+            return jsonify({'time': when.isot, 'hours': hours, 'mode': mode,
+                            'sources': [up_index.describe(i) for i in w]})
+
+        # json/Arrow routes: availability of the sources and projects for a date window, see api.py
+        api.register(app.server, project_state)
+
         # select the source range
         @app.callback(
             Output('sources', 'children'),
@@ -184,6 +472,7 @@ class SourceAvailability(ComponentTemplate):
             Input('btn-prev', 'n_clicks'),
             Input('btn-next', 'n_clicks')
         )
+        @metrics.timed_callback('source_select')
         def source_select(all, prev, next):
             global source_range, source_len
             message = f'Source {source_range[0] + 1} to {source_range[1]}'
@@ -217,65 +506,136 @@ class SourceAvailability(ComponentTemplate):
             Output('end_day', 'options'),
             Input('start_day', 'value')
         )
+        @metrics.timed_callback('set_day')
         def set_day(start_day):
             end_day_options = [
                 {'label': day_names[i], 'value': i} for i in range(int(start_day) + 1, days)
             ]
             return end_day_options
 
-        # select the rank and tab output: the project_name and tab-content
+        # the stages only pass their inputs down (the results are memoized server-side), a stage whose
+        # inputs did not change does not update its store and the stages below it are not called
+        @app.callback(
+            Output('project-set', 'data'),
+            Input('file-list-input', 'value'),
+            State('project-set', 'data')
+        )
+        @metrics.timed_callback('select_files')
+        def select_files(prjs, current):
+            files = [f for f in all_files if f in (prjs or [])]
+            return no_update if files == current else files
+
         @app.callback(
+            Output('selected-projects', 'data'),
             Output('project_select', 'options'),
-            # Output('control-content', 'children'),
+            Input('project-set', 'data'),
+            Input('rank-list-input', 'value'),
+            State('selected-projects', 'data')
+        )
+        @metrics.timed_callback('select_ranks')
+        def select_ranks(files, selected_ranks, current):
+            if files is None:
+                return no_update, no_update
+            ranks = [r for r in all_ranks if r in (selected_ranks or [])]
+            if [files, ranks] == current:
+                return no_update, no_update
+            projects = selected_projects(files, ranks)
+            return [files, ranks], [{'label': str(projects[i]), 'value': i} for i in range(len(projects))]
+
+        @app.callback(
+            Output('aggregates', 'data'),
+            Input('selected-projects', 'data'),
+            Input('start_day', 'value'),
+            Input('end_day', 'value'),
+            Input('min_el', 'value'),
+            Input('max_el', 'value'),
+            Input('sun_radius', 'value'),
+            Input('moon_radius', 'value'),
+            Input('ut_start', 'value'),
+            Input('ut_hours', 'value'),
+            State('aggregates', 'data')
+        )
+        @metrics.timed_callback('select_window')
+        def select_window(selected, start, end, min_el, max_el, sun, moon, ut_start, ut_hours, current):
+            # the up times are derived from the elevations of the full-day grid for the limits, avoidance
+            # and night window, nothing is recomputed
+            if selected is None or min_el is None or max_el is None or float(min_el) >= float(max_el):
+                return no_update
+            if ut_start is None or not ut_hours or not 0 < float(ut_hours) <= 24:
+                return no_update
+            window = selected + [int(start), int(end), float(min_el), float(max_el), float(sun or 0), float(moon or 0),
+                                 float(ut_start), float(ut_hours)]
+            return no_update if window == current else window
+
+        @app.callback(
             Output('is_date', 'is_open'),
             Output('is_rank', 'is_open'),
             Output('is_project', 'is_open'),
             Output('is_source', 'is_open'),
-            Output('tab-content', 'children'),
-            [Input('rank-list-input', 'value'),
-             Input('file-list-input', 'value'),
-             Input('day', 'value'),
-             Input('start_day', 'value'),
-             Input('end_day', 'value'),
-             Input('project_select', 'value'),
-             Input('tabs', 'active_tab'),
-             Input('btn-all', 'n_clicks'),
-             Input('btn-prev', 'n_clicks'),
-             Input('btn-next', 'n_clicks')
-             ]
+            Input('tabs', 'active_tab')
         )
-        def plot_select(selected_ranks, prjs, day, start, end, project_index, at, all, prev, next):
-            global source_range, source_len
+        @metrics.timed_callback('select_tab')
+        def select_tab(at):
+            return tab_controls[at]
 
-            figure_plot = go.Figure()
-            projects, sources = make_project(prjs)
-            selected_projects = [p for p in projects if p.sourceList[0].rank in selected_ranks]
-
-            projects_options = [
-                {'label': str(selected_projects[i]), 'value': i} for i in range(len(selected_projects))
-            ]
-            if not selected_projects:
-                return projects_options, no_update,no_update,no_update,no_update, dcc.Graph(figure=figure_plot)
-            if project_index is None or project_index >= len(selected_projects):
-                project_index = 0
-
-            source_len = len(selected_projects[project_index].sourceList)
-
-            if at == 'pressure':
-                is_date, is_rank, is_project, is_source = True, True, False, False
-                figure_plot = createPressurePlot(selected_projects, selected_ranks, prjs, prjs_dict, int(start),
-                                                 int(end))
-            elif at == 'season':
-                is_date, is_rank, is_project, is_source = False, True, False, False
-                figure_plot = createSeasonPlot(astroTime, day_names, selected_projects, int(start), int(end))
-            elif at == 'upTimes':
-                is_date, is_rank, is_project, is_source = False, True, True, True
-                figure_plot = selected_projects[project_index].plotUptimes(astroTime, day_names, int(day), source_range)
-            elif at == 'uberUp':
-                is_date, is_rank, is_project, is_source = True, True, True, False
-                figure_plot = selected_projects[project_index].plotUberUp(astroTime, day_names, int(start), int(end))
-
-            return projects_options, is_date, is_rank, is_project, is_source, dcc.Graph(figure=figure_plot)
+        # the tab figure is computed by a background job, identical selections of other sessions
+        # share the job and a new selection cancels the previous one
+        @app.callback(
+            Output('job', 'data'),
+            Input('aggregates', 'data'),
+            Input('day', 'value'),
+            Input('project_select', 'value'),
+            Input('tabs', 'active_tab'),
+            Input('sources', 'children'),
+            State('job', 'data')
+        )
+        @metrics.timed_callback('plot_select')
+        def plot_select(window, day, project_index, at, sources, job):
+            if window is None:
+                return no_update
+            files, ranks, start, end, min_el, max_el, sun, moon, ut_start, ut_hours = window
+            # only the inputs of the active tab are part of the job
+            day = int(day) if at == 'upTimes' else None
+            if at == 'upTimes':
+                start, end = None, None
+            if at in ('pressure', 'season'):
+                project_index = None
+            key = job_queue().submit('tab', at, files, ranks, day, start, end, project_index,
+                                     list(source_range) if at == 'upTimes' else None,
+                                     elevation_limits(_state['config'], (min_el, max_el)),
+                                     avoidanceRadii({'sun': sun, 'moon': moon}),
+                                     night_window(_state['config'], ut_start, ut_hours),
+                                     project_state()['data_version'], held=job)
+            if job and job != key:
+                job_queue().cancel(job)
+            return key
+
+        # poll the job: progress bar, then the tab-content
+        @app.callback(
+            Output('tab-content', 'children'),
+            Output('job-progress', 'value'),
+            Output('job-progress', 'label'),
+            Output('is_job', 'is_open'),
+            Output('job-poll', 'disabled'),
+            Input('job', 'data'),
+            Input('job-poll', 'n_intervals'),
+            State('tabs', 'active_tab')
+        )
+        @metrics.timed_callback('job_poll')
+        def job_poll(key, n, at):
+            global source_len
+            status = job_queue().status(key) if key else None
+            if status is None or status['status'] == 'cancelled':
+                return no_update, 0, '', False, True
+            if status['status'] == 'failed':
+                return html.Pre(status['message']), 0, '', False, True
+            if status['status'] != 'done':
+                value = 100. * status['done'] / status['total'] if status['total'] else 0
+                return no_update, value, status['message'], True, False
+            n_sources, figure_plot = job_queue().result(key)
+            if n_sources is not None:
+                source_len = n_sources
+            return dcc.Graph(figure=figure_plot), 100, '', False, True
 
 
 def DASHA_SITE():
@@ -0,0 +1,238 @@
+"""Startup profiling, pipeline timers and lazy imports of the heavy modules
+
+    Set SOURCE_PROFILE_STARTUP=1 to record the wall time of every module
+    imported by this package and of the startup stages, and print a report
+    once the startup is done.
+
+    The pipeline timers and counters are always on (one perf_counter call
+    and a dict update per use). Set SOURCE_PROFILE_CAPTURE=cprofile or
+    tracemalloc to also capture a profile of every timed section (or of the
+    comma separated SOURCE_PROFILE_CAPTURE_TIMERS only): one profile per
+    timer name, accumulated over its calls (cprofile) or of its call with the
+    highest peak (tracemalloc), written at exit to SOURCE_PROFILE_DIR
+    (default: the current directory)."""
+import atexit
+import builtins
+import cProfile
+import importlib
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+
+enabled = os.environ.get('SOURCE_PROFILE_STARTUP', '') not in ('', '0')
+captureMode = os.environ.get('SOURCE_PROFILE_CAPTURE', '').lower()  # '', 'cprofile' or 'tracemalloc'
+captureDir = os.environ.get('SOURCE_PROFILE_DIR', '.')
+captureTimers = [t.strip() for t in os.environ.get('SOURCE_PROFILE_CAPTURE_TIMERS', '').split(',') if t.strip()]
+importTimes = OrderedDict()  # module name: import wall time [s]
+stageTimes = OrderedDict()  # stage name: wall time [s]
+timers = OrderedDict()  # timer name: [calls, total wall time [s], max wall time [s]]
+counters = OrderedDict()  # counter name: count
+_captures = [False]  # capture running
+_profiles = OrderedDict()  # timer name: cProfile.Profile, or [calls, peak, tracemalloc statistics]
+_lock = threading.Lock()
+_import = builtins.__import__
+
+
+def record(times, name, dt):
+    with _lock:
+        times[name] = times.get(name, 0.) + dt
+
+
+class LazyModule:
+    # module proxy, the module is imported on first attribute access
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            t0 = time.perf_counter()
+            module = importlib.import_module(self._name)
+            if enabled:
+                record(importTimes, self._name + ' (lazy)', time.perf_counter() - t0)
+            self._module = module
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        return f"<lazy module '{self._name}'>"
+
+
+def lazy_module(name):
+    return LazyModule(name)
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    # time the first import of every module imported by this package
+    caller = (globals or {}).get('__name__', '') or ''
+    if level or name in sys.modules or not caller.startswith(__package__):
+        return _import(name, globals, locals, fromlist, level)
+    t0 = time.perf_counter()
+    try:
+        return _import(name, globals, locals, fromlist, level)
+    finally:
+        record(importTimes, name, time.perf_counter() - t0)
+
+
+@contextmanager
+def stage(name):
+    # time one named startup stage
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        if enabled:
+            record(stageTimes, name, time.perf_counter() - t0)
+
+
+def start_capture(name):
+    # start a cProfile/tracemalloc capture, one at a time (the outermost timed section)
+    if captureMode not in ('cprofile', 'tracemalloc') or (captureTimers and name not in captureTimers):
+        return None
+    with _lock:
+        if _captures[0]:
+            return None
+        _captures[0] = True
+        if captureMode == 'cprofile':
+            profiler = _profiles.get(name)
+            if profiler is None:
+                profiler = _profiles[name] = cProfile.Profile()
+    if captureMode == 'cprofile':
+        profiler.enable()
+        return profiler
+    tracemalloc.start()
+    return tracemalloc
+
+
+def stop_capture(name, profiler):
+    if profiler is None:
+        return
+    if profiler is tracemalloc:
+        peak = tracemalloc.get_traced_memory()[1]
+        with _lock:
+            capture = _profiles.setdefault(name, [0, -1, None])
+            capture[0] += 1
+        # the statistics of the call with the highest peak only
+        if peak > capture[1]:
+            capture[1:] = [peak, tracemalloc.take_snapshot().statistics('lineno')[:30]]
+        tracemalloc.stop()
+    else:
+        profiler.disable()
+    with _lock:
+        _captures[0] = False
+
+
+def flush_captures():
+    # write the captured profiles, one file per timer name (at exit)
+    with _lock:
+        profiles = list(_profiles.items())
+    for name, profiler in profiles:
+        filename = os.path.join(captureDir, '%s-%d' % (re.sub(r'\W+', '_', name), os.getpid()))
+        if isinstance(profiler, cProfile.Profile):
+            profiler.dump_stats(filename + '.prof')
+            continue
+        calls, peak, stats = profiler
+        with open(filename + '.txt', 'w') as fo:
+            print(f'{name}: {calls} calls, peak {peak / 1024. ** 2:.1f} MB', file=fo)
+            for stat in stats:
+                print(stat, file=fo)
+
+
+if captureMode in ('cprofile', 'tracemalloc'):
+    atexit.register(flush_captures)
+
+
+@contextmanager
+def timer(name):
+    # time a named section of the pipeline
+    profiler = start_capture(name)
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t0
+        stop_capture(name, profiler)
+        with _lock:
+            t = timers.setdefault(name, [0, 0., 0.])
+            t[0] += 1
+            t[1] += dt
+            t[2] = max(t[2], dt)
+
+
+def timed(name):
+    # decorator timing every call of a function
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, n=1):
+    with _lock:
+        counters[name] = counters.get(name, 0) + n
+
+
+def reset_timers():
+    with _lock:
+        timers.clear()
+        counters.clear()
+
+
+class Progress:
+    # rate-limited progress report: at most one line every interval seconds, and the last one
+    def __init__(self, label, total, interval=5., enabled=True, out=None):
+        self.label = label
+        self.total = total
+        self.interval = interval
+        self.enabled = enabled
+        self.out = out or sys.stdout
+        self.done = 0
+        self.t0 = time.perf_counter()
+        self.last = self.t0
+
+    def update(self, n=1):
+        self.done += n
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if now - self.last >= self.interval or self.done >= self.total:
+            self.last = now
+            rate = self.done / (now - self.t0) if now > self.t0 else 0.
+            print(f'{self.label}: {self.done} of {self.total} ({rate:.0f}/s)', file=self.out)
+
+
+def report(out=None, force=False):
+    # print the import, stage and pipeline times, slowest first, and the counters
+    if not (enabled or force):
+        return
+    out = out or sys.stderr
+    for title, times in (('imports', importTimes), ('stages', stageTimes)):
+        if not times:
+            continue
+        print(f'startup {title}:', file=out)
+        for name, dt in sorted(list(times.items()), key=lambda x: -x[1]):
+            print(f'  {dt * 1000.:10.1f} ms  {name}', file=out)
+        print(f'  {sum(times.values()) * 1000.:10.1f} ms  total', file=out)
+    if timers:
+        print('timers:', file=out)
+        for name, (n, total, tmax) in sorted(list(timers.items()), key=lambda x: -x[1][1]):
+            print(f'  {total * 1000.:10.1f} ms  {n:6d} calls  {tmax * 1000.:10.1f} ms max  {name}', file=out)
+    if counters:
+        print('counters:', file=out)
+        for name, n in counters.items():
+            print(f'  {n:12d}  {name}', file=out)
+
+
+if enabled and builtins.__import__ is _import:
+    builtins.__import__ = _timed_import
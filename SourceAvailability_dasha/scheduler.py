@@ -0,0 +1,187 @@
+"""Allocation of the requested hours of the sources to the time slots they are up
+
+    Every (date, slot) cell of the night windows of the date range goes to at
+    most one source, only where the source is up (elevation limits, Sun/Moon
+    avoidance) and yields slot hours * efficiency (prjs_dict['TOT']) of its
+    integration time times the pressure factor of its instrument. The sources
+    of a file (UM, US, MX) get at most the share of the cells of the file in
+    prjs_dict. A source gets all the cells it needs or none.
+
+    The greedy pass takes the sources by rank (A first), the hardest to place
+    first (needed cells per cell up), each one taking the free cells it is up
+    in that are wanted least by the sources still waiting. The local search
+    then completes the sources left out, rank first, with the free cells, the
+    cells whose owner can move to another of its free cells and the cells of
+    sources of a lower rank, until nothing changes or the time limit. Both
+    work on the up masks of the source tables (see SourceTable.uptimes)."""
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from .make_availability import pressureFactor, pressureRanks
+from .profiling import timer
+
+# sources: the Source of every index; files: their file; hours: their requested hours times the pressure factor;
+# owner: (nslots, ndays) source index of every cell (-1: free); cells: cells of every source; needed: cells needed
+# by every source; cellHours: integration hours of a cell; quota: cells left to every file
+Schedule = namedtuple('Schedule', ['sources', 'files', 'hours', 'owner', 'cells', 'needed', 'cellHours', 'quota'])
+
+
+def scheduleInputs(context, projects_by_file, ranks, day_start, day_end, limits=None, avoid=None):
+    # sources of the ranks, their file, requested hours (times the pressure factor), rank order and row in the
+    # (nrows, ncells) up masks of the date range of the night window of context
+    window = context.window
+    sources, files, hours, rank, rows, masks = [], [], [], [], [], []
+    offset = 0
+    for f, projects in projects_by_file.items():
+        if not projects:
+            continue
+        table = projects[0].table
+        tableRows = np.concatenate([p.rows for p in projects])
+        tableRows = tableRows[np.isin(table.rank[tableRows], list(ranks))]
+        if not len(tableRows):
+            continue
+        index, up, lstup = table.uptimes(limits, avoid, window)
+        used, inverse = np.unique(index[tableRows], return_inverse=True)
+        masks.append(up[used][:, :, day_start:day_end + 1].reshape(len(used), -1) > 0)
+        rows.append(offset + inverse.ravel())
+        offset += len(used)
+        sources += table.sources(tableRows)
+        files += [f] * len(tableRows)
+        hours.append(table.integTime[tableRows] *
+                     np.array([pressureFactor.get(i, 1.) for i in table.instrument[tableRows]]))
+        rank.append(np.array([pressureRanks.index(r) for r in table.rank[tableRows]], dtype=int))
+    ncells = context.astroTime.shape[0] * (day_end + 1 - day_start)
+    if not sources:
+        return [], np.zeros(0, dtype=str), np.zeros(0), np.zeros(0, dtype=int), np.zeros(0, dtype=int), \
+            np.zeros((0, ncells), dtype=bool)
+    return sources, np.array(files), np.concatenate(hours), np.concatenate(rank), np.concatenate(rows), \
+        np.concatenate(masks)
+
+
+def scheduleSources(context, projects_by_file, ranks, day_start, day_end, prjs_dict, limits=None, avoid=None,
+                    localSearch=True, timeLimit=5.):
+    # greedy allocation of the sources of projects_by_file ({file: projects}) of the ranks on the dates
+    # day_start to day_end of the night window of context, improved by local search for up to timeLimit [s]
+    jd = context.astroTime.jd
+    slotHours = round((jd[1, 0] - jd[0, 0]) * 86400.) / 3600. if jd.shape[0] > 1 else 0.
+    cellHours = slotHours * prjs_dict['TOT']
+    sources, files, hours, rank, row, upRows = scheduleInputs(context, projects_by_file, ranks, day_start, day_end,
+                                                              limits, avoid)
+    nslots = context.astroTime.shape[0]
+    ncells = upRows.shape[1]
+    n = len(sources)
+    needed = np.ceil(hours / cellHours - 1e-9).astype(int) if cellHours > 0 else np.zeros(n, dtype=int)
+    quota = {f: int(prjs_dict.get(f, 0.) * ncells) for f in np.unique(files)}
+
+    owner = np.full(ncells, -1, dtype=int)
+    cells = np.zeros(n, dtype=int)
+    with timer('schedule greedy'):
+        available = upRows.sum(axis=1)[row] if n else np.zeros(0)
+        # fraction of its up cells every waiting source needs, and their sum on every cell
+        want = np.where(available > 0, needed / np.maximum(available, 1), 0.)
+        demand = np.bincount(row, weights=want, minlength=len(upRows)) @ upRows if n else np.zeros(ncells)
+        order = np.lexsort((-want, rank))
+        for s in order:
+            up = upRows[row[s]]
+            demand -= want[s] * up
+            k = needed[s]
+            if k == 0 or k > quota[files[s]]:
+                continue
+            free = np.flatnonzero(up & (owner < 0))
+            if len(free) < k:
+                continue
+            if len(free) > k:
+                free = free[np.argpartition(demand[free], k - 1)[:k]]
+            owner[free] = s
+            cells[s] = k
+            quota[files[s]] -= k
+
+    if localSearch:
+        with timer('schedule local search'):
+            # the demand of the sources left out
+            waiting = cells < needed
+            demand = np.bincount(row[waiting], weights=want[waiting], minlength=len(upRows)) @ upRows
+            improve(owner, cells, needed, rank, files, row, upRows, quota, want, demand, order, timeLimit)
+    return Schedule(sources, files, hours, owner.reshape(nslots, -1), cells, needed, cellHours, quota)
+
+
+def improve(owner, cells, needed, rank, files, row, upRows, quota, want, demand, order, timeLimit):
+    # complete the sources left out by the greedy pass, in its order: free cells first, then cells whose
+    # owner moves to another of its free cells, then cells of the sources of a lower rank
+    t0 = time.perf_counter()
+    changed = True
+    while changed and time.perf_counter() - t0 < timeLimit:
+        changed = False
+        for s in order:
+            if cells[s] >= needed[s] or time.perf_counter() - t0 > timeLimit:
+                continue
+            k = needed[s]
+            up = upRows[row[s]]
+            free = np.flatnonzero(up & (owner < 0))
+            taken = np.flatnonzero(up & (owner >= 0))
+            held = owner[taken]
+            # moves of the owners to one of their free cells, one per owner and pass
+            moves = []
+            if len(free) < k:
+                freeMask = owner < 0
+                freeMask[free] = False  # kept for s
+                owners, first = np.unique(held, return_index=True)
+                for t, c in zip(owners, taken[first]):
+                    if len(free) + len(moves) >= k or not freeMask.any():
+                        break
+                    alt = np.flatnonzero(upRows[row[t]] & freeMask)
+                    if len(alt):
+                        a = alt[np.argmin(demand[alt])]
+                        freeMask[a] = False
+                        moves.append((c, t, a))
+            evict = []
+            if len(free) + len(moves) < k:
+                lower = taken[(rank[held] > rank[s]) & ~np.isin(taken, [m[0] for m in moves])]
+                # the lowest ranks, and the sources with the fewest cells, lose their cells first
+                lower = lower[np.lexsort((cells[owner[lower]], -rank[owner[lower]]))]
+                evict = lower[:k - len(free) - len(moves)]
+            evicted = set(owner[c] for c in evict)
+            # the cells of the evicted sources of its file count in the share of s
+            if len(free) + len(moves) + len(evict) < k or \
+                    quota[files[s]] + sum(cells[t] for t in evicted if files[t] == files[s]) < k:
+                continue
+            # the moves and evictions are made on a copy, kept only if s then gets all its cells
+            trial = owner.copy()
+            for c, t, a in moves:
+                trial[a] = t
+                trial[c] = -1
+            # an evicted source loses all its cells, it is incomplete
+            released = {}
+            for t in evicted:
+                released[t] = np.flatnonzero(trial == t)
+                trial[released[t]] = -1
+            take = np.flatnonzero(up & (trial < 0))
+            if len(take) < k:
+                continue
+            if len(take) > k:
+                take = take[np.argpartition(demand[take], k - 1)[:k]]
+            trial[take] = s
+            owner[:] = trial
+            for t, cs in released.items():
+                quota[files[t]] += len(cs)
+                cells[t] = 0
+            cells[s] = k
+            quota[files[s]] -= k
+            demand -= want[s] * up
+            for t in evicted:
+                demand += want[t] * upRows[row[t]]
+            changed = True
+
+
+def scheduleSummary(schedule):
+    # per project: file, project id, rank, requested hours, allocated hours and whether all its sources fit
+    projects = {}
+    for i, s in enumerate(schedule.sources):
+        key = (schedule.files[i], str(s.pId))
+        p = projects.setdefault(key, [str(s.rank), 0., 0., True])
+        p[1] += float(s.integTime)
+        p[2] += float(s.integTime) * min(1., schedule.cells[i] / schedule.needed[i]) if schedule.needed[i] else 0.
+        p[3] &= bool(schedule.cells[i] >= schedule.needed[i])
+    return [(f, pid) + tuple(v) for (f, pid), v in projects.items()]
@@ -0,0 +1,62 @@
+"""Synthetic targets catalogues in the format read by populateProjects,
+    used by the benchmarks and the load tests"""
+import numpy as np
+
+header = 'proposal_id,ranking,name_pi,source,ra,dec,system,instrument,time,priority'
+# realistic mixes of the proposals
+rank_mix = {'A': 0.3, 'B': 0.35, 'C': 0.25, 'D': 0.1}
+instrument_mix = {'TolTEC': 0.35, 'SEQUOIA': 0.25, 'RSR': 0.2, 'B4R': 0.1, 'MSIP1': 0.1}
+
+
+def choice(rng, mix, n):
+    keys = list(mix.keys())
+    p = np.array(list(mix.values()), dtype=float)
+    return np.array(keys)[rng.choice(len(keys), size=n, p=p / p.sum())]
+
+
+def make_targets(nsources, nprojects, file_tag='MX', semester='2025-S1', galactic_fraction=0.2,
+                 duplicate_fraction=0.05, seed=0):
+    # rows of a synthetic catalogue: every project has one rank and a handful of instruments,
+    # positions visible from the LMT, with a fraction of galactic and of repeated targets
+    rng = np.random.default_rng(seed)
+    nprojects = max(1, min(nprojects, nsources))
+    project = np.sort(rng.integers(0, nprojects, nsources))
+    project[:nprojects] = np.arange(nprojects)
+    project = np.sort(project)
+    project_rank = choice(rng, rank_mix, nprojects)
+    project_instrument = choice(rng, instrument_mix, nprojects)
+
+    ra = rng.uniform(0., 360., nsources)
+    dec = np.degrees(np.arcsin(rng.uniform(np.sin(np.radians(-40.)), np.sin(np.radians(75.)), nsources)))
+    galactic = rng.uniform(size=nsources) < galactic_fraction
+    lon = rng.uniform(0., 360., nsources)
+    lat = rng.normal(0., 5., nsources).clip(-90., 90.)
+    ra[galactic] = lon[galactic]
+    dec[galactic] = lat[galactic]
+    # repeated targets copy the position of an earlier source
+    dup = np.flatnonzero(rng.uniform(size=nsources) < duplicate_fraction)
+    dup = dup[dup > 0]
+    src = rng.integers(0, dup, len(dup)) if len(dup) else dup
+    ra[dup], dec[dup], galactic[dup] = ra[src], dec[src], galactic[src]
+
+    instrument = project_instrument[project]
+    other = rng.uniform(size=nsources) < 0.2
+    instrument[other] = choice(rng, instrument_mix, int(other.sum()))
+    itime = np.round(rng.lognormal(np.log(3.), 0.8, nsources).clip(0.1, 100.), 2)
+
+    rows = []
+    for i in range(nsources):
+        p = project[i]
+        rows.append((f'{semester}-{file_tag}-{p + 1}', project_rank[p], f'PI{p + 1}', f'{file_tag}_src{i + 1}',
+                     round(float(ra[i]), 6), round(float(dec[i]), 6), 'Galactic' if galactic[i] else 'J2000',
+                     instrument[i], float(itime[i]), 1))
+    return rows
+
+
+def write_targets_csv(filename, nsources, nprojects, **kwargs):
+    rows = make_targets(nsources, nprojects, **kwargs)
+    with open(filename, 'w') as fo:
+        fo.write(header + '\n')
+        for row in rows:
+            fo.write(','.join(str(v) for v in row) + '\n')
+    return filename
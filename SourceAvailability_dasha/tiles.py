@@ -0,0 +1,121 @@
+"""Per-day tiles of the az/el grids of the source positions on disk
+
+    A tile holds the az and el of a set of positions over the time slots of
+    one night, keyed by the site, the night window (start UT and number of
+    slots), the sampling and the date. A time grid covering other dates
+    with the same night window and sampling reads the days already computed
+    and only transforms the missing ones. The az/el are stored compressed as
+    float32; the keys of the tiles of a day are indexed once, sorted, and
+    looked up together.
+
+    directory/<site>_<start UT>_<slots>x<step>s/<date>/<hash>.npz"""
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+
+def tileKey(posKey):
+    # (frame, ra, dec) of a position as a string
+    return '%s:%.6f:%.6f' % posKey
+
+
+class TileCache:
+    dtype = np.float32  # of the stored az/el, a grid computed with tiles keeps its az/el in it
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._keys = {}  # tile file name: position keys, the tiles are never rewritten
+        self._index = {}  # day directory: (tile file names, sorted keys, tile, row), see dayIndex
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return self.directory
+
+    def __setstate__(self, directory):
+        self.__init__(directory)
+
+    def gridDirectory(self, context):
+        # site, night window and sampling of the time grid of context
+        astroTime = context.astroTime
+        nx = astroTime.shape[0]
+        step = int(round((astroTime[1, 0] - astroTime[0, 0]).sec)) if nx > 1 else 0
+        loc = context.location
+        site = '%.5f_%.5f_%.0f' % (loc.lon.deg, loc.lat.deg, loc.height.to_value('m'))
+        return os.path.join(self.directory, '%s_%s_%dx%ds' % (site, astroTime[0, 0].isot[11:19].replace(':', ''),
+                                                              nx, step))
+
+    def dates(self, context):
+        return [t.isot[:10] for t in context.astroTime[0, :]]
+
+    def tileKeys(self, filename):
+        with self._lock:
+            keys = self._keys.get(filename)
+        if keys is None:
+            with np.load(filename) as f:
+                keys = f['keys']
+            with self._lock:
+                self._keys[filename] = keys
+        return keys
+
+    def dayIndex(self, day):
+        # tile file names of a day, the sorted keys of their positions and the tile and row of every key,
+        # rebuilt when a tile is added
+        names = sorted(name for name in os.listdir(day) if name.endswith('.npz'))
+        with self._lock:
+            index = self._index.get(day)
+        if index is None or index[0] != names:
+            keys = [self.tileKeys(os.path.join(day, name)) for name in names]
+            tile = np.repeat(np.arange(len(names)), [len(k) for k in keys])
+            row = np.concatenate([np.arange(len(k)) for k in keys]) if keys else np.zeros(0, dtype=int)
+            keys = np.concatenate(keys) if keys else np.zeros(0, dtype=str)
+            order = np.argsort(keys, kind='stable')
+            index = names, keys[order], tile[order], row[order]
+            with self._lock:
+                self._index[day] = index
+        return index
+
+    def read(self, context, keys):
+        # az, el (len(keys), nslots, ndays) of the positions found in the tiles, and the found (len(keys), ndays) mask
+        nx, ny = context.astroTime.shape
+        keys = np.array([tileKey(k) for k in keys])
+        az = np.zeros((len(keys), nx, ny))
+        el = np.zeros((len(keys), nx, ny))
+        found = np.zeros((len(keys), ny), dtype=bool)
+        grid = self.gridDirectory(context)
+        for d, date in enumerate(self.dates(context)):
+            day = os.path.join(grid, date)
+            if not len(keys) or not os.path.isdir(day):
+                continue
+            names, dayKeys, tile, row = self.dayIndex(day)
+            if not len(dayKeys):
+                continue
+            pos = np.minimum(np.searchsorted(dayKeys, keys), len(dayKeys) - 1)
+            hit = np.flatnonzero(dayKeys[pos] == keys)
+            pos = pos[hit]
+            # one read of every tile holding some of the positions
+            for t in np.unique(tile[pos]):
+                sel = tile[pos] == t
+                with np.load(os.path.join(day, names[t])) as f:
+                    az[hit[sel], :, d] = f['az'][row[pos[sel]]]
+                    el[hit[sel], :, d] = f['el'][row[pos[sel]]]
+            found[hit, d] = True
+        return az, el, found
+
+    def write(self, context, keys, days, az, el):
+        # tiles of the positions of keys on the days (indices in the grid), az/el: (len(keys), nslots, len(days))
+        keys = np.array([tileKey(k) for k in keys])
+        name = hashlib.sha1('\n'.join(keys).encode()).hexdigest()[:16] + '.npz'
+        grid = self.gridDirectory(context)
+        dates = self.dates(context)
+        for j, d in enumerate(days):
+            day = os.path.join(grid, dates[d])
+            os.makedirs(day, exist_ok=True)
+            filename = os.path.join(day, name)
+            # written next to the tile then renamed, readers never see a partial tile
+            tmp = filename + '.%d.%d.tmp' % (os.getpid(), threading.get_ident())
+            with open(tmp, 'wb') as fo:
+                np.savez_compressed(fo, keys=keys, az=az[:, :, j].astype(self.dtype),
+                                    el=el[:, :, j].astype(self.dtype))
+            os.replace(tmp, filename)
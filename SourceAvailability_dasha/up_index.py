@@ -0,0 +1,144 @@
+"""Inverted (day, time slot) -> sources bitset index used to answer
+    "what is up now" queries with a handful of bitwise operations"""
+import numpy as np
+
+from .profiling import lazy_module
+
+atime = lazy_module('astropy.time')
+
+
+class UpIndex:
+    chunkSize = 1024  # number of sources packed at a time, whole bytes
+
+    def __init__(self, context, blocks, limits=None, avoid=None):
+        # blocks: (file label ('UM', 'US', 'MX'), SourceTable, rows) of the sources, with their up arrays
+        # computed (on the grid of context, a night window or the full-day grid)
+        # limits, avoid: elevation limits (per instrument) and Sun/Moon avoidance radii of the up times, as in
+        # SourceTable.uptimes
+        astroTime = context.astroTime
+        self.astroTime = astroTime
+        blocks = [(f, table, np.asarray(rows, dtype=int)) for f, table, rows in blocks]
+        self.sources = [s for f, table, rows in blocks for s in table.sources(rows)]
+        self.nsources = len(self.sources)
+        nx = astroTime.shape[0]
+        ny = astroTime.shape[1]
+
+        # block and row in the up times of its table of every source
+        window = context.window
+        ups = []
+        upRows = [np.zeros(0, dtype=int)]
+        for f, table, rows in blocks:
+            index, up, lstup = table.uptimes(limits, avoid, window)
+            ups.append(up)
+            upRows.append(index[rows])
+        upRow = np.concatenate(upRows)
+        block = np.repeat(np.arange(len(blocks)), [len(rows) for f, table, rows in blocks])
+
+        # one bitset over the source list for each (day, time slot), packed from the up times a chunk at a time
+        self.bits = np.zeros((ny, nx, (self.nsources + 7) // 8), dtype=np.uint8)
+        for c in range(0, self.nsources, UpIndex.chunkSize):
+            chunk = slice(c, c + UpIndex.chunkSize)
+            up = np.zeros((len(upRow[chunk]), nx, ny), dtype=bool)
+            for b in np.unique(block[chunk]):
+                sel = block[chunk] == b
+                up[sel] = ups[b][upRow[chunk][sel]][:, :, 0:ny] > 0
+            packed = np.packbits(up.transpose(2, 1, 0), axis=-1)
+            self.bits[:, :, c // 8:c // 8 + packed.shape[2]] = packed
+
+        def column(values):
+            return np.concatenate(values).astype(str) if values else np.zeros(0, dtype=str)
+
+        self.columns = {
+            'rank': column([table.rank[rows] for f, table, rows in blocks]),
+            'instrument': column([table.instrument[rows] for f, table, rows in blocks]),
+            'file': column([np.full(len(rows), f) for f, table, rows in blocks]),
+        }
+        self._masks = {}
+        # the padding bits of the packed arrays must stay zero
+        self.allMask = np.packbits(np.ones(self.nsources, dtype=bool))
+
+        # start of every night and the slot length, in jd
+        self.jd0 = astroTime[0, :].jd
+        self.step = astroTime[1, 0].jd - astroTime[0, 0].jd if nx > 1 else 1.
+        # the slots of a full-day grid follow each other across the dates: a query goes on into the next date
+        self.contiguous = ny > 1 and abs(self.jd0[1] - self.jd0[0] - nx * self.step) < 1e-3 * self.step
+
+    @classmethod
+    def fromProjects(cls, context, projects_by_file, limits=None, avoid=None):
+        # projects_by_file: {file label: list of projects}, the rows of the projects following each other in the
+        # same table make one block
+        blocks = []
+        for f, projects in projects_by_file.items():
+            for p in projects:
+                if p.table is None or not len(p.rows):
+                    continue
+                if blocks and blocks[-1][0] == f and blocks[-1][1] is p.table:
+                    blocks[-1][2].append(p.rows)
+                else:
+                    blocks.append((f, p.table, [p.rows]))
+        return cls(context, [(f, table, np.concatenate(rows)) for f, table, rows in blocks], limits, avoid)
+
+    def columnMask(self, column, values):
+        # packed mask of the sources whose column value is in values
+        key = (column, tuple(sorted(values)))
+        if key not in self._masks:
+            self._masks[key] = np.packbits(np.isin(self.columns[column], list(values)))
+        return self._masks[key]
+
+    def mask(self, ranks=None, instruments=None, files=None):
+        # AND-combination of the rank/instrument/file masks, None means no cut
+        m = self.allMask
+        for column, values in (('rank', ranks), ('instrument', instruments), ('file', files)):
+            if values is not None:
+                m = m & self.columnMask(column, values)
+        return m
+
+    def slotFor(self, when):
+        # (day, slot) of an astropy Time, or None if it falls outside the nights
+        jd = when.jd
+        day = int(np.searchsorted(self.jd0, jd, side='right')) - 1
+        if day < 0:
+            return None
+        slot = int(np.floor((jd - self.jd0[day]) / self.step + 1e-6))
+        if slot >= self.bits.shape[1]:
+            return None
+        return day, slot
+
+    def query(self, day, slot0, slot1, ranks=None, instruments=None, files=None, mode='any'):
+        # indices of the sources up in any (or all) of the slots [slot0, slot1) of day, slot1 past the last slot
+        # of a full-day grid goes on into the next dates
+        if self.contiguous:
+            nx = self.bits.shape[1]
+            block = self.bits.reshape(self.bits.shape[0] * nx, self.bits.shape[2])[day * nx + max(slot0, 0):day * nx + slot1]
+        else:
+            block = self.bits[day, max(slot0, 0):slot1]
+        if len(block) == 0:
+            return np.array([], dtype=int)
+        if mode == 'all':
+            hits = np.bitwise_and.reduce(block, axis=0)
+        else:
+            hits = np.bitwise_or.reduce(block, axis=0)
+        hits = hits & self.mask(ranks, instruments, files)
+        return np.flatnonzero(np.unpackbits(hits, count=self.nsources))
+
+    def queryNow(self, when=None, hours=1., ranks=None, instruments=None, files=None, mode='any'):
+        # indices of the sources up within the next hours from when (default: now)
+        if when is None:
+            when = atime.Time.now()
+        ds = self.slotFor(when)
+        if ds is None:
+            return np.array([], dtype=int)
+        day, slot = ds
+        nslots = max(1, int(round(hours / 24. / self.step)))
+        return self.query(day, slot, slot + nslots, ranks, instruments, files, mode)
+
+    def upNow(self, when=None, hours=1., ranks=None, instruments=None, files=None, mode='any'):
+        # sources up within the next hours from when (default: now)
+        return [self.sources[i] for i in self.queryNow(when, hours, ranks, instruments, files, mode)]
+
+    def describe(self, i):
+        # JSON friendly description of source i
+        s = self.sources[i]
+        return {'name': str(s.name), 'pid': str(s.pId), 'pi': str(s.piName), 'rank': str(s.rank),
+                'instrument': str(s.instrument), 'file': str(self.columns['file'][i]),
+                'ra': float(s.ra), 'dec': float(s.dec), 'system': str(s.coordsys)}
@@ -0,0 +1,103 @@
+"""Hot reload of the targets files listed in the config, or of the data bundles
+
+    A thread polls the size and modification time of every targets file. A
+    file whose stamp changed and then stayed the same for one more poll (it
+    is not being written anymore) is passed to the reload function, one file
+    at a time, in the watcher thread. The bundles directory is polled for a
+    bundle newer than the one loaded (see bundle.py). Does not import dash."""
+import os
+import threading
+import traceback
+
+from .bundle import latest_bundle
+from .profiling import count
+
+
+def fileStamp(path):
+    # (size, modification time) of a file, None if it does not exist
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class Poller:
+    # thread calling check every interval seconds
+    def __init__(self, interval=5.):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def check(self):
+        raise NotImplementedError
+
+    def run(self):
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name=type(self).__name__, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+
+class CatalogueWatcher(Poller):
+    def __init__(self, files, reload, interval=5.):
+        # files: [(file, projectsFile, targetsFile)] as loaded
+        # reload(file, projectsFile, targetsFile): called for every changed file
+        super().__init__(interval)
+        self.files = list(files)
+        self.reload = reload
+        self.stamps = {targetsFile: fileStamp(targetsFile) for f, projectsFile, targetsFile in self.files}
+        self._pending = {}  # targets file: stamp seen changed at the last poll
+
+    def check(self):
+        # reload the files changed since the last check and not changing anymore, returns their names
+        reloaded = []
+        for f, projectsFile, targetsFile in self.files:
+            stamp = fileStamp(targetsFile)
+            if stamp == self.stamps[targetsFile] or stamp is None:
+                self._pending.pop(targetsFile, None)
+                continue
+            if self._pending.get(targetsFile) != stamp:
+                # still being written, or changed since the last poll
+                self._pending[targetsFile] = stamp
+                continue
+            del self._pending[targetsFile]
+            count('catalogue reload')
+            try:
+                self.reload(f, projectsFile, targetsFile)
+            except Exception:
+                # the current projects are kept, the file is tried again at its next change
+                traceback.print_exc()
+            self.stamps[targetsFile] = stamp
+            reloaded.append(f)
+        return reloaded
+
+
+class BundleWatcher(Poller):
+    def __init__(self, directory, reload, current=None, interval=5.):
+        # reload(path): called with the latest bundle of directory once it is not current (the path loaded)
+        super().__init__(interval)
+        self.directory = directory
+        self.reload = reload
+        self.current = current
+
+    def check(self):
+        # the path of the bundle switched to, None if there is no newer bundle
+        path = latest_bundle(self.directory)
+        if path is None or path == self.current:
+            return None
+        count('bundle reload')
+        try:
+            self.reload(path)
+        except Exception:
+            # the current bundle is kept, a broken bundle is not tried again
+            traceback.print_exc()
+        self.current = path
+        return path
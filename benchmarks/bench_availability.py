@@ -0,0 +1,166 @@
+"""Benchmarks of the availability pipeline on synthetic catalogues
+
+    Times every stage (targets read, uptimes, projects cache write/read, the
+    season/pressure/up times/uber up figures) for each catalogue size and
+    season length, and writes the wall time, throughput and peak memory to a
+    json file that can be compared between runs:
+
+    python benchmarks/bench_availability.py --sizes 100,1000,10000,50000 --days 30,90,181,365 -o new.json
+    python benchmarks/bench_availability.py --compare old.json new.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from SourceAvailability_dasha import adaptive
+from SourceAvailability_dasha import make_availability as ma
+from SourceAvailability_dasha.synthetic import write_targets_csv
+
+
+def run_stage(results, key, name, nitems, func, trace):
+    # time one stage and record its throughput and peak memory
+    if trace:
+        tracemalloc.start()
+    t0 = time.perf_counter()
+    out = func()
+    dt = time.perf_counter() - t0
+    peak = None
+    if trace:
+        peak = tracemalloc.get_traced_memory()[1] / 1024. ** 2
+        tracemalloc.stop()
+    results.append(dict(key, stage=name, seconds=dt, items=nitems, throughput=nitems / dt if dt > 0 else None,
+                        peak_mb=peak, maxrss_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.))
+    print(f"{key['nsources']:>7d} sources {key['days']:>4d} days  {name:<24s} {dt:9.3f} s", file=sys.stderr)
+    return out
+
+
+def bench(nsources, days, args, workdir, results):
+    key = {'nsources': nsources, 'days': days}
+    nprojects = max(1, nsources // args.sources_per_project)
+    targetsFile = os.path.join(workdir, f'targets_{nsources}.csv')
+    if not os.path.isfile(targetsFile):
+        write_targets_csv(targetsFile, nsources, nprojects, galactic_fraction=args.galactic_fraction,
+                          seed=args.seed)
+    projectsFile = os.path.join(workdir, f'projects_{nsources}_{days}.pkl')
+    t0 = datetime.datetime.strptime(args.start, '%Y/%m/%d')
+    end = (t0 + datetime.timedelta(days=days)).strftime('%Y/%m/%d')
+
+    LMT = ma.getLMT()
+    # as in the app: the sources are computed on the full-day grid, the night window is a view of it
+    fullTime = ma.makeFullTime(args.start, end, args.nsubhours, debug=False)
+    # a new time grid, no table shares its positions yet
+    full = run_stage(results, key, 'makeContext', fullTime.size, lambda: ma.makeContext(LMT, fullTime), args.trace)
+    window = ma.nightWindow(" 03:00:0", args.nhours, args.nsubhours)
+    context = ma.windowContext(full, window)
+    astroTime = context.astroTime
+    day_names = [str(a)[:10] for a in astroTime[0, :]]
+
+    table = run_stage(results, key, 'readTargets', nsources, lambda: ma.readTargets(targetsFile, debug=False),
+                      args.trace)
+    run_stage(results, key, 'createUptimes', nsources, lambda: table.createUptimes(context), args.trace)
+    # up and LST hours derived from el for other elevation limits
+    run_stage(results, key, 'uptimes(limits)', nsources, lambda: table.uptimes((20., 85.), window=window),
+              args.trace)
+    run_stage(results, key, 'uptimes(avoid)', nsources,
+              lambda: table.uptimes(avoid={'sun': 45., 'moon': 10.}, window=window), args.trace)
+    # up intervals and LST hours refined to a minute from the uptimes grid
+    run_stage(results, key, 'upIntervals', nsources,
+              lambda: adaptive.lstHours(adaptive.upIntervals(table, context), context, table.npos), args.trace)
+    # the positions of the table are not shared once it is freed
+    table = None
+
+    # cold populate (computes and writes the cache) and warm populate (reads the cache)
+    if os.path.isfile(projectsFile):
+        os.remove(projectsFile)
+    run_stage(results, key, 'populateProjects(write)', nsources,
+              lambda: ma.populateProjects(context, projectsFile, targetsFile, debug=False), args.trace)
+    projects, sources = run_stage(results, key, 'populateProjects(read)', nsources,
+                                  lambda: ma.populateProjects(context, projectsFile, targetsFile, debug=False),
+                                  args.trace)
+    os.remove(projectsFile)
+
+    # last day of the window as in the app, leaves room for the last date tick
+    day_end = astroTime.shape[1] - 2
+    run_stage(results, key, 'createSeasonPlot', nsources,
+              lambda: ma.createSeasonPlot(context, day_names, projects, 0, day_end), args.trace)
+    prjs_dict = {'UM': 0.15, 'US': 0.15, 'MX': 0.7, 'TOT': 0.5}
+    run_stage(results, key, 'createPressurePlot', nsources,
+              lambda: ma.createPressurePlot(context, projects, ['A', 'B', 'C', 'D'], ['MX'], prjs_dict, 0,
+                                            day_end),
+              args.trace)
+    p = max(projects, key=lambda p: len(p.sourceList))
+    run_stage(results, key, 'plotUptimes', len(p.sourceList),
+              lambda: p.plotUptimes(context, day_names, day_end // 2, [0, len(p.sourceList)]), args.trace)
+    # uberUp computed again, not the one of the season plot
+    p._uberUps.clear()
+    run_stage(results, key, 'plotUberUp', len(p.sourceList),
+              lambda: p.plotUberUp(context, day_names, 0, day_end), args.trace)
+
+
+def compare(old, new):
+    # ratio new/old of the wall time of every common (nsources, days, stage)
+    def index(filename):
+        with open(filename) as fo:
+            return {(r['nsources'], r['days'], r['stage']): r for r in json.load(fo)['results']}
+
+    o = index(old)
+    n = index(new)
+    print(f"{'sources':>8s} {'days':>5s} {'stage':<24s} {'old [s]':>9s} {'new [s]':>9s} {'new/old':>8s}")
+    for k in sorted(set(o) & set(n)):
+        ratio = n[k]['seconds'] / o[k]['seconds'] if o[k]['seconds'] > 0 else float('nan')
+        print(f"{k[0]:>8d} {k[1]:>5d} {k[2]:<24s} {o[k]['seconds']:9.3f} {n[k]['seconds']:9.3f} {ratio:8.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='100,1000,10000,50000', help='numbers of sources')
+    parser.add_argument('--days', default='30,90,181,365', help='season lengths in days')
+    parser.add_argument('--start', default='2025/03/01', help='first day of the season')
+    parser.add_argument('--nhours', type=int, default=13)
+    parser.add_argument('--nsubhours', type=int, default=4)
+    parser.add_argument('--sources-per-project', type=int, default=10)
+    parser.add_argument('--galactic-fraction', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-memory', type=float, default=8., help='skip runs whose grids exceed this [GB]')
+    parser.add_argument('--no-trace', dest='trace', action='store_false', help='no tracemalloc peak memory')
+    parser.add_argument('--online', action='store_true', help='allow IERS downloads')
+    parser.add_argument('--workdir', default=None, help='where the synthetic catalogues are written')
+    parser.add_argument('-o', '--output', default='bench_results.json')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'))
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    ma.useOfflineIERS(not args.online)
+    workdir = args.workdir or tempfile.mkdtemp(prefix='sa_bench_')
+    os.makedirs(workdir, exist_ok=True)
+    results = []
+    for nsources in [int(x) for x in args.sizes.split(',')]:
+        for days in [int(x) for x in args.days.split(',')]:
+            # el and az grids of the full day, up grids of the night window
+            size = nsources * days * args.nsubhours * (24 * 16 + args.nhours) / 1024. ** 3
+            if size > args.max_memory:
+                print(f'skip {nsources} sources {days} days: {size:.1f} GB of grids', file=sys.stderr)
+                continue
+            bench(nsources, days, args, workdir, results)
+
+    meta = {'date': datetime.datetime.now().isoformat(), 'python': platform.python_version(),
+            'numpy': np.__version__, 'platform': platform.platform(), 'cpus': os.cpu_count(),
+            'nhours': args.nhours, 'nsubhours': args.nsubhours, 'trace': args.trace}
+    with open(args.output, 'w') as fo:
+        json.dump({'meta': meta, 'results': results}, fo, indent=1)
+    print('results written to', args.output, file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
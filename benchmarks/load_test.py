@@ -0,0 +1,346 @@
+"""Load test of the Dash app with concurrent virtual users
+
+    Writes synthetic catalogues and a config, starts the app with them (or
+    uses a server already running at --url), then replays the callback
+    sequences of observers from N concurrent virtual users for every
+    scenario: tab switches, rank toggles, source paging, date changes, or a
+    mix of them. A virtual user loads the layout and the callback graph like
+    the browser, fires the callbacks triggered by each action in dependency
+    order with the values of its own page, and polls the tab job until the
+    figure arrives. Reports the actions and requests per second, the latency
+    percentiles of the actions (until the figure) and of every callback, and
+    the peak memory of the server processes (needs psutil), in a json file:
+
+    python benchmarks/load_test.py --server 'dasha -s SourceAvailability_dasha.plot_uptimes' --users 1,4,16
+    python benchmarks/load_test.py --url http://127.0.0.1:8050 --pid 1234 --scenarios tabs,mixed -o load.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import shlex
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import requests
+import yaml
+
+from SourceAvailability_dasha.synthetic import write_targets_csv
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+files = ['UM', 'US', 'MX']
+tabs = ['pressure', 'season', 'upTimes', 'uberUp']
+ranks = ['A', 'B', 'C', 'D']
+quantiles = (0.5, 0.95, 0.99)
+
+
+def write_catalogues(workdir, nsources, days, args):
+    # synthetic targets files of every file label and the config of the app
+    filename_dict = {}
+    for i, f in enumerate(files):
+        filename_dict[f] = os.path.join(workdir, f'targets_{f}_{nsources}.csv')
+        write_targets_csv(filename_dict[f], nsources, max(1, nsources // args.sources_per_project), file_tag=f,
+                          seed=args.seed + i)
+    t0 = datetime.datetime.strptime(args.start, '%Y/%m/%d')
+    config = {
+        'date': {'semester': '2025-S1', 'start_date': args.start,
+                 'end_date': (t0 + datetime.timedelta(days=days)).strftime('%Y/%m/%d'),
+                 'nhours': args.nhours, 'nsubhours': args.nsubhours},
+        'project': {'filename_dict': filename_dict},
+        'iers': {'offline': not args.online},
+        'jobs': {'dir': os.path.join(workdir, 'jobs')},
+    }
+    config_file = os.path.join(workdir, 'config.yaml')
+    with open(config_file, 'w') as fo:
+        yaml.safe_dump(config, fo)
+    return config_file
+
+
+def start_server(command, config_file, url, timeout):
+    # the app with the synthetic config, once it answers
+    env = dict(os.environ, SOURCE_CONFIG_PATH=config_file)
+    server = subprocess.Popen(shlex.split(command), env=env)
+    t0 = time.time()
+    while time.time() - t0 < timeout:
+        if server.poll() is not None:
+            raise RuntimeError(f'server exited with {server.returncode}')
+        try:
+            if requests.get(url + '/_dash-layout', timeout=5).ok:
+                return server
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.5)
+    server.terminate()
+    raise RuntimeError(f'server not answering at {url} after {timeout} s')
+
+
+def layout_props(node, props):
+    # 'id.property': value of every component with an id in the layout json
+    if isinstance(node, list):
+        for n in node:
+            layout_props(n, props)
+    elif isinstance(node, dict) and 'props' in node:
+        p = node['props']
+        if isinstance(p.get('id'), str):
+            for k, v in p.items():
+                if k != 'id':
+                    props[f"{p['id']}.{k}"] = v
+        layout_props(p.get('children'), props)
+    return props
+
+
+def callback_outputs(output):
+    # 'id.prop' of the outputs of a callback: 'id.prop' or '..id.prop...id.prop..'
+    if output.startswith('..'):
+        return output[2:-2].split('...')
+    return [output]
+
+
+class VirtualUser:
+    def __init__(self, url, think, stats, rng):
+        self.url = url
+        self.think = think
+        self.stats = stats
+        self.rng = rng
+        self.session = requests.Session()
+        self.props = {}
+        self.callbacks = []
+
+    def request(self, method, path, name, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            r = self.session.request(method, self.url + path, timeout=120, **kwargs)
+            ok = r.status_code in (200, 204)
+        except requests.RequestException:
+            r, ok = None, False
+        self.stats.record('request', name, time.perf_counter() - t0, ok)
+        return r if ok else None
+
+    def load(self):
+        # the page, its layout and the callback graph, then the callbacks of the initial load
+        self.request('GET', '/', 'page')
+        layout = self.request('GET', '/_dash-layout', 'layout')
+        dependencies = self.request('GET', '/_dash-dependencies', 'dependencies')
+        if layout is None or dependencies is None:
+            return False
+        self.props = layout_props(layout.json(), {})
+        self.callbacks = [dict(c, outputs=callback_outputs(c['output'])) for c in dependencies.json()
+                          if not c.get('clientside_function')]
+        self.propagate(None)
+        return True
+
+    def fire(self, callback, changed):
+        def values(items):
+            return [dict(id=i['id'], property=i['property'], value=self.props.get(f"{i['id']}.{i['property']}"))
+                    for i in items]
+
+        outputs = [dict(zip(('id', 'property'), o.rsplit('.', 1))) for o in callback['outputs']]
+        body = {'output': callback['output'], 'outputs': outputs if len(outputs) > 1 else outputs[0],
+                'inputs': values(callback['inputs']), 'state': values(callback['state']),
+                'changedPropIds': sorted(changed)}
+        r = self.request('POST', '/_dash-update-component', callback['outputs'][0], json=body)
+        if r is None or r.status_code == 204:
+            return set()
+        updated = set()
+        for id, props in r.json().get('response', {}).items():
+            for k, v in props.items():
+                self.props[f'{id}.{k}'] = v
+                updated.add(f'{id}.{k}')
+        return updated
+
+    def propagate(self, changed):
+        # fire the callbacks with a changed input (all of them if changed is None) in dependency order,
+        # a callback waits for the pending callbacks that output one of its inputs
+        def inputs(c):
+            return {f"{i['id']}.{i['property']}" for i in c['inputs']}
+
+        pending = list(self.callbacks) if changed is None else [c for c in self.callbacks if inputs(c) & changed]
+        changed = set() if changed is None else set(changed)
+        while pending:
+            blocked = {o for c in pending for o in c['outputs']}
+            ready = [c for c in pending if not inputs(c) & blocked] or pending[:1]
+            c = ready[0]
+            pending.remove(c)
+            updated = self.fire(c, inputs(c) & changed)
+            changed |= updated
+            pending += [d for d in self.callbacks if d not in pending and inputs(d) & updated]
+
+    def wait_figure(self):
+        # poll the tab job like the dcc.Interval until the figure (or the failure) is shown
+        while self.props.get('job-poll.disabled') is False:
+            time.sleep(self.props.get('job-poll.interval', 500) / 1000.)
+            self.props['job-poll.n_intervals'] = (self.props.get('job-poll.n_intervals') or 0) + 1
+            self.propagate({'job-poll.n_intervals'})
+        content = self.props.get('tab-content.children')
+        return not (isinstance(content, dict) and content.get('type') == 'Pre')
+
+    def act(self, name, changes):
+        # one user action: the property changes, the triggered callbacks and the figure
+        t0 = time.perf_counter()
+        self.props.update(changes)
+        self.propagate(set(changes))
+        ok = self.wait_figure()
+        self.stats.record('action', name, time.perf_counter() - t0, ok)
+
+    # the actions of the scenarios, the property changes of the browser
+    def tabs(self):
+        at = self.props.get('tabs.active_tab', tabs[0])
+        return {'tabs.active_tab': tabs[(tabs.index(at) + 1) % len(tabs)] if at in tabs else tabs[0]}
+
+    def ranks(self):
+        selected = set(self.props.get('rank-list-input.value') or [])
+        selected ^= {self.rng.choice(ranks)}
+        return {'rank-list-input.value': [r for r in ranks if r in selected] or ['A']}
+
+    def paging(self):
+        button = self.rng.choice(['btn-next', 'btn-prev', 'btn-all'])
+        changes = {f'{button}.n_clicks': (self.props.get(f'{button}.n_clicks') or 0) + 1}
+        if self.props.get('tabs.active_tab') != 'upTimes':
+            changes['tabs.active_tab'] = 'upTimes'
+        return changes
+
+    def dates(self):
+        ndays = len(self.props.get('start_day.options') or []) or 2
+        start = self.rng.randrange(0, ndays - 1)
+        return {'start_day.value': str(start), 'end_day.value': str(self.rng.randrange(start + 1, ndays))}
+
+    def mixed(self):
+        return getattr(self, self.rng.choice(['tabs', 'tabs', 'ranks', 'paging', 'dates']))()
+
+    def run(self, scenario, stop):
+        if not self.load():
+            return
+        self.wait_figure()
+        while not stop.is_set():
+            self.act(scenario, getattr(self, scenario)())
+            stop.wait(self.rng.expovariate(1. / self.think) if self.think > 0 else 0)
+
+
+class Stats:
+    def __init__(self):
+        self.samples = {}  # (kind, name): [seconds]
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, kind, name, seconds, ok):
+        with self._lock:
+            self.samples.setdefault((kind, name), []).append(seconds)
+            if not ok:
+                self.errors[kind, name] = self.errors.get((kind, name), 0) + 1
+
+
+def server_memory(pids):
+    # resident memory [MB] of the server processes and their children
+    rss = 0
+    for pid in pids:
+        try:
+            p = psutil.Process(pid)
+            rss += sum(q.memory_info().rss for q in [p] + p.children(recursive=True))
+        except psutil.Error:
+            pass
+    return rss / 1024. ** 2
+
+
+def run_scenario(scenario, nusers, args, pids):
+    stats = Stats()
+    stop = threading.Event()
+    rng = random.Random(args.seed)
+    users = [VirtualUser(args.url, args.think, stats, random.Random(rng.random())) for i in range(nusers)]
+    threads = [threading.Thread(target=u.run, args=(scenario, stop), daemon=True) for u in users]
+    peak = 0.
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    while time.perf_counter() - t0 < args.duration:
+        if psutil is not None and pids:
+            peak = max(peak, server_memory(pids))
+        time.sleep(0.5)
+    stop.set()
+    for t in threads:
+        t.join()
+    dt = time.perf_counter() - t0
+
+    results = []
+    for (kind, name), samples in sorted(stats.samples.items()):
+        q = np.quantile(samples, quantiles)
+        results.append({'scenario': scenario, 'users': nusers, 'kind': kind, 'name': name, 'count': len(samples),
+                        'errors': stats.errors.get((kind, name), 0), 'per_second': len(samples) / dt,
+                        'p50': q[0], 'p95': q[1], 'p99': q[2], 'server_mb': peak if psutil and pids else None})
+    actions = [r for r in results if r['kind'] == 'action']
+    calls = [r for r in results if r['kind'] == 'request']
+    print(f"{scenario:<8s} {nusers:>4d} users  {sum(r['per_second'] for r in actions):7.2f} actions/s "
+          f"{sum(r['per_second'] for r in calls):8.1f} requests/s  "
+          f"p50 {actions[0]['p50'] if actions else float('nan'):6.2f} s "
+          f"p95 {actions[0]['p95'] if actions else float('nan'):6.2f} s  "
+          f"errors {sum(r['errors'] for r in results)}  server {peak:7.1f} MB", file=sys.stderr)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8050', help='url of the app')
+    parser.add_argument('--server', default=None,
+                        help='command starting the app at --url, run with the synthetic config '
+                             '(default: use the server already running at --url)')
+    parser.add_argument('--pid', type=int, action='append', default=[],
+                        help='process id of a server already running, for its memory')
+    parser.add_argument('--scenarios', default='tabs,ranks,paging,dates,mixed')
+    parser.add_argument('--users', default='1,4,16', help='numbers of concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=30., help='seconds per scenario and number of users')
+    parser.add_argument('--think', type=float, default=1., help='mean time between the actions of a user [s]')
+    parser.add_argument('--sources', type=int, default=1000, help='sources per file of the synthetic catalogues')
+    parser.add_argument('--days', type=int, default=30, help='season length in days')
+    parser.add_argument('--start', default='2025/03/01', help='first day of the season')
+    parser.add_argument('--nhours', type=int, default=13)
+    parser.add_argument('--nsubhours', type=int, default=4)
+    parser.add_argument('--sources-per-project', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--online', action='store_true', help='allow IERS downloads')
+    parser.add_argument('--startup-timeout', type=float, default=600.)
+    parser.add_argument('--workdir', default=None, help='where the synthetic catalogues are written')
+    parser.add_argument('-o', '--output', default='load_results.json')
+    args = parser.parse_args(argv)
+    args.url = args.url.rstrip('/')
+
+    server = None
+    pids = list(args.pid)
+    if args.server:
+        workdir = args.workdir or tempfile.mkdtemp(prefix='sa_load_')
+        os.makedirs(workdir, exist_ok=True)
+        config_file = write_catalogues(workdir, args.sources, args.days, args)
+        server = start_server(args.server, config_file, args.url, args.startup_timeout)
+        pids.append(server.pid)
+    try:
+        # the projects are loaded (and the caches warm) before the first measure
+        warmup = VirtualUser(args.url, 0., Stats(), random.Random(args.seed))
+        if not warmup.load() or not warmup.wait_figure():
+            print('warm up failed', file=sys.stderr)
+        results = []
+        for scenario in args.scenarios.split(','):
+            for nusers in [int(x) for x in args.users.split(',')]:
+                results += run_scenario(scenario, nusers, args, pids)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    meta = {'date': datetime.datetime.now().isoformat(), 'python': platform.python_version(),
+            'platform': platform.platform(), 'cpus': os.cpu_count(), 'url': args.url, 'server': args.server,
+            'sources': args.sources, 'days': args.days, 'duration': args.duration, 'think': args.think}
+    with open(args.output, 'w') as fo:
+        json.dump({'meta': meta, 'results': results}, fo, indent=1)
+    print('results written to', args.output, file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,14 @@
-from setuptools import setup
-
-setup(name='SourceAvailability_dasha',
-      version='0.1',
-      description='',
-      url='http://to.be.set',
-      author='Xia Huang',
-      author_email='xiahuang@umass.edu',
-      license='BSD-3',
-      packages=['SourceAvailability_dasha'],
-      zip_safe=False)
+from setuptools import setup
+
+setup(name='SourceAvailability_dasha',
+      version='0.1',
+      description='',
+      url='http://to.be.set',
+      author='Xia Huang',
+      author_email='xiahuang@umass.edu',
+      license='BSD-3',
+      packages=['SourceAvailability_dasha'],
+      entry_points={'console_scripts': ['source_availability_batch=SourceAvailability_dasha.batch:main',
+                                      'source_availability_export=SourceAvailability_dasha.export:main',
+                                      'source_availability_bundle=SourceAvailability_dasha.bundle:main']},
+      zip_safe=False)
@@ -0,0 +1,53 @@
+"""Fixtures of the tests: synthetic catalogues (see synthetic) on a few nights of
+    a coarse time grid, with the IERS tables bundled with astropy"""
+import pytest
+
+from SourceAvailability_dasha.config import avoidance_radii, data_version, default_limits, time_grid
+from SourceAvailability_dasha.make_availability import makeProjects, readTargets
+from SourceAvailability_dasha.synthetic import write_targets_csv
+
+test_config = {
+    'date': {'semester': '2025-S1', 'start_date': '2025/03/01', 'end_date': '2025/03/05', 'nhours': 10,
+             'nsubhours': 2},
+    'iers': {'offline': True},
+}
+
+
+@pytest.fixture(scope='session')
+def config():
+    return test_config
+
+
+@pytest.fixture(scope='session')
+def context(config):
+    # the night window of the config on its full-day grid
+    return time_grid(config)
+
+
+@pytest.fixture(scope='session')
+def projects_by_file(tmp_path_factory, context):
+    # {file: projects} of two small catalogues, their up times computed
+    directory = tmp_path_factory.mktemp('targets')
+    projects_by_file = {}
+    for f, nsources, nprojects, seed in (('UM', 12, 4, 1), ('MX', 30, 8, 2)):
+        targetsFile = str(directory / (f + '.csv'))
+        write_targets_csv(targetsFile, nsources, nprojects, file_tag=f, seed=seed)
+        table = readTargets(targetsFile, debug=False)
+        table.createUptimes(context)
+        projects_by_file[f] = makeProjects(table)
+    return projects_by_file
+
+
+@pytest.fixture
+def state(config, context, projects_by_file):
+    # the app state read by the api routes (see plot_uptimes.project_state)
+    return {
+        'config': config,
+        'context': context,
+        'day_names': [str(a)[:10] for a in context.astroTime[0, :]],
+        'limits': default_limits(config),
+        'avoid': avoidance_radii(config),
+        'window': context.window,
+        'data_version': data_version(config, []),
+        'projects_by_file': projects_by_file,
+    }
@@ -0,0 +1,52 @@
+"""The read-only api routes: json rows, 304 on a matching ETag, 400 on a bad query"""
+import pytest
+from flask import Flask
+
+from SourceAvailability_dasha import api
+
+
+@pytest.fixture
+def client(state):
+    app = Flask('test_api')
+    api.register(app, lambda: state)
+    return app.test_client()
+
+
+@pytest.mark.parametrize('path', ['/api/sources', '/api/projects', '/api/intervals'])
+def test_rows(client, state, path):
+    r = client.get(path + '?files=UM&ranks=A,B,C,D&start=1&end=2')
+    assert r.status_code == 200
+    data = r.get_json()
+    assert data['version'] == state['data_version']
+    assert data['rows']
+    assert {row['file'] for row in data['rows']} == {'UM'}
+    assert r.headers['ETag']
+
+
+def test_source_rows(client, state):
+    rows = client.get('/api/sources?files=MX&start=0&end=0').get_json()['rows']
+    assert len(rows) == sum(len(p.rows) for p in state['projects_by_file']['MX'])
+    for row in rows:
+        assert row['up_hours'] == pytest.approx(sum(row['lst_hours']))
+        assert 0. <= row['fractions'][0] <= 1.
+
+
+def test_not_modified(client, state):
+    r = client.get('/api/sources?files=UM&start=1&end=2')
+    tag = r.headers['ETag']
+    # the same query, the arguments in another order
+    r2 = client.get('/api/sources?end=2&start=1&files=UM', headers={'If-None-Match': tag})
+    assert r2.status_code == 304
+    assert not r2.data
+    # another query, or the same one once the data changed
+    assert client.get('/api/sources?files=UM&start=1&end=3', headers={'If-None-Match': tag}).status_code == 200
+    state['data_version'] = 'changed'
+    assert client.get('/api/sources?files=UM&start=1&end=2', headers={'If-None-Match': tag}).status_code == 200
+
+
+@pytest.mark.parametrize('query', ['start=xx', 'end=99', 'start=2&end=1', 'sun=abc', 'ut_start=25', 'hours=0',
+                                   'hours=0.1'])
+def test_bad_query(client, query):
+    r = client.get('/api/sources?' + query)
+    assert r.status_code == 400
+    assert r.get_json()['error']
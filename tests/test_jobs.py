@@ -0,0 +1,101 @@
+"""JobQueue: submit, join, cancel and run of the jobs, without worker threads"""
+import os
+import stat
+
+import pytest
+
+from SourceAvailability_dasha import jobs
+
+
+@jobs.register('test add')
+def add(progress, a, b):
+    progress(1, 2, 'adding')
+    return a + b
+
+
+@jobs.register('test fail')
+def fail(progress):
+    raise ValueError('bad input')
+
+
+@pytest.fixture
+def queue(tmp_path):
+    # the jobs run in the test by run_next
+    return jobs.JobQueue(str(tmp_path / 'jobs'), workers=0)
+
+
+def run_next(queue):
+    job = queue.claim()
+    assert job is not None
+    queue.run(*job)
+    return job[0]
+
+
+def waiters(queue, key):
+    return queue.db().execute('select waiters from jobs where key=?', (key,)).fetchone()[0]
+
+
+def test_submit_joins_the_same_job(queue):
+    key = queue.submit('test add', 1, 2)
+    assert queue.status(key)['status'] == 'queued'
+    assert queue.submit('test add', 1, 2) == key
+    assert waiters(queue, key) == 2
+    assert queue.submit('test add', 1, 3) != key
+
+
+def test_held_job_is_not_counted_twice(queue):
+    key = queue.submit('test add', 1, 2)
+    assert queue.submit('test add', 1, 2, held=key) == key
+    assert waiters(queue, key) == 1
+
+
+def test_cancel_once_nobody_waits(queue):
+    key = queue.submit('test add', 1, 2)
+    queue.submit('test add', 1, 2)
+    queue.cancel(key)
+    assert queue.status(key)['status'] == 'queued'
+    queue.cancel(key)
+    assert queue.status(key)['status'] == 'cancelled'
+    assert queue.claim() is None
+    # submitted again, the job is queued again
+    queue.submit('test add', 1, 2)
+    assert queue.status(key)['status'] == 'queued'
+
+
+def test_run(queue):
+    key = queue.submit('test add', 1, 2)
+    assert run_next(queue) == key
+    assert queue.status(key)['status'] == 'done'
+    assert queue.result(key) == 3
+    # a finished job is joined, not computed again
+    assert queue.submit('test add', 1, 2) == key
+    assert queue.claim() is None
+
+
+def test_failed_job(queue):
+    key = queue.submit('test fail')
+    run_next(queue)
+    status = queue.status(key)
+    assert status['status'] == 'failed'
+    assert 'bad input' in status['message']
+    with pytest.raises(KeyError):
+        queue.result(key)
+
+
+def test_cancelled_while_running(queue):
+    key = queue.submit('test add', 1, 2)
+    job = queue.claim()
+    queue.cancel(key)
+    queue.run(*job)
+    assert queue.status(key)['status'] == 'cancelled'
+
+
+def test_private_directory(tmp_path):
+    directory = tmp_path / 'jobs'
+    jobs.JobQueue(str(directory), workers=0)
+    assert stat.S_IMODE(os.stat(directory).st_mode) == 0o700
+    shared = tmp_path / 'shared'
+    shared.mkdir()
+    os.chmod(shared, 0o777)
+    with pytest.raises(RuntimeError):
+        jobs.JobQueue(str(shared), workers=0)
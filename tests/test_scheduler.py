@@ -0,0 +1,50 @@
+"""scheduleSources: the allocated cells do not overlap, are up for their source and
+    respect the share of every file"""
+import numpy as np
+import pytest
+
+from SourceAvailability_dasha.config import prjs_dict
+from SourceAvailability_dasha.scheduler import scheduleSources, scheduleSummary
+
+ranks = ['A', 'B', 'C', 'D']
+
+
+def check(schedule, context, day_start=0, limits=None, avoid=None):
+    owner = schedule.owner.ravel()
+    assert schedule.owner.shape[0] == context.astroTime.shape[0]
+    # one owner per cell, every source gets all its cells or none
+    assert np.array_equal(np.bincount(owner[owner >= 0], minlength=len(schedule.sources)), schedule.cells)
+    assert np.all((schedule.cells == 0) | (schedule.cells == schedule.needed))
+    # only where the source is up
+    for i in np.flatnonzero(schedule.cells):
+        up, lstup = schedule.sources[i].uptimes(limits, avoid, context.window)
+        assert up[:, day_start:day_start + schedule.owner.shape[1]].ravel()[owner == i].all()
+    # the share of every file
+    for f in np.unique(schedule.files):
+        assert schedule.cells[schedule.files == f].sum() <= int(prjs_dict[f] * owner.size)
+        assert schedule.quota[f] >= 0
+
+
+@pytest.mark.parametrize('localSearch', [False, True])
+def test_schedule(context, projects_by_file, localSearch):
+    ndays = context.astroTime.shape[1]
+    schedule = scheduleSources(context, projects_by_file, ranks, 0, ndays - 1, prjs_dict, localSearch=localSearch)
+    check(schedule, context)
+    assert len(schedule.sources) == sum(len(p.rows) for projects in projects_by_file.values() for p in projects)
+    assert schedule.cells.any()
+    assert len(scheduleSummary(schedule)) == sum(len(projects) for projects in projects_by_file.values())
+
+
+def test_local_search_places_more(context, projects_by_file):
+    greedy = scheduleSources(context, projects_by_file, ranks, 0, 2, prjs_dict, localSearch=False)
+    improved = scheduleSources(context, projects_by_file, ranks, 0, 2, prjs_dict)
+    check(improved, context)
+    assert (improved.cells > 0).sum() >= (greedy.cells > 0).sum()
+
+
+def test_limits_and_ranks(context, projects_by_file):
+    limits, avoid = (45., 75.), {'sun': 30.}
+    schedule = scheduleSources(context, projects_by_file, ['A', 'B'], 1, 3, prjs_dict, limits, avoid)
+    check(schedule, context, 1, limits, avoid)
+    assert schedule.owner.shape[1] == 3
+    assert {str(s.rank) for s in schedule.sources} <= {'A', 'B'}
@@ -0,0 +1,56 @@
+"""TileCache: a date range overlapping the days already computed reads them from the tiles"""
+import weakref
+
+import numpy as np
+
+from SourceAvailability_dasha import make_availability as ma
+from SourceAvailability_dasha.synthetic import write_targets_csv
+from SourceAvailability_dasha.tiles import TileCache
+
+
+def computed(monkeypatch, context, targetsFile):
+    # a table of the targets on context, nothing shared with the tables computed before
+    monkeypatch.setattr(ma, '_gridCaches', weakref.WeakValueDictionary())
+    table = ma.readTargets(targetsFile, debug=False)
+    table.createUptimes(context)
+    return table
+
+
+def test_shifted_date_range(tmp_path, monkeypatch, context):
+    # context: the time grids use its IERS tables
+    targetsFile = str(tmp_path / 'targets.csv')
+    write_targets_csv(targetsFile, 20, 5, seed=3)
+    tiles = TileCache(str(tmp_path / 'tiles'))
+    LMT = ma.getLMT()
+    first = ma.makeContext(LMT, ma.makeAstroTime('2025/03/01', '2025/03/04', 3, 2, ut0=' 04:00:0', debug=False),
+                           tiles)
+    shifted = ma.makeContext(LMT, ma.makeAstroTime('2025/02/27', '2025/03/06', 3, 2, ut0=' 04:00:0', debug=False),
+                             tiles)
+    table = computed(monkeypatch, first, targetsFile)
+    keys = [table.posKey(p) for p in range(table.npos)]
+
+    # the days of the first range are found, the others are not
+    az, el, found = tiles.read(shifted, keys)
+    days = np.isin(tiles.dates(shifted), tiles.dates(first))
+    assert days.sum() == 3
+    assert np.array_equal(found, np.tile(days, (len(keys), 1)))
+    assert np.array_equal(el[:, :, days], table.el)
+    assert np.array_equal(az[:, :, days], table.az)
+
+    # the shifted range reads them and transforms the other days, as computed without tiles
+    withTiles = computed(monkeypatch, shifted, targetsFile)
+    without = computed(monkeypatch, shifted._replace(tiles=None), targetsFile)
+    assert np.abs(withTiles.el - without.el).max() < 1e-3
+    assert np.array_equal(withTiles.up, without.up)
+    assert tiles.read(shifted, keys)[2].all()
+
+
+def test_unknown_positions(tmp_path, context):
+    tiles = TileCache(str(tmp_path / 'tiles'))
+    keys = [(False, 10., 20.), (False, 30., 40.)]
+    nx, ny = context.astroTime.shape
+    az = np.ones((2, nx, 1))
+    tiles.write(context, keys[:1], [0], az, az * 45.)
+    az, el, found = tiles.read(context, keys)
+    assert found[0, 0] and not found[0, 1:].any() and not found[1].any()
+    assert np.all(el[0, :, 0] == 45.) and np.all(el[1] == 0.)